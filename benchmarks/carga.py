@@ -0,0 +1,596 @@
+"""Pruebas de carga reproducibles de la API contra PostgreSQL con un catálogo sintético.
+
+1. Base de datos: la de --dsn / DATABASE_URL o, con --pg-temporal, una
+   instancia local desechable de `pgserver` (pip install pgserver).
+2. Siembra: aplica las migraciones y genera con generate_series un catálogo
+   de --juegos juegos (1000, 100000, 1000000...) con consolas, accesorios,
+   compatibilidades, comparaciones e historial proporcionales. Los datos sólo
+   dependen de los tamaños, así que dos ejecuciones con los mismos parámetros
+   miden lo mismo. --sin-sembrar reutiliza lo que ya haya en la base.
+3. Carga: arranca la aplicación con uvicorn en un subproceso y, para cada
+   escenario, mantiene --clientes peticiones concurrentes durante --duracion
+   segundos (tras --calentamiento segundos que no cuentan).
+4. Resultado en JSON: por escenario, peticiones, errores, peticiones/s,
+   latencias p50/p95/p99/máxima y memoria (RSS) del servidor al empezar, al
+   terminar y el pico. --comparar muestra la diferencia entre dos resultados.
+
+La siembra vacía las tablas del catálogo: con --dsn hay que confirmarlo con
+--recrear si la base ya tiene datos. Los escenarios de escritura crean,
+modifican y borran juegos (crear_juego_con_imagen deja siempre la misma
+imagen en static/uploads); --solo-lectura los omite.
+
+Uso:
+    python benchmarks/carga.py --pg-temporal --juegos 1000 --salida carga.json
+    python benchmarks/carga.py --dsn postgresql://... --recrear --juegos 100000 [--clientes 16] [--duracion 10]
+    python benchmarks/carga.py --dsn postgresql://... --sin-sembrar --escenarios buscar,ver_juego
+    python benchmarks/carga.py --comparar antes.json despues.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import httpx  # noqa: E402
+import psycopg2  # noqa: E402
+
+import historial  # noqa: E402
+import migraciones  # noqa: E402
+
+try:
+    import pgserver
+except ImportError:
+    pgserver = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+VERSION_FORMATO = 1
+
+# Vocabulario de los nombres generados; las búsquedas usan las mismas palabras
+PALABRAS = ["zelda", "mario", "kart", "leyenda", "galaxia", "sombra", "dragon", "fantasia",
+            "carreras", "futbol", "estrella", "castillo", "pirata", "ninja", "robot", "espacio"]
+GENEROS = ["Aventura", "Acción", "RPG", "Deportes", "Carreras", "Plataformas", "Estrategia", "Puzle"]
+FABRICANTES = ["Nintendo", "Sony", "Microsoft", "Sega", "Atari", "Valve"]
+TIPOS_ACCESORIO = ["Mando", "Volante", "Auriculares", "Cámara", "Memoria", "Cargador"]
+
+# PNG de 1x1 por si no está Pillow
+PNG_MINIMO = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de"
+    "0000000c4944415408d763f8cfc0000003010100c9fe92ef0000000049454e44ae426082"
+)
+
+
+def _texto(lista: list, expresion: str) -> str:
+    """Elemento de `lista` elegido en SQL por `expresion` (entera, >= 0), con % escapado para psycopg2."""
+    valores = ",".join("'" + v.replace("'", "''") + "'" for v in lista)
+    return f"(ARRAY[{valores}])[({expresion}) %% {len(lista)} + 1]"
+
+
+# --- Base de datos ---
+
+def base_temporal(directorio: str) -> tuple:
+    """Arranca una instancia de PostgreSQL desechable; devuelve (dsn, servidor)."""
+    if pgserver is None:
+        raise SystemExit("--pg-temporal necesita pgserver (pip install pgserver)")
+    servidor = pgserver.get_server(directorio, cleanup_mode="delete")
+    return servidor.get_uri(), servidor
+
+
+def tamanos(juegos: int, consolas: int = None, accesorios: int = None) -> dict:
+    """Tamaños del catálogo: por defecto, consolas y accesorios crecen con los juegos, con mínimos."""
+    return {
+        "juegos": juegos,
+        "consolas": consolas or min(max(juegos // 2000, 20), 300),
+        "accesorios": accesorios or min(max(juegos // 200, 50), 3000),
+        "comparaciones": min(max(juegos // 100, 20), 5000),
+        "historial": min(max(juegos, 1000), 500000),
+    }
+
+
+def _con_datos(cursor) -> bool:
+    cursor.execute("SELECT to_regclass('juegos') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return False
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM juegos)")
+    return cursor.fetchone()[0]
+
+
+def sembrar(conn, tam: dict) -> dict:
+    """Vacía el catálogo y lo rellena con datos sintéticos; devuelve los segundos de cada paso."""
+    tiempos = {}
+
+    def paso(nombre: str, *sentencias):
+        inicio = time.perf_counter()
+        for sentencia in sentencias:
+            cursor.execute(sentencia, tam)
+        conn.commit()
+        tiempos[nombre] = round(time.perf_counter() - inicio, 3)
+        print(f"  {nombre}: {tiempos[nombre]} s", file=sys.stderr)
+
+    cursor = conn.cursor()
+    cursor.execute(
+        "TRUNCATE juegos, consolas, accesorios, compatibilidad, accesorio_consola, comparaciones, "
+        "comparacion_elementos, historial, imagenes RESTART IDENTITY CASCADE"
+    )
+    # Sin triggers (ni comprobaciones de claves foráneas) la siembra de 1M filas es mucho más rápida;
+    # no hay imágenes que contar y las comparaciones se crean ya obsoletas
+    try:
+        cursor.execute("SET session_replication_role = replica")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Se siembra con triggers (session_replication_role necesita superusuario): {e}", file=sys.stderr)
+        cursor.execute(
+            "TRUNCATE juegos, consolas, accesorios, compatibilidad, accesorio_consola, comparaciones, "
+            "comparacion_elementos, historial, imagenes RESTART IDENTITY CASCADE"
+        )
+    conn.commit()
+
+    paso("consolas", f"""
+        INSERT INTO consolas (nombre, fabricante, año_lanzamiento)
+        SELECT 'Consola ' || {_texto(PALABRAS, 'i')} || ' ' || i, {_texto(FABRICANTES, 'i')}, 1980 + i %% 45
+        FROM generate_series(1, %(consolas)s) i
+    """)
+    paso("accesorios", f"""
+        INSERT INTO accesorios (nombre, tipo)
+        SELECT {_texto(TIPOS_ACCESORIO, 'i')} || ' ' || {_texto(PALABRAS, 'i / 3')} || ' ' || i,
+               {_texto(TIPOS_ACCESORIO, 'i')}
+        FROM generate_series(1, %(accesorios)s) i
+    """)
+    paso("juegos", f"""
+        INSERT INTO juegos (nombre, genero, año, desarrollador, fecha_creacion, fecha_actualizacion)
+        SELECT initcap({_texto(PALABRAS, 'i')}) || ' ' || {_texto(PALABRAS, 'i / 16')} || ' ' || i,
+               {_texto(GENEROS, 'i / 7')}, 1985 + i %% 40, 'Estudio ' || (i %% 500),
+               now() - make_interval(secs => i), now() - make_interval(secs => i)
+        FROM generate_series(1, %(juegos)s) i
+    """)
+    # De 1 a 3 consolas por juego (distintas) y, en uno de cada cuatro pares, también un accesorio
+    paso("compatibilidad", """
+        INSERT INTO compatibilidad (juego_id, consola_id, accesorio_id)
+        SELECT i, (i * 7 + k * 13) %% %(consolas)s + 1,
+               CASE WHEN (i + k) %% 4 = 0 THEN (i * 11 + k) %% %(accesorios)s + 1 END
+        FROM generate_series(1, %(juegos)s) i, generate_series(0, 2) k
+        WHERE k <= i %% 3
+        ON CONFLICT DO NOTHING
+    """, """
+        INSERT INTO accesorio_consola (accesorio_id, consola_id)
+        SELECT a, (a * 5 + k * 17) %% %(consolas)s + 1
+        FROM generate_series(1, %(accesorios)s) a, generate_series(0, 3) k
+        WHERE k <= a %% 4
+        ON CONFLICT DO NOTHING
+    """)
+    paso("comparaciones", """
+        INSERT INTO comparaciones (nombre, juego_id, consola_id, fecha_creacion, obsoleta)
+        SELECT 'Comparación ' || c, (c * 37) %% %(juegos)s + 1, c %% %(consolas)s + 1,
+               now() - make_interval(mins => c), true
+        FROM generate_series(1, %(comparaciones)s) c
+    """, """
+        INSERT INTO comparacion_elementos (comparacion_id, posicion, tipo, entidad_id)
+        SELECT c, 0, 'juegos', (c * 37) %% %(juegos)s + 1 FROM generate_series(1, %(comparaciones)s) c
+        UNION ALL
+        SELECT c, 1, 'juegos', (c * 37 + 1) %% %(juegos)s + 1 FROM generate_series(1, %(comparaciones)s) c
+        UNION ALL
+        SELECT c, 2, 'consolas', c %% %(consolas)s + 1 FROM generate_series(1, %(comparaciones)s) c
+    """)
+
+    # El historial cubre los últimos seis meses: sus particiones tienen que existir antes
+    historial.asegurar_particiones(cursor, datetime.now(timezone.utc) - timedelta(days=190))
+    conn.commit()
+    paso("historial", f"""
+        INSERT INTO historial (accion, detalles, tipo_objeto, objeto_id, fecha)
+        SELECT {_texto(['Creación', 'Actualización', 'Eliminación', 'Búsqueda'], 'h')},
+               'Juego ' || (h %% %(juegos)s + 1) || ' modificado', 'juego', h %% %(juegos)s + 1,
+               now() - make_interval(secs => h * (15552000 / %(historial)s))
+        FROM generate_series(1, %(historial)s) h
+    """)
+    cursor.execute("RESET session_replication_role")
+    conn.commit()
+
+    inicio = time.perf_counter()
+    conn.autocommit = True
+    cursor.execute("VACUUM ANALYZE")
+    conn.autocommit = False
+    tiempos["vacuum_analyze"] = round(time.perf_counter() - inicio, 3)
+    cursor.close()
+    return tiempos
+
+
+def rangos(conn) -> dict:
+    """Id máximo de cada tabla, para que los escenarios elijan ids existentes."""
+    with conn.cursor() as cursor:
+        resultado = {}
+        for tabla in ("juegos", "consolas", "accesorios", "comparaciones"):
+            cursor.execute(f"SELECT coalesce(max(id), 0), count(*) FROM {tabla}")
+            maximo, total = cursor.fetchone()
+            resultado[tabla] = {"max_id": maximo, "filas": total}
+        cursor.execute("SELECT count(*) FROM compatibilidad")
+        resultado["compatibilidad"] = {"filas": cursor.fetchone()[0]}
+    conn.rollback()
+    return resultado
+
+
+# --- Servidor ---
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrancar_servidor(dsn: str, puerto: int, workers: int, entorno_extra: dict) -> subprocess.Popen:
+    entorno = {
+        **os.environ,
+        "DATABASE_URL": dsn,
+        "MIGRAR_AL_ARRANCAR": "0",
+        "PYTHONUNBUFFERED": "1",
+        **entorno_extra,
+    }
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=RAIZ, env=entorno
+    )
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise SystemExit(f"El servidor terminó al arrancar (código {proceso.returncode})")
+        try:
+            if httpx.get(f"http://127.0.0.1:{puerto}/api/estado/pool", timeout=1).status_code == 200:
+                return proceso
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proceso.terminate()
+    raise SystemExit("El servidor no respondió en 60 s")
+
+
+def parar_servidor(proceso: subprocess.Popen):
+    proceso.terminate()
+    try:
+        proceso.wait(15)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+        proceso.wait()
+
+
+def _procesos(pid: int) -> list:
+    """El proceso y todos sus descendientes (los workers de uvicorn), leyendo /proc."""
+    resultado, pendientes = [], [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        resultado.append(actual)
+        try:
+            for tarea in os.listdir(f"/proc/{actual}/task"):
+                with open(f"/proc/{actual}/task/{tarea}/children") as f:
+                    pendientes.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return resultado
+
+
+def memoria(pid: int, reiniciar_pico: bool = False):
+    """(RSS, pico de RSS) en MB de los procesos del servidor, o None si no hay /proc (sólo Linux)."""
+    rss = pico = 0
+    for p in _procesos(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                campos = dict(linea.split(":", 1) for linea in f if ":" in linea)
+            rss += int(campos["VmRSS"].split()[0])
+            pico += int(campos["VmHWM"].split()[0])
+            if reiniciar_pico:
+                with open(f"/proc/{p}/clear_refs", "w") as f:
+                    f.write("5")
+        except (OSError, KeyError, ValueError):
+            if p == pid:
+                return None
+    return round(rss / 1024, 1), round(pico / 1024, 1)
+
+
+# --- Escenarios ---
+
+def _imagen() -> bytes:
+    if Image is None:
+        return PNG_MINIMO
+    salida = io.BytesIO()
+    Image.new("RGB", (640, 480), (40, 90, 160)).save(salida, "PNG")
+    return salida.getvalue()
+
+
+def escenarios(r: dict) -> dict:
+    """Nombre -> función(aleatorio, estado) que devuelve los argumentos de la petición (método, url, opciones)."""
+    def id_de(tabla):
+        return lambda aleatorio: aleatorio.randint(1, max(r[tabla]["max_id"], 1))
+
+    juego, consola, accesorio = id_de("juegos"), id_de("consolas"), id_de("accesorios")
+    imagen = _imagen()
+
+    def formulario_juego(aleatorio):
+        return {
+            "nombre": f"Carga {aleatorio.choice(PALABRAS)} {aleatorio.random():.8f}",
+            "genero": aleatorio.choice(GENEROS),
+            "desarrollador": "Estudio carga",
+            "consolas": [str(consola(aleatorio)), str(consola(aleatorio))],
+        }
+
+    def eliminar_creado(aleatorio, estado):
+        creados = estado["creados"]
+        return ("DELETE", f"/api/juegos/{creados.pop()}", {}) if creados else None
+
+    return {
+        "inicio": lambda a, e: ("GET", "/", {}),
+        "inicio_por_nombre": lambda a, e: ("GET", "/?orden=nombre", {}),
+        "api_juegos": lambda a, e: ("GET", "/api/juegos", {}),
+        "api_juegos_por_nombre": lambda a, e: ("GET", "/api/juegos?orden=nombre&limite=200", {}),
+        "api_consolas": lambda a, e: ("GET", "/api/consolas", {}),
+        "api_accesorios": lambda a, e: ("GET", "/api/accesorios", {}),
+        "ver_juego": lambda a, e: ("GET", f"/api/juegos/{juego(a)}", {}),
+        "ver_consola": lambda a, e: ("GET", f"/api/consolas/{consola(a)}", {}),
+        "ver_accesorio": lambda a, e: ("GET", f"/api/accesorios/{accesorio(a)}", {}),
+        "fragmento_juego": lambda a, e: ("GET", f"/fragmentos/juegos/{juego(a)}", {}),
+        "fragmento_opciones": lambda a, e: ("GET", "/fragmentos/consolas/opciones", {}),
+        "buscar": lambda a, e: ("GET", "/api/buscar", {"params": {"q": a.choice(PALABRAS)}}),
+        "buscar_prefijo": lambda a, e: ("GET", "/api/buscar", {"params": {"q": a.choice(PALABRAS)[:3], "tipo": "juegos"}}),
+        "compatibilidad_juegos": lambda a, e: ("GET", "/api/compatibilidad/juegos", {"params": {"consola": consola(a)}}),
+        "compatibilidad_consolas": lambda a, e: ("GET", "/api/compatibilidad/consolas", {"params": {"juego": juego(a)}}),
+        "compatibilidad_accesorios": lambda a, e: (
+            "GET", "/api/compatibilidad/accesorios", {"params": {"consola": consola(a)}}
+        ),
+        "comparaciones": lambda a, e: ("GET", "/comparaciones", {}),
+        "api_comparaciones": lambda a, e: ("GET", "/api/comparaciones", {}),
+        "historial": lambda a, e: ("GET", "/api/historial", {"params": {"clave": "0000"}}),
+        "historial_filtrado": lambda a, e: (
+            "GET", "/api/historial", {"params": {"clave": "0000", "objeto_id": juego(a), "tipo_objeto": "juego"}}
+        ),
+        "exportar_historial": lambda a, e: (
+            "GET", "/api/historial/exportar", {"params": {"clave": "0000", "objeto_id": juego(a)}}
+        ),
+        "metricas": lambda a, e: ("GET", "/metrics", {}),
+        # Escritura: invalidan las cachés de las lecturas, por eso van al final
+        "crear_juego": lambda a, e: ("POST", "/api/juegos", {"data": formulario_juego(a)}),
+        "actualizar_juego": lambda a, e: ("PUT", f"/api/juegos/{juego(a)}", {"data": formulario_juego(a)}),
+        "crear_juego_con_imagen": lambda a, e: (
+            "POST", "/api/juegos", {"data": formulario_juego(a), "files": {"imagen": ("carga.png", imagen, "image/png")}}
+        ),
+        "eliminar_juego": eliminar_creado,
+    }
+
+
+ESCRITURA = {"crear_juego", "actualizar_juego", "crear_juego_con_imagen", "eliminar_juego"}
+
+
+def percentil(ordenadas: list, p: float):
+    if not ordenadas:
+        return None
+    return ordenadas[min(len(ordenadas) - 1, max(math.ceil(p / 100 * len(ordenadas)) - 1, 0))]
+
+
+async def _cliente(cliente, generar, aleatorio, estado, hasta: float, latencias: list, errores: dict):
+    while time.perf_counter() < hasta:
+        peticion = generar(aleatorio, estado)
+        if peticion is None:
+            return
+        metodo, url, opciones = peticion
+        inicio = time.perf_counter()
+        try:
+            respuesta = await cliente.request(metodo, url, **opciones)
+            await respuesta.aread()
+            codigo = str(respuesta.status_code)
+            if metodo == "POST" and respuesta.status_code == 201:
+                estado["creados"].append(respuesta.json()["id"])
+        except httpx.HTTPError as e:
+            codigo = type(e).__name__
+        duracion = time.perf_counter() - inicio
+        if codigo.startswith(("2", "3")):
+            latencias.append(duracion)
+        else:
+            errores[codigo] = errores.get(codigo, 0) + 1
+
+
+async def ejecutar(base_url: str, nombre: str, generar, args, estado: dict, pid: int) -> dict:
+    limites = httpx.Limits(max_connections=args.clientes, max_keepalive_connections=args.clientes)
+    async with httpx.AsyncClient(base_url=base_url, limits=limites, timeout=60,
+                                 headers={"Accept-Encoding": "gzip"}) as cliente:
+        # Una semilla por escenario y cliente: cada ejecución pide las mismas urls en el mismo orden
+        aleatorios = [random.Random(f"{args.semilla}:{nombre}:{i}") for i in range(args.clientes)]
+        if args.calentamiento > 0:
+            hasta = time.perf_counter() + args.calentamiento
+            await asyncio.gather(*(
+                _cliente(cliente, generar, a, estado, hasta, [], {}) for a in aleatorios
+            ))
+        inicial = memoria(pid, reiniciar_pico=True)
+        latencias, errores = [], {}
+        inicio = time.perf_counter()
+        await asyncio.gather(*(
+            _cliente(cliente, generar, a, estado, inicio + args.duracion, latencias, errores) for a in aleatorios
+        ))
+        transcurrido = time.perf_counter() - inicio
+        final = memoria(pid)
+
+    latencias.sort()
+    total_errores = sum(errores.values())
+    ms = lambda v: None if v is None else round(v * 1000, 2)  # noqa: E731
+    return {
+        "peticiones": len(latencias) + total_errores,
+        "errores": total_errores,
+        "errores_por_tipo": errores,
+        "segundos": round(transcurrido, 3),
+        "peticiones_por_segundo": round(len(latencias) / transcurrido, 1) if transcurrido else 0,
+        "latencia_ms": {
+            "media": ms(sum(latencias) / len(latencias)) if latencias else None,
+            "p50": ms(percentil(latencias, 50)),
+            "p95": ms(percentil(latencias, 95)),
+            "p99": ms(percentil(latencias, 99)),
+            "max": ms(latencias[-1] if latencias else None),
+        },
+        "memoria_mb": None if inicial is None or final is None else {
+            "rss_inicio": inicial[0], "rss_fin": final[0], "rss_pico": final[1],
+        },
+    }
+
+
+# --- Resultados ---
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=RAIZ, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(ruta_antes: str, ruta_despues: str):
+    with open(ruta_antes, encoding="utf-8") as f:
+        antes = json.load(f)
+    with open(ruta_despues, encoding="utf-8") as f:
+        despues = json.load(f)
+
+    def cambio(a, d):
+        if a is None or d is None:
+            return "-"
+        return f"{(d - a) / a * 100:+.1f}%" if a else "-"
+
+    print(f"antes:   {antes['fecha']} {antes.get('commit') or ''} {antes['parametros']}")
+    print(f"después: {despues['fecha']} {despues.get('commit') or ''} {despues['parametros']}")
+    print(f"{'escenario':<28}" + "".join(f"{c:>28}" for c in ("pet/s", "p50 ms", "p95 ms", "p99 ms", "rss pico MB")))
+    for nombre, d in despues["escenarios"].items():
+        a = antes["escenarios"].get(nombre)
+        if a is None:
+            print(f"{nombre:<28}(sólo en el segundo)")
+            continue
+        columnas = [(a["peticiones_por_segundo"], d["peticiones_por_segundo"])]
+        columnas += [(a["latencia_ms"][p], d["latencia_ms"][p]) for p in ("p50", "p95", "p99")]
+        columnas.append(((a["memoria_mb"] or {}).get("rss_pico"), (d["memoria_mb"] or {}).get("rss_pico")))
+        print(f"{nombre:<28}" + "".join(f"{f'{va} → {vd} ({cambio(va, vd)})':>28}" for va, vd in columnas))
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Pruebas de carga de la API con un catálogo sintético")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--pg-temporal", action="store_true", help="usar una instancia desechable de pgserver")
+    parser.add_argument("--recrear", action="store_true", help="vaciar el catálogo aunque ya tenga datos")
+    parser.add_argument("--sin-sembrar", action="store_true", help="usar los datos que ya haya en la base")
+    parser.add_argument("--juegos", type=int, default=1000)
+    parser.add_argument("--consolas", type=int)
+    parser.add_argument("--accesorios", type=int)
+    parser.add_argument("--clientes", type=int, default=16)
+    parser.add_argument("--duracion", type=float, default=10)
+    parser.add_argument("--calentamiento", type=float, default=2)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--escenarios", help="lista separada por comas (por defecto, todos)")
+    parser.add_argument("--solo-lectura", action="store_true")
+    parser.add_argument("--semilla", default="carga")
+    parser.add_argument("--salida", help="archivo JSON de resultados (por defecto, la salida estándar)")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DESPUES"))
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return 0
+
+    todos = escenarios({t: {"max_id": 1} for t in ("juegos", "consolas", "accesorios")})
+    elegidos = args.escenarios.split(",") if args.escenarios else list(todos)
+    desconocidos = [e for e in elegidos if e not in todos]
+    if desconocidos:
+        parser.error(f"escenarios desconocidos: {', '.join(desconocidos)} (hay: {', '.join(todos)})")
+    if args.solo_lectura:
+        elegidos = [e for e in elegidos if e not in ESCRITURA]
+
+    servidor_pg = directorio_pg = None
+    if args.pg_temporal:
+        directorio_pg = tempfile.mkdtemp(prefix="carga_pg_")
+        args.dsn, servidor_pg = base_temporal(directorio_pg)
+    elif not args.dsn:
+        parser.error("indica --dsn, DATABASE_URL o --pg-temporal")
+
+    try:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            migraciones.migrar(conn, salida=lambda _: None)
+            tam = tamanos(args.juegos, args.consolas, args.accesorios)
+            siembra = None
+            if not args.sin_sembrar:
+                with conn.cursor() as cursor:
+                    con_datos = _con_datos(cursor)
+                conn.rollback()
+                if con_datos and not args.recrear and not args.pg_temporal:
+                    parser.error("la base ya tiene datos: usa --recrear para vaciarla o --sin-sembrar")
+                print(f"Sembrando {tam}...", file=sys.stderr)
+                siembra = sembrar(conn, tam)
+            r = rangos(conn)
+            with conn.cursor() as cursor:
+                cursor.execute("SHOW server_version")
+                version_pg = cursor.fetchone()[0]
+            conn.rollback()
+        finally:
+            conn.close()
+
+        puerto = _puerto_libre()
+        # La carga mide la API: sin mantenimiento periódico ni flujo de cambios durante las pruebas
+        proceso = arrancar_servidor(args.dsn, puerto, args.workers, {
+            "CAMBIOS_TIEMPO_REAL": "0",
+            "HISTORIAL_MANTENIMIENTO": str(10 ** 9),
+            "SUBIDAS_GC_INTERVALO": str(10 ** 9),
+        })
+        try:
+            resultados = {}
+            generadores = escenarios(r)
+            estado = {"creados": []}
+            for nombre in elegidos:
+                print(f"{nombre}...", file=sys.stderr)
+                resultados[nombre] = asyncio.run(ejecutar(
+                    f"http://127.0.0.1:{puerto}", nombre, generadores[nombre], args, estado, proceso.pid
+                ))
+                resultado = resultados[nombre]
+                print(f"  {resultado['peticiones_por_segundo']} pet/s, p95 {resultado['latencia_ms']['p95']} ms, "
+                      f"{resultado['errores']} errores", file=sys.stderr)
+        finally:
+            parar_servidor(proceso)
+    finally:
+        if servidor_pg is not None:
+            servidor_pg.cleanup()
+            shutil.rmtree(directorio_pg, ignore_errors=True)
+
+    informe = {
+        "formato": VERSION_FORMATO,
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "postgresql": version_pg,
+        },
+        "parametros": {
+            "juegos": args.juegos, "clientes": args.clientes, "duracion": args.duracion,
+            "calentamiento": args.calentamiento, "workers": args.workers, "semilla": args.semilla,
+        },
+        "datos": r,
+        "siembra_segundos": siembra,
+        "escenarios": resultados,
+    }
+    texto = json.dumps(informe, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+        print(f"Resultados en {args.salida}", file=sys.stderr)
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,116 @@
+"""Compara la ruta de respuesta JSON anterior con la actual, sin base de datos.
+
+Para cargas parecidas a /api/historial y /api/buscar mide el CPU por respuesta
+(time.process_time) y los bytes enviados:
+- antes: dict(DictRow) + jsonable_encoder + json.dumps, sin comprimir
+- ahora: dicts desde tuplas + respuestas.serializar (orjson si está instalado)
+  y compresión gzip/brotli como la del middleware
+
+Uso:
+    python benchmarks/respuestas_json.py [--filas 2000] [--repeticiones 50]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+import respuestas  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def filas_historial(n: int):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    columnas = ["accion", "detalles", "tipo_objeto", "objeto_id", "fecha"]
+    filas = [
+        ("Actualización", f"Juego actualizado: Juego {i} -> Juego {i} (edición especial)", "juego", i,
+         base + timedelta(seconds=i))
+        for i in range(n)
+    ]
+    return columnas, filas
+
+
+def filas_busqueda(n: int):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    columnas = ["id", "nombre", "genero", "año", "desarrollador", "imagen", "fecha_creacion",
+                "fecha_actualizacion", "relevancia"]
+    filas = [
+        (i, f"Juego de prueba {i}", "Aventura", 2000 + i % 25, "Estudio Ejemplo",
+         f"/static/uploads/{i:064x}.jpg", base, base + timedelta(days=i), 0.5 + i % 7 / 10)
+        for i in range(n)
+    ]
+    return columnas, filas
+
+
+class _FilaDict(list):
+    """Imita psycopg2.extras.DictRow: lista con acceso por nombre y keys()."""
+
+    def __init__(self, columnas, valores):
+        super().__init__(valores)
+        self._indice = {c: i for i, c in enumerate(columnas)}
+
+    def keys(self):
+        return self._indice.keys()
+
+    def __getitem__(self, clave):
+        if isinstance(clave, str):
+            return super().__getitem__(self._indice[clave])
+        return super().__getitem__(clave)
+
+
+def antes(columnas, filas) -> bytes:
+    filas_dict = [_FilaDict(columnas, f) for f in filas]
+    contenido = {"items": [dict(fila) for fila in filas_dict]}
+    return json.dumps(jsonable_encoder(contenido), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def ahora(columnas, filas) -> bytes:
+    return respuestas.serializar({"items": [dict(zip(columnas, f)) for f in filas]})
+
+
+def medir(funcion, repeticiones: int, *args):
+    inicio = time.process_time()
+    for _ in range(repeticiones):
+        cuerpo = funcion(*args)
+    return (time.process_time() - inicio) / repeticiones * 1000, cuerpo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=2000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    print(f"orjson: {'sí' if respuestas.orjson else 'no'}  brotli: {'sí' if brotli else 'no'}")
+    print(f"{'carga':<10} {'ruta':<6} {'CPU ms':>8} {'bytes':>9} {'gzip':>9} {'br':>9} {'CPU comp ms':>12}")
+    for nombre, generador in (("historial", filas_historial), ("busqueda", filas_busqueda)):
+        columnas, filas = generador(args.filas)
+        for etiqueta, funcion in (("antes", antes), ("ahora", ahora)):
+            cpu, cuerpo = medir(funcion, args.repeticiones, columnas, filas)
+            if etiqueta == "antes":
+                print(f"{nombre:<10} {etiqueta:<6} {cpu:>8.2f} {len(cuerpo):>9} {'-':>9} {'-':>9} {'-':>12}")
+                continue
+            cpu_gzip, comprimido = medir(gzip.compress, args.repeticiones, cuerpo, 6)
+            tam_br, cpu_br = "-", None
+            if brotli:
+                cpu_br, cuerpo_br = medir(lambda c: brotli.compress(c, quality=4), args.repeticiones, cuerpo)
+                tam_br = len(cuerpo_br)
+            compresion = f"{cpu_gzip:.2f}" + (f"/{cpu_br:.2f}" if cpu_br is not None else "")
+            print(f"{nombre:<10} {etiqueta:<6} {cpu:>8.2f} {len(cuerpo):>9} {len(comprimido):>9} "
+                  f"{tam_br:>9} {compresion:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Búsqueda en el catálogo con texto completo (tsvector/GIN) y trigramas (pg_trgm).
+
+Las expresiones de los índices y de las consultas son las mismas, para que
+PostgreSQL pueda usar los índices GIN en vez de recorrer las tablas. Si la
+extensión pg_trgm no está disponible se usa sólo el índice de texto completo
+(coincidencia por prefijo de palabra) y se pierde la tolerancia a errores
+tipográficos y la búsqueda de subcadenas.
+
+Con SQLite la búsqueda usa las tablas FTS5 de motor_sqlite ({tabla}_fts, con
+prefijos indexados y sin distinguir acentos) y ordena por bm25, con el nombre
+pesando más que el resto, como los pesos A y B de PostgreSQL. Igual que
+PostgreSQL sin pg_trgm, no tolera errores tipográficos: "metorid" no
+encuentra "Metroid".
+"""
+import re
+
+import psycopg2
+
+import db
+
+ENTIDADES = {
+    "juegos": {
+        "vector": "(setweight(to_tsvector('simple', nombre), 'A') || "
+                  "setweight(to_tsvector('simple', genero || ' ' || desarrollador), 'B'))",
+        "texto": "(nombre || ' ' || genero || ' ' || desarrollador)",
+    },
+    "consolas": {
+        "vector": "(setweight(to_tsvector('simple', nombre), 'A') || "
+                  "setweight(to_tsvector('simple', fabricante), 'B'))",
+        "texto": "(nombre || ' ' || fabricante)",
+    },
+    "accesorios": {
+        "vector": "(setweight(to_tsvector('simple', nombre), 'A') || "
+                  "setweight(to_tsvector('simple', tipo), 'B'))",
+        "texto": "(nombre || ' ' || tipo)",
+    },
+}
+
+_trigramas_disponibles = False
+
+
+def crear_extension_trigramas(cursor) -> bool:
+    """Intenta crear pg_trgm; si no hay permisos o no está instalada se sigue sin ella."""
+    cursor.execute("SAVEPOINT busqueda_trgm")
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute("RELEASE SAVEPOINT busqueda_trgm")
+        return True
+    except psycopg2.Error:
+        cursor.execute("ROLLBACK TO SAVEPOINT busqueda_trgm")
+        return False
+
+
+def detectar_trigramas(cursor) -> bool:
+    """Comprueba si pg_trgm está instalada y ajusta las consultas en consecuencia."""
+    global _trigramas_disponibles
+    if db.es_sqlite(cursor):
+        _trigramas_disponibles = False
+        return False
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+    _trigramas_disponibles = cursor.fetchone()[0]
+    return _trigramas_disponibles
+
+
+def sentencias_indices(trigramas: bool) -> list:
+    """Índices GIN de búsqueda como pares (nombre, sentencia)."""
+    sentencias = []
+    for tabla, expr in ENTIDADES.items():
+        sentencias.append((
+            f"idx_{tabla}_fts",
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_{tabla}_fts ON {tabla} USING GIN ({expr['vector']})"
+        ))
+        if trigramas:
+            sentencias.append((
+                f"idx_{tabla}_trgm",
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_{tabla}_trgm ON {tabla} "
+                f"USING GIN ({expr['texto']} gin_trgm_ops)"
+            ))
+    return sentencias
+
+
+def trigramas_disponibles() -> bool:
+    return _trigramas_disponibles
+
+
+def _consulta_prefijos(q: str) -> str:
+    """Convierte el texto libre en un tsquery con prefijos: 'zel bre' -> 'zel:* & bre:*'."""
+    palabras = re.findall(r"\w+", q.lower())
+    return " & ".join(f"{palabra}:*" for palabra in palabras)
+
+
+def _subconsulta(tabla: str) -> str:
+    expr = ENTIDADES[tabla]
+    condicion = f"{expr['vector']} @@ to_tsquery('simple', %(tsq)s)"
+    relevancia = f"ts_rank({expr['vector']}, to_tsquery('simple', %(tsq)s))"
+    if _trigramas_disponibles:
+        # Con gin_trgm_ops tanto el ILIKE como la similitud por palabra usan índice
+        condicion += f" OR {expr['texto']} ILIKE %(patron)s OR %(q)s <%% {expr['texto']}"
+        relevancia += f" + word_similarity(%(q)s, {expr['texto']})"
+    return f"""
+        SELECT '{tabla}' AS tipo, t.id, to_jsonb(t) AS datos, {relevancia} AS relevancia
+        FROM {tabla} t
+        WHERE {condicion}
+    """
+
+
+def _consulta_fts5(q: str) -> str:
+    """Texto libre a consulta FTS5 con prefijos: 'zel bre' -> '"zel"* "bre"*' (todas las palabras)."""
+    return " ".join(f'"{palabra}"*' for palabra in re.findall(r"\w+", q.lower()))
+
+
+def _buscar_sqlite(cursor, q: str, tipos: list, parametros: dict) -> list:
+    """Ids por relevancia con FTS5 y, después, las filas completas de cada tabla de la página."""
+    parametros["tsq"] = _consulta_fts5(q)
+    if not parametros["tsq"]:
+        return []
+    sql = " UNION ALL ".join(
+        f"SELECT '{tabla}' AS tipo, rowid AS id, -bm25({tabla}_fts, 1.0, 0.4) AS relevancia "
+        f"FROM {tabla}_fts WHERE {tabla}_fts MATCH %(tsq)s"
+        for tabla in tipos
+    )
+    cursor.execute(
+        f"""
+        SELECT tipo, id, relevancia, count(*) OVER () AS total
+        FROM ({sql}) r
+        ORDER BY relevancia DESC, tipo, id DESC
+        LIMIT %(limite)s OFFSET %(desplazamiento)s
+        """,
+        parametros
+    )
+    filas = cursor.fetchall()
+    datos = {}
+    for tabla in {fila["tipo"] for fila in filas}:
+        ids = [fila["id"] for fila in filas if fila["tipo"] == tabla]
+        cursor.execute(f"SELECT * FROM {tabla} WHERE id = ANY(%s)", (ids,))
+        datos.update({(tabla, item["id"]): item for item in db.como_dicts(cursor)})
+    return [
+        {"tipo": fila["tipo"], "datos": datos[(fila["tipo"], fila["id"])],
+         "relevancia": fila["relevancia"], "total": fila["total"]}
+        for fila in filas if (fila["tipo"], fila["id"]) in datos
+    ]
+
+
+def buscar(cursor, q: str, tipos: list, limite: int = 50, pagina: int = 1) -> dict:
+    """Busca en los tipos pedidos con una sola consulta y devuelve una página ordenada por relevancia."""
+    parametros = {
+        "q": q,
+        "tsq": _consulta_prefijos(q),
+        "patron": f"%{q}%",
+        "limite": limite,
+        "desplazamiento": (pagina - 1) * limite,
+    }
+    if db.es_sqlite(cursor):
+        filas = _buscar_sqlite(cursor, q, tipos, parametros)
+    else:
+        sql = " UNION ALL ".join(_subconsulta(tabla) for tabla in tipos)
+        cursor.execute(
+            f"""
+            SELECT tipo, datos, relevancia, count(*) OVER () AS total
+            FROM ({sql}) r
+            ORDER BY relevancia DESC, tipo, id DESC
+            LIMIT %(limite)s OFFSET %(desplazamiento)s
+            """,
+            parametros
+        )
+        filas = cursor.fetchall()
+    resultados = {tabla: [] for tabla in ENTIDADES}
+    for fila in filas:
+        item = dict(fila["datos"])
+        item["relevancia"] = round(float(fila["relevancia"]), 4)
+        resultados[fila["tipo"]].append(item)
+    resultados["total"] = filas[0]["total"] if filas else 0
+    resultados["pagina"] = pagina
+    resultados["limite"] = limite
+    return resultados
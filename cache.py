@@ -0,0 +1,158 @@
+"""Caché de lectura con TTL, expulsión LRU e invalidación por espacios.
+
+Cada clave se guarda con la generación actual de su espacio ("juegos",
+"consolas", ...). Invalidar un espacio sólo incrementa su generación, de modo
+que las entradas antiguas dejan de encontrarse sin tener que recorrerlas.
+
+Backends:
+- MemoriaLRU: en el proceso, por defecto. Cada worker de uvicorn tiene la suya.
+- RedisCache: compartido entre workers. Necesita el paquete opcional `redis`.
+  Los valores se guardan como JSON (con orjson si está instalado): vuelven
+  como los vería el cliente de la API, con las fechas en ISO 8601 y las
+  tuplas como listas, y nunca se ejecuta nada al leerlos.
+
+Se elige con CACHE_BACKEND=memoria|redis (y CACHE_URL para Redis).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from respuestas import orjson, serializar
+
+_AUSENTE = object()
+
+
+class MemoriaLRU:
+    """Backend en memoria del proceso con TTL por entrada y límite de entradas."""
+
+    compartido = False
+
+    def __init__(self, max_entradas: int = 2048):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._generaciones = {}
+        self._lock = threading.Lock()
+        self.expulsiones = 0
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return _AUSENTE
+            caduca, valor = entrada
+            if caduca < time.monotonic():
+                del self._datos[clave]
+                return _AUSENTE
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor, ttl: float):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.expulsiones += 1
+
+    def generacion(self, espacio: str) -> int:
+        return self._generaciones.get(espacio, 0)
+
+    def incrementar_generacion(self, espacio: str):
+        with self._lock:
+            self._generaciones[espacio] = self._generaciones.get(espacio, 0) + 1
+
+    def tamano(self) -> int:
+        return len(self._datos)
+
+
+class RedisCache:
+    """Backend compartido en Redis; las generaciones viven en Redis para que todos los workers las vean."""
+
+    compartido = True
+
+    def __init__(self, url: str, prefijo: str = "juegos-y-consolas:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requiere el paquete 'redis'") from e
+        self._redis = redis.Redis.from_url(url)
+        self.prefijo = prefijo
+        self.expulsiones = 0
+
+    def get(self, clave):
+        datos = self._redis.get(self.prefijo + clave)
+        if datos is None:
+            return _AUSENTE
+        return orjson.loads(datos) if orjson is not None else json.loads(datos)
+
+    def set(self, clave, valor, ttl: float):
+        self._redis.set(self.prefijo + clave, serializar(valor), px=int(ttl * 1000))
+
+    def generacion(self, espacio: str) -> int:
+        return int(self._redis.get(f"{self.prefijo}gen:{espacio}") or 0)
+
+    def incrementar_generacion(self, espacio: str):
+        self._redis.incr(f"{self.prefijo}gen:{espacio}")
+
+    def tamano(self) -> int:
+        return -1
+
+
+class Cache:
+    """Fachada de lectura: obtener() consulta la caché y, si falla, carga y guarda."""
+
+    def __init__(self, backend, ttl: float = 60.0):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._aciertos = {}
+        self._fallos = {}
+
+    def obtener(self, espacio: str, clave: str, cargar, ttl: float = None, guardar=None):
+        """Valor cacheado o `cargar()`; si se da `guardar`, lo cargado sólo se guarda cuando guardar() es cierto."""
+        clave_completa = f"{espacio}:{self.backend.generacion(espacio)}:{clave}"
+        valor = self.backend.get(clave_completa)
+        if valor is not _AUSENTE:
+            self._contar(self._aciertos, espacio)
+            return valor
+        self._contar(self._fallos, espacio)
+        valor = cargar()
+        if guardar is None or guardar():
+            self.backend.set(clave_completa, valor, self.ttl if ttl is None else ttl)
+        return valor
+
+    def invalidar(self, *espacios: str):
+        for espacio in espacios:
+            self.backend.incrementar_generacion(espacio)
+
+    def _contar(self, contadores: dict, espacio: str):
+        with self._lock:
+            contadores[espacio] = contadores.get(espacio, 0) + 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            espacios = sorted(set(self._aciertos) | set(self._fallos))
+            return {
+                "backend": type(self.backend).__name__,
+                "compartido": self.backend.compartido,
+                "entradas": self.backend.tamano(),
+                "expulsiones": self.backend.expulsiones,
+                "espacios": {
+                    espacio: {
+                        "aciertos": self._aciertos.get(espacio, 0),
+                        "fallos": self._fallos.get(espacio, 0),
+                    }
+                    for espacio in espacios
+                },
+            }
+
+
+def crear_cache_desde_entorno() -> Cache:
+    ttl = float(os.environ.get("CACHE_TTL", 60))
+    if os.environ.get("CACHE_BACKEND", "memoria") == "redis":
+        backend = RedisCache(os.environ.get("CACHE_URL", "redis://localhost:6379/0"))
+    else:
+        backend = MemoriaLRU(int(os.environ.get("CACHE_MAX_ENTRADAS", 2048)))
+    return Cache(backend, ttl)
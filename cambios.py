@@ -0,0 +1,216 @@
+"""Flujo de cambios en tiempo real: LISTEN/NOTIFY de PostgreSQL y difusión por SSE.
+
+Los triggers de la migración 13 publican en el canal `cambios`, al confirmar
+cada sentencia sobre juegos, consolas, accesorios o comparaciones, un evento
+compacto: {"tabla", "accion": insert|update|delete, "ids": [...]}. Si la
+sentencia afecta a muchas filas, "ids" es null y el cliente debe recargar.
+
+Cada worker mantiene una única conexión en LISTEN (`EscuchaCambios`, en un
+hilo) y reparte los eventos con `Difusor` entre sus clientes SSE. Un cliente
+conectado es sólo una cola asyncio y un generador en espera: no ocupa un hilo
+ni consulta nada periódicamente, así que un worker admite miles de conexiones
+inactivas. Los eventos recientes se guardan para reenviarlos a quien reconecte
+con Last-Event-ID; si se perdieron, se le envía `recargar`.
+
+Cada worker numera sus eventos por su cuenta, así que el id lleva delante el
+origen del difusor (aleatorio en cada arranque): "3f9c0a1b2d4e-17". Un
+Last-Event-ID de otro worker, o de antes de un reinicio, no se confunde con
+uno propio: el cliente que reconecta a otro proceso recibe `recargar`.
+
+Sin LISTEN (SQLite o CAMBIOS_TIEMPO_REAL=0) los endpoints de escritura
+publican ellos mismos el evento tras confirmar: cada worker difunde sus
+propias escrituras, con el mismo formato.
+"""
+import asyncio
+import collections
+import json
+import logging
+import select
+import threading
+import uuid
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+CANAL = "cambios"
+LATIDO_SEGUNDOS = 15.0
+
+_FIN = object()
+
+
+class Difusor:
+    """Reparte eventos entre las colas de los clientes conectados a este worker."""
+
+    def __init__(self, capacidad_cliente: int = 256, recientes: int = 1000):
+        self.capacidad_cliente = capacidad_cliente
+        self._recientes = collections.deque(maxlen=recientes)  # (secuencia, evento)
+        self._clientes = set()
+        self._lock = threading.Lock()
+        self.origen = uuid.uuid4().hex[:12]
+        self._secuencia = 0
+        self._loop = None
+        self.publicados = 0
+        self.desbordados = 0
+
+    def enlazar(self, loop):
+        """Bucle de eventos en el que viven las colas; `publicar` puede llamarse desde cualquier hilo."""
+        self._loop = loop
+
+    def publicar(self, evento: dict):
+        with self._lock:
+            self._secuencia += 1
+            evento = {**evento, "id": f"{self.origen}-{self._secuencia}"}
+            self._recientes.append((self._secuencia, evento))
+            self.publicados += 1
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._repartir, evento)
+
+    def cerrar(self):
+        """Termina todos los flujos abiertos (al parar el servidor)."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._repartir, _FIN)
+
+    def _repartir(self, evento):
+        for cola in list(self._clientes):
+            try:
+                cola.put_nowait(evento)
+            except asyncio.QueueFull:
+                # Cliente demasiado lento: se le pide que recargue en vez de acumular eventos
+                self._clientes.discard(cola)
+                cola.desbordada = True
+                self.desbordados += 1
+
+    def _pendientes_desde(self, ultimo_id: str):
+        """Eventos posteriores a `ultimo_id`, o None si no es de este difusor o ya no están todos en memoria."""
+        origen, _, secuencia = ultimo_id.rpartition("-")
+        if origen != self.origen or not secuencia.isdigit():
+            return None  # id de otro worker, de antes de un reinicio o mal formado
+        ultimo = int(secuencia)
+        with self._lock:
+            if ultimo > self._secuencia:
+                return None
+            if ultimo == self._secuencia:
+                return []
+            if not self._recientes or self._recientes[0][0] > ultimo + 1:
+                return None
+            return [evento for n, evento in self._recientes if n > ultimo]
+
+    async def eventos(self, ultimo_id: str = None, tablas: set = None):
+        """Genera el flujo SSE de un cliente: eventos `cambio`, `recargar` y latidos."""
+        cola = asyncio.Queue(maxsize=self.capacidad_cliente)
+        cola.desbordada = False
+        self._clientes.add(cola)
+        try:
+            yield "retry: 3000\n\n"
+            if ultimo_id:
+                pendientes = self._pendientes_desde(ultimo_id)
+                if pendientes is None:
+                    yield _sse("recargar", {})
+                    return
+                for evento in pendientes:
+                    mensaje = _mensaje(evento, tablas)
+                    if mensaje:
+                        yield mensaje
+            while True:
+                if cola.desbordada and cola.empty():
+                    yield _sse("recargar", {})
+                    return
+                try:
+                    evento = await asyncio.wait_for(cola.get(), LATIDO_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"
+                    continue
+                if evento is _FIN:
+                    return
+                mensaje = _mensaje(evento, tablas)
+                if mensaje:
+                    yield mensaje
+        finally:
+            self._clientes.discard(cola)
+
+    def estadisticas(self) -> dict:
+        return {
+            "clientes": len(self._clientes),
+            "publicados": self.publicados,
+            "desbordados": self.desbordados,
+            "ultimo_id": f"{self.origen}-{self._secuencia}",
+            "secuencia": self._secuencia,
+        }
+
+
+def _mensaje(evento: dict, tablas: set):
+    if evento["accion"] == "recargar":
+        return _sse("recargar", evento)
+    if tablas is None or evento["tabla"] in tablas:
+        return _sse("cambio", evento)
+    return None
+
+
+def _sse(nombre: str, datos: dict) -> str:
+    cabecera = f"id: {datos['id']}\n" if "id" in datos else ""
+    return f"{cabecera}event: {nombre}\ndata: {json.dumps(datos, separators=(',', ':'))}\n\n"
+
+
+class EscuchaCambios:
+    """Hilo con una conexión dedicada en LISTEN que pasa cada notificación al difusor.
+
+    Si la conexión se pierde, reconecta y publica un evento de recarga, porque
+    las notificaciones enviadas mientras tanto no se recuperan.
+    """
+
+    def __init__(self, dsn: str, difusor: Difusor, canal: str = CANAL, espera: float = 5.0):
+        self.dsn = dsn
+        self.difusor = difusor
+        self.canal = canal
+        self.espera = espera
+        self._parar = threading.Event()
+        self._hilo = None
+        self.conectada = False
+
+    def iniciar(self):
+        if self._hilo is not None:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="escucha-cambios", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if self._hilo is not None:
+            self._parar.set()
+            self._hilo.join()
+            self._hilo = None
+
+    def _bucle(self):
+        primera = True
+        while not self._parar.is_set():
+            try:
+                conn = psycopg2.connect(self.dsn)
+            except psycopg2.Error as e:
+                logger.warning("Escucha de cambios sin conexión: %s", e)
+                self._parar.wait(self.espera)
+                continue
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.canal}")
+                self.conectada = True
+                if not primera:
+                    self.difusor.publicar({"tabla": None, "accion": "recargar", "ids": None})
+                primera = False
+                while not self._parar.is_set():
+                    if select.select([conn], [], [], self.espera) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0)
+                        try:
+                            self.difusor.publicar(json.loads(aviso.payload))
+                        except ValueError:
+                            logger.warning("Notificación de cambios no válida: %s", aviso.payload)
+            except psycopg2.Error as e:
+                logger.warning("Escucha de cambios interrumpida: %s", e)
+                self._parar.wait(self.espera)
+            finally:
+                self.conectada = False
+                conn.close()
@@ -0,0 +1,564 @@
+"""Importación y exportación masiva del catálogo en NDJSON o CSV.
+
+La importación valida cada fila en Python, carga las válidas en tablas
+temporales con COPY, resuelve por nombre las referencias a consolas y
+accesorios y hace un upsert idempotente (se identifica por nombre, sin
+distinguir mayúsculas). Los errores se informan por fila y no abortan el
+resto del lote.
+
+Con SQLite las temporales se llenan con executemany y las sentencias que en
+PostgreSQL son CTEs que modifican datos se ejecutan por separado.
+
+Uso desde la línea de comandos:
+    python catalogo_io.py importar juegos juegos.ndjson
+    python catalogo_io.py importar consolas consolas.csv --formato csv
+    python catalogo_io.py exportar juegos juegos.csv --formato csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+import psycopg2.extras
+
+import db
+
+# tipo -> columnas (nombre, tipo sql, longitud máxima o None, obligatoria) y relaciones (campo -> tabla)
+ESQUEMAS = {
+    "juegos": {
+        "columnas": [
+            ("nombre", "text", 255, True),
+            ("genero", "text", 100, True),
+            ("año", "integer", None, False),
+            ("desarrollador", "text", 255, True),
+            ("imagen", "text", 255, False),
+        ],
+        "relaciones": {"consolas": "consolas", "accesorios": "accesorios"},
+    },
+    "consolas": {
+        "columnas": [
+            ("nombre", "text", 255, True),
+            ("fabricante", "text", 255, True),
+            ("año_lanzamiento", "integer", None, False),
+            ("imagen", "text", 255, False),
+        ],
+        "relaciones": {},
+    },
+    "accesorios": {
+        "columnas": [
+            ("nombre", "text", 255, True),
+            ("tipo", "text", 100, True),
+            ("imagen", "text", 255, False),
+        ],
+        "relaciones": {"consolas_compatibles": "consolas"},
+    },
+}
+
+FORMATOS = ("ndjson", "csv")
+TAM_LOTE = 5000
+MAX_ERRORES_INFORMADOS = 1000
+SEPARADOR_LISTA = "|"
+
+
+def sentencias_indices() -> list:
+    """Índices por nombre sin mayúsculas (resolución de referencias y upserts), como pares (nombre, sentencia)."""
+    return [
+        (f"idx_{tabla}_nombre_lower",
+         f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_{tabla}_nombre_lower ON {tabla} (lower(nombre))")
+        for tabla in ESQUEMAS
+    ]
+
+
+# --- Lectura y validación ---
+
+def leer_filas(archivo_binario, formato: str):
+    """Itera los registros (dict) de un archivo binario NDJSON o CSV, con su número de fila."""
+    texto = io.TextIOWrapper(archivo_binario, encoding="utf-8-sig", newline="")
+    if formato == "csv":
+        for numero, registro in enumerate(csv.DictReader(texto), start=1):
+            yield numero, registro
+        return
+    for numero, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            yield numero, json.loads(linea)
+        except json.JSONDecodeError as e:
+            yield numero, ValueError(f"JSON inválido: {e.msg}")
+
+
+def _validar(tipo: str, registro):
+    """Devuelve (valores, relaciones) o lanza ValueError con el motivo."""
+    if isinstance(registro, Exception):
+        raise registro
+    if not isinstance(registro, dict):
+        raise ValueError("Cada registro debe ser un objeto")
+    esquema = ESQUEMAS[tipo]
+    valores = []
+    for columna, tipo_sql, longitud, obligatoria in esquema["columnas"]:
+        valor = registro.get(columna)
+        if isinstance(valor, str):
+            valor = valor.strip() or None
+        if valor is None:
+            if obligatoria:
+                raise ValueError(f"Falta el campo obligatorio '{columna}'")
+        elif tipo_sql == "integer":
+            try:
+                valor = int(valor)
+            except (TypeError, ValueError):
+                raise ValueError(f"'{columna}' debe ser un entero")
+        else:
+            valor = str(valor)
+            if len(valor) > longitud:
+                raise ValueError(f"'{columna}' supera {longitud} caracteres")
+        valores.append(valor)
+
+    relaciones = {}
+    for campo in esquema["relaciones"]:
+        if campo not in registro:
+            continue
+        valor = registro[campo]
+        if valor is None or valor == "":
+            nombres = []
+        elif isinstance(valor, str):
+            nombres = [n.strip() for n in valor.split(SEPARADOR_LISTA) if n.strip()]
+        elif isinstance(valor, list) and all(isinstance(n, str) for n in valor):
+            nombres = [n.strip() for n in valor if n.strip()]
+        else:
+            raise ValueError(f"'{campo}' debe ser una lista de nombres")
+        relaciones[campo] = nombres
+    return valores, relaciones
+
+
+# --- Carga por lotes ---
+
+def _copiar(cursor, tabla: str, columnas: list, filas: list):
+    if db.es_sqlite(cursor):
+        marcadores = ", ".join(["%s"] * len(columnas))
+        cursor.executemany(f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({marcadores})", filas)
+        return
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(filas)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _preparar_temporales(cursor, tipo: str):
+    columnas = ", ".join(f"{c} {t}" for c, t, _, _ in ESQUEMAS[tipo]["columnas"])
+    if db.es_sqlite(cursor):
+        # Sin ON COMMIT DELETE ROWS: se vacían al empezar cada lote
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS imp_{tipo} (fila integer, toca_relaciones boolean, {columnas})")
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS imp_rel (fila integer, relacion text, nombre text)")
+        cursor.execute(f"DELETE FROM imp_{tipo}")
+        cursor.execute("DELETE FROM imp_rel")
+        return
+    cursor.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS imp_{tipo} "
+        f"(fila integer, toca_relaciones boolean, {columnas}) ON COMMIT DELETE ROWS"
+    )
+    cursor.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS imp_rel (fila integer, relacion text, nombre text) ON COMMIT DELETE ROWS"
+    )
+
+
+def _descartar_filas(cursor, tipo: str, filas: list):
+    cursor.execute(f"DELETE FROM imp_{tipo} WHERE fila = ANY(%s)", (filas,))
+    cursor.execute("DELETE FROM imp_rel WHERE fila = ANY(%s)", (filas,))
+
+
+def _importar_lote(conn, tipo: str, lote: list, resumen: dict):
+    esquema = ESQUEMAS[tipo]
+    nombres_columnas = [c for c, _, _, _ in esquema["columnas"]]
+    cursor = conn.cursor()
+    sqlite = db.es_sqlite(cursor)
+    fallidas = {}
+    try:
+        _preparar_temporales(cursor, tipo)
+        _copiar(
+            cursor, f"imp_{tipo}", ["fila", "toca_relaciones"] + nombres_columnas,
+            [[fila, bool(relaciones)] + valores for fila, valores, relaciones in lote]
+        )
+        _copiar(
+            cursor, "imp_rel", ["fila", "relacion", "nombre"],
+            [[fila, campo, nombre] for fila, _, relaciones in lote
+             for campo, nombres in relaciones.items() for nombre in nombres]
+        )
+
+        # Referencias que no existen: error para la fila entera
+        # group_concat de SQLite no admite DISTINCT con separador: se deduplica antes
+        agregado = "group_concat(r.nombre, ', ')" if sqlite else "string_agg(DISTINCT r.nombre, ', ')"
+        origen = "(SELECT DISTINCT fila, relacion, nombre FROM imp_rel)" if sqlite else "imp_rel"
+        for campo, destino in esquema["relaciones"].items():
+            cursor.execute(
+                f"""
+                SELECT r.fila, {agregado}
+                FROM {origen} r
+                WHERE r.relacion = %s
+                  AND NOT EXISTS (SELECT 1 FROM {destino} d WHERE lower(d.nombre) = lower(r.nombre))
+                GROUP BY r.fila
+                """,
+                (campo,)
+            )
+            for fila, nombres in cursor.fetchall():
+                fallidas.setdefault(fila, []).append(f"{campo} desconocidos: {nombres}")
+        if fallidas:
+            _descartar_filas(cursor, tipo, list(fallidas))
+            for fila, motivos in sorted(fallidas.items()):
+                _anotar_error(resumen, fila, "; ".join(motivos))
+
+        # Si un nombre se repite dentro del lote gana la última aparición
+        if sqlite:
+            repetidas = (f"SELECT a.fila FROM imp_{tipo} a JOIN imp_{tipo} b "
+                         f"ON lower(a.nombre) = lower(b.nombre) AND a.fila < b.fila")
+            cursor.execute(f"DELETE FROM imp_rel WHERE fila IN ({repetidas})")
+            cursor.execute(f"DELETE FROM imp_{tipo} WHERE fila IN ({repetidas})")
+        else:
+            cursor.execute(
+                f"""
+                WITH repetidas AS (
+                    DELETE FROM imp_{tipo} a USING imp_{tipo} b
+                    WHERE lower(a.nombre) = lower(b.nombre) AND a.fila < b.fila
+                    RETURNING a.fila
+                )
+                DELETE FROM imp_rel WHERE fila IN (SELECT fila FROM repetidas)
+                """
+            )
+            # En SQLite la transacción (BEGIN IMMEDIATE) ya tiene el bloqueo de escritura
+            cursor.execute(f"LOCK TABLE {tipo} IN SHARE ROW EXCLUSIVE MODE")
+        actualizables = [c for c in nombres_columnas if c not in ("nombre", "imagen")]
+        asignaciones = ", ".join(f"{c} = s.{c}" for c in actualizables)
+        distintos = " OR ".join(f"t.{c} IS DISTINCT FROM s.{c}" for c in actualizables)
+        cursor.execute(
+            f"""
+            UPDATE {tipo} AS t
+            SET {asignaciones}, imagen = COALESCE(s.imagen, t.imagen), version = t.version + 1,
+                fecha_actualizacion = CURRENT_TIMESTAMP
+            FROM imp_{tipo} s
+            WHERE lower(t.nombre) = lower(s.nombre)
+              AND ({distintos} OR (s.imagen IS NOT NULL AND t.imagen IS DISTINCT FROM s.imagen))
+            """
+        )
+        resumen["actualizados"] += cursor.rowcount
+        cursor.execute(
+            f"""
+            INSERT INTO {tipo} ({', '.join(nombres_columnas)})
+            SELECT {', '.join('s.' + c for c in nombres_columnas)}
+            FROM imp_{tipo} s
+            WHERE NOT EXISTS (SELECT 1 FROM {tipo} t WHERE lower(t.nombre) = lower(s.nombre))
+            ORDER BY s.fila
+            """
+        )
+        resumen["insertados"] += cursor.rowcount
+        cursor.execute(f"SELECT count(*) FROM imp_{tipo}")
+        resumen["procesados"] += cursor.fetchone()[0]
+
+        if tipo == "juegos":
+            _sincronizar_compatibilidad_juegos(cursor)
+        elif tipo == "accesorios":
+            _sincronizar_consolas_accesorios(cursor)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        for fila, _, _ in lote:
+            if fila not in fallidas:
+                _anotar_error(resumen, fila, f"Lote rechazado: {e}")
+    finally:
+        cursor.close()
+
+
+_OBJETIVO_JUEGOS = """
+    WITH objetivo AS (
+        SELECT t.id AS juego_id, s.fila
+        FROM imp_juegos s JOIN juegos t ON lower(t.nombre) = lower(s.nombre)
+        WHERE s.toca_relaciones
+    ),
+    deseado AS (
+        SELECT o.juego_id, c.id AS consola_id, NULL::integer AS accesorio_id
+        FROM objetivo o
+        JOIN imp_rel r ON r.fila = o.fila AND r.relacion = 'consolas'
+        JOIN consolas c ON lower(c.nombre) = lower(r.nombre)
+        UNION
+        SELECT o.juego_id, ac.consola_id, ac.accesorio_id
+        FROM objetivo o
+        JOIN imp_rel r ON r.fila = o.fila AND r.relacion = 'accesorios'
+        JOIN accesorios a ON lower(a.nombre) = lower(r.nombre)
+        JOIN accesorio_consola ac ON ac.accesorio_id = a.id
+    )
+"""
+
+_SOBRANTE_JUEGOS = """
+    NOT EXISTS (
+        SELECT 1 FROM deseado d
+        WHERE d.juego_id = co.juego_id AND d.consola_id = co.consola_id
+          AND d.accesorio_id IS NOT DISTINCT FROM co.accesorio_id
+    )
+"""
+
+_INSERTAR_JUEGOS = """
+    INSERT INTO compatibilidad (juego_id, consola_id, accesorio_id)
+    SELECT d.juego_id, d.consola_id, d.accesorio_id
+    FROM deseado d
+    WHERE NOT EXISTS (
+        SELECT 1 FROM compatibilidad co
+        WHERE co.juego_id = d.juego_id AND co.consola_id = d.consola_id
+          AND co.accesorio_id IS NOT DISTINCT FROM d.accesorio_id
+    )
+"""
+
+
+def _sincronizar_compatibilidad_juegos(cursor):
+    if db.es_sqlite(cursor):
+        cursor.execute(
+            _OBJETIVO_JUEGOS + "DELETE FROM compatibilidad AS co "
+            "WHERE co.juego_id IN (SELECT juego_id FROM objetivo) AND" + _SOBRANTE_JUEGOS
+        )
+        cursor.execute(_OBJETIVO_JUEGOS + _INSERTAR_JUEGOS)
+        return
+    cursor.execute(
+        _OBJETIVO_JUEGOS + """,
+        borrados AS (
+            DELETE FROM compatibilidad co
+            USING objetivo o
+            WHERE co.juego_id = o.juego_id AND""" + _SOBRANTE_JUEGOS + """
+        )
+        """ + _INSERTAR_JUEGOS
+    )
+
+
+_OBJETIVO_ACCESORIOS = """
+    WITH objetivo AS (
+        SELECT t.id AS accesorio_id, s.fila
+        FROM imp_accesorios s JOIN accesorios t ON lower(t.nombre) = lower(s.nombre)
+        WHERE s.toca_relaciones
+    ),
+    deseado AS (
+        SELECT DISTINCT o.accesorio_id, c.id AS consola_id
+        FROM objetivo o
+        JOIN imp_rel r ON r.fila = o.fila AND r.relacion = 'consolas_compatibles'
+        JOIN consolas c ON lower(c.nombre) = lower(r.nombre)
+    )
+"""
+
+_SOBRANTE_ACCESORIOS = """
+    NOT EXISTS (
+        SELECT 1 FROM deseado d
+        WHERE d.accesorio_id = ac.accesorio_id AND d.consola_id = ac.consola_id
+    )
+"""
+
+_INSERTAR_ACCESORIOS = """
+    INSERT INTO accesorio_consola (accesorio_id, consola_id)
+    SELECT d.accesorio_id, d.consola_id
+    FROM deseado d
+    WHERE NOT EXISTS (
+        SELECT 1 FROM accesorio_consola ac
+        WHERE ac.accesorio_id = d.accesorio_id AND ac.consola_id = d.consola_id
+    )
+"""
+
+
+def _sincronizar_consolas_accesorios(cursor):
+    if db.es_sqlite(cursor):
+        cursor.execute(
+            _OBJETIVO_ACCESORIOS + "DELETE FROM accesorio_consola AS ac "
+            "WHERE ac.accesorio_id IN (SELECT accesorio_id FROM objetivo) AND" + _SOBRANTE_ACCESORIOS
+        )
+        cursor.execute(_OBJETIVO_ACCESORIOS + _INSERTAR_ACCESORIOS)
+        return
+    cursor.execute(
+        _OBJETIVO_ACCESORIOS + """,
+        borrados AS (
+            DELETE FROM accesorio_consola ac
+            USING objetivo o
+            WHERE ac.accesorio_id = o.accesorio_id AND""" + _SOBRANTE_ACCESORIOS + """
+        )
+        """ + _INSERTAR_ACCESORIOS
+    )
+
+
+def _anotar_error(resumen: dict, fila: int, motivo: str):
+    resumen["total_errores"] += 1
+    if len(resumen["errores"]) < MAX_ERRORES_INFORMADOS:
+        resumen["errores"].append({"fila": fila, "error": motivo})
+
+
+def importar(conn, tipo: str, registros, tam_lote: int = TAM_LOTE) -> dict:
+    """Importa los registros (iterable de (numero_fila, dict)) y devuelve el resumen."""
+    if tipo not in ESQUEMAS:
+        raise ValueError(f"Tipo no soportado: {tipo}")
+    resumen = {"tipo": tipo, "procesados": 0, "insertados": 0, "actualizados": 0,
+               "total_errores": 0, "errores": []}
+    lote = []
+    for numero, registro in registros:
+        try:
+            valores, relaciones = _validar(tipo, registro)
+        except ValueError as e:
+            _anotar_error(resumen, numero, str(e))
+            continue
+        lote.append((numero, valores, relaciones))
+        if len(lote) >= tam_lote:
+            _importar_lote(conn, tipo, lote, resumen)
+            lote = []
+    if lote:
+        _importar_lote(conn, tipo, lote, resumen)
+    resumen["errores"].sort(key=lambda error: error["fila"])
+    return resumen
+
+
+# --- Exportación ---
+
+CONSULTAS_EXPORTACION = {
+    "juegos": """
+        SELECT j.nombre, j.genero, j.año, j.desarrollador, j.imagen,
+               ARRAY(SELECT DISTINCT c.nombre FROM compatibilidad co JOIN consolas c ON c.id = co.consola_id
+                     WHERE co.juego_id = j.id AND co.accesorio_id IS NULL ORDER BY c.nombre) AS consolas,
+               ARRAY(SELECT DISTINCT a.nombre FROM compatibilidad co JOIN accesorios a ON a.id = co.accesorio_id
+                     WHERE co.juego_id = j.id ORDER BY a.nombre) AS accesorios
+        FROM juegos j ORDER BY j.id
+    """,
+    "consolas": """
+        SELECT nombre, fabricante, año_lanzamiento, imagen FROM consolas ORDER BY id
+    """,
+    "accesorios": """
+        SELECT a.nombre, a.tipo, a.imagen,
+               ARRAY(SELECT DISTINCT c.nombre FROM accesorio_consola ac JOIN consolas c ON c.id = ac.consola_id
+                     WHERE ac.accesorio_id = a.id ORDER BY c.nombre) AS consolas_compatibles
+        FROM accesorios a ORDER BY a.id
+    """,
+}
+
+
+# En SQLite las listas se devuelven como arrays JSON (json_group_array) y se decodifican al leerlas
+CONSULTAS_EXPORTACION_SQLITE = {
+    "juegos": """
+        SELECT j.nombre, j.genero, j.año, j.desarrollador, j.imagen,
+               (SELECT json_group_array(nombre) FROM (
+                    SELECT DISTINCT c.nombre FROM compatibilidad co JOIN consolas c ON c.id = co.consola_id
+                    WHERE co.juego_id = j.id AND co.accesorio_id IS NULL ORDER BY c.nombre)) AS consolas,
+               (SELECT json_group_array(nombre) FROM (
+                    SELECT DISTINCT a.nombre FROM compatibilidad co JOIN accesorios a ON a.id = co.accesorio_id
+                    WHERE co.juego_id = j.id ORDER BY a.nombre)) AS accesorios
+        FROM juegos j ORDER BY j.id
+    """,
+    "consolas": CONSULTAS_EXPORTACION["consolas"],
+    "accesorios": """
+        SELECT a.nombre, a.tipo, a.imagen,
+               (SELECT json_group_array(nombre) FROM (
+                    SELECT DISTINCT c.nombre FROM accesorio_consola ac JOIN consolas c ON c.id = ac.consola_id
+                    WHERE ac.accesorio_id = a.id ORDER BY c.nombre)) AS consolas_compatibles
+        FROM accesorios a ORDER BY a.id
+    """,
+}
+
+
+def _columnas_exportacion(tipo: str) -> list:
+    return [c for c, _, _, _ in ESQUEMAS[tipo]["columnas"]] + list(ESQUEMAS[tipo]["relaciones"])
+
+
+def exportar_copy(conn, tipo: str, salida_binaria):
+    """Vuelca el tipo en CSV directamente con COPY ... TO STDOUT (listas separadas por '|')."""
+    if db.es_sqlite(conn):
+        for bloque in exportar_lineas(conn, tipo, "csv"):
+            salida_binaria.write(bloque)
+        return
+    columnas = _columnas_exportacion(tipo)
+    seleccion = ", ".join(
+        f"array_to_string({c}, '{SEPARADOR_LISTA}') AS {c}" if c in ESQUEMAS[tipo]["relaciones"] else c
+        for c in columnas
+    )
+    with conn.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY (SELECT {seleccion} FROM ({CONSULTAS_EXPORTACION[tipo]}) e) TO STDOUT WITH (FORMAT csv, HEADER)",
+            salida_binaria
+        )
+
+
+def exportar_lineas(conn, tipo: str, formato: str, tam_bloque: int = 2000):
+    """Genera el contenido exportado por bloques usando un cursor de servidor."""
+    columnas = _columnas_exportacion(tipo)
+    relaciones = ESQUEMAS[tipo]["relaciones"]
+    sqlite = db.es_sqlite(conn)
+    cursor = conn.cursor(name=f"exportar_{tipo}", cursor_factory=psycopg2.extras.DictCursor)
+    cursor.itersize = tam_bloque
+    try:
+        cursor.execute((CONSULTAS_EXPORTACION_SQLITE if sqlite else CONSULTAS_EXPORTACION)[tipo])
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        if formato == "csv":
+            escritor.writerow(columnas)
+        pendientes = 0
+        for fila in cursor:
+            if sqlite and relaciones:
+                fila = {c: json.loads(fila[c]) if c in relaciones else fila[c] for c in columnas}
+            if formato == "csv":
+                escritor.writerow([
+                    SEPARADOR_LISTA.join(fila[c]) if c in relaciones else fila[c] for c in columnas
+                ])
+            else:
+                buffer.write(json.dumps({c: fila[c] for c in columnas}, ensure_ascii=False))
+                buffer.write("\n")
+            pendientes += 1
+            if pendientes >= tam_bloque:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+                pendientes = 0
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+# --- Línea de comandos ---
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa o exporta el catálogo en NDJSON/CSV")
+    parser.add_argument("accion", choices=("importar", "exportar"))
+    parser.add_argument("tipo", choices=tuple(ESQUEMAS))
+    parser.add_argument("archivo", help="Ruta del archivo, o '-' para stdin/stdout")
+    parser.add_argument("--formato", choices=FORMATOS, default=None,
+                        help="Por defecto se deduce de la extensión del archivo")
+    parser.add_argument("--lote", type=int, default=TAM_LOTE)
+    args = parser.parse_args(argv)
+
+    formato = args.formato or ("csv" if args.archivo.endswith(".csv") else "ndjson")
+    conn = db.conectar(os.environ.get("DATABASE_URL"))
+    try:
+        if args.accion == "importar":
+            entrada = sys.stdin.buffer if args.archivo == "-" else open(args.archivo, "rb")
+            with entrada:
+                resumen = importar(conn, args.tipo, leer_filas(entrada, formato), args.lote)
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO historial (accion, detalles, tipo_objeto) VALUES (%s, %s, %s)",
+                    ("Importación", detalle_historial(resumen), args.tipo)
+                )
+            conn.commit()
+            json.dump(resumen, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+            return 1 if resumen["total_errores"] else 0
+
+        salida = sys.stdout.buffer if args.archivo == "-" else open(args.archivo, "wb")
+        with salida:
+            if formato == "csv":
+                exportar_copy(conn, args.tipo, salida)
+            else:
+                for bloque in exportar_lineas(conn, args.tipo, formato):
+                    salida.write(bloque)
+        return 0
+    finally:
+        conn.close()
+
+
+def detalle_historial(resumen: dict) -> str:
+    return (
+        f"Importación de {resumen['tipo']}: {resumen['insertados']} insertados, "
+        f"{resumen['actualizados']} actualizados, {resumen['total_errores']} errores"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,290 @@
+"""Instantáneas desnormalizadas de las comparaciones.
+
+Al crear una comparación se resuelven sus elementos (cualquier número de
+juegos, consolas y accesorios) y se guarda en `comparaciones.instantanea`:
+- los datos de cada elemento en ese momento,
+- el estado de compatibilidad entre ellos (juego-consola, accesorio-consola
+  y juego-accesorio sobre las consolas elegidas),
+- las diferencias campo a campo entre elementos del mismo tipo.
+
+El listado sólo lee `comparaciones`. Los triggers de la migración 11 marcan
+como obsoletas las comparaciones cuyos elementos o compatibilidades cambian,
+y `refrescar` reconstruye sólo esas, en lote: las de cada página al leerla
+(`obtener_pagina`) o todas desde la línea de comandos:
+    python comparaciones.py refrescar
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+import psycopg2.extras
+
+import db
+import paginacion
+
+TIPOS = ("juegos", "consolas", "accesorios")
+
+# Campos que no se comparan entre elementos
+_SIN_DIFERENCIAS = {"id", "imagen", "imagen_variantes", "fecha_creacion", "fecha_actualizacion"}
+
+
+def normalizar_elementos(juegos=(), consolas=(), accesorios=()) -> list:
+    """Lista ordenada y sin repetidos de pares (tipo, id)."""
+    elementos = []
+    for tipo, ids in (("juegos", juegos), ("consolas", consolas), ("accesorios", accesorios)):
+        for id_ in ids:
+            if id_ is not None and (tipo, id_) not in elementos:
+                elementos.append((tipo, id_))
+    return elementos
+
+
+def _cargar(cursor, elementos: list):
+    """Datos de las entidades y relaciones necesarias para un conjunto de elementos, en tres consultas."""
+    ids = {tipo: sorted({i for t, i in elementos if t == tipo}) for tipo in TIPOS}
+    partes = [
+        f"SELECT '{tipo}' AS tipo, t.id, to_jsonb(t) AS datos FROM {tipo} t WHERE t.id = ANY(%({tipo})s)"
+        for tipo in TIPOS if ids[tipo]
+    ]
+    entidades = {}
+    if partes and db.es_sqlite(cursor):
+        # Sin to_jsonb: filas completas, con las fechas en texto ISO como en el JSON de PostgreSQL
+        for tipo in TIPOS:
+            if ids[tipo]:
+                cursor.execute(f"SELECT * FROM {tipo} WHERE id = ANY(%s)", (ids[tipo],))
+                for fila in db.como_dicts(cursor):
+                    entidades[(tipo, fila["id"])] = {
+                        k: v.isoformat() if isinstance(v, datetime) else v for k, v in fila.items()
+                    }
+    elif partes:
+        cursor.execute(" UNION ALL ".join(partes), ids)
+        entidades = {(fila[0], fila[1]): fila[2] for fila in cursor.fetchall()}
+
+    pares_juego = {}
+    if ids["juegos"]:
+        cursor.execute(
+            "SELECT juego_id, consola_id, accesorio_id FROM compatibilidad WHERE juego_id = ANY(%s)",
+            (ids["juegos"],)
+        )
+        for juego_id, consola_id, accesorio_id in cursor.fetchall():
+            pares_juego.setdefault(juego_id, set()).add((consola_id, accesorio_id))
+    consolas_accesorio = {}
+    if ids["accesorios"]:
+        cursor.execute(
+            "SELECT accesorio_id, consola_id FROM accesorio_consola WHERE accesorio_id = ANY(%s)",
+            (ids["accesorios"],)
+        )
+        for accesorio_id, consola_id in cursor.fetchall():
+            consolas_accesorio.setdefault(accesorio_id, set()).add(consola_id)
+    return entidades, pares_juego, consolas_accesorio
+
+
+def _compatibilidad(elementos, entidades, pares_juego, consolas_accesorio) -> dict:
+    juegos = [i for t, i in elementos if t == "juegos" and ("juegos", i) in entidades]
+    consolas = [i for t, i in elementos if t == "consolas" and ("consolas", i) in entidades]
+    accesorios = [i for t, i in elementos if t == "accesorios" and ("accesorios", i) in entidades]
+    comprobaciones = []
+    for j in juegos:
+        pares = pares_juego.get(j, set())
+        for c in consolas:
+            comprobaciones.append({"juego": j, "consola": c, "compatible": any(pc == c for pc, _ in pares)})
+        for a in accesorios:
+            via = sorted({pc for pc, pa in pares if pa == a and (not consolas or pc in consolas)})
+            comprobaciones.append({"juego": j, "accesorio": a, "compatible": bool(via), "consolas": via})
+    for a in accesorios:
+        for c in consolas:
+            comprobaciones.append({
+                "accesorio": a, "consola": c, "compatible": c in consolas_accesorio.get(a, set())
+            })
+    resultados = {c["compatible"] for c in comprobaciones}
+    if not comprobaciones:
+        estado = "sin_datos"
+    elif resultados == {True}:
+        estado = "compatible"
+    elif resultados == {False}:
+        estado = "incompatible"
+    else:
+        estado = "parcial"
+    return {"estado": estado, "comprobaciones": comprobaciones}
+
+
+def _diferencias(elementos, entidades) -> dict:
+    """Por tipo con al menos dos elementos: campos cuyo valor cambia, con los valores en orden."""
+    diferencias = {}
+    for tipo in TIPOS:
+        datos = [entidades[(t, i)] for t, i in elementos if t == tipo and (t, i) in entidades]
+        if len(datos) < 2:
+            continue
+        campos = {}
+        for campo in datos[0]:
+            if campo in _SIN_DIFERENCIAS:
+                continue
+            valores = [d.get(campo) for d in datos]
+            if len(set(map(str, valores))) > 1:
+                campos[campo] = valores
+        if campos:
+            diferencias[tipo] = campos
+    return diferencias
+
+
+def _instantanea(elementos, entidades, pares_juego, consolas_accesorio) -> dict:
+    resueltos = []
+    for tipo, id_ in elementos:
+        datos = entidades.get((tipo, id_))
+        resueltos.append({
+            "tipo": tipo,
+            "id": id_,
+            "nombre": datos["nombre"] if datos else None,
+            "eliminado": datos is None,
+            "datos": datos,
+        })
+    return {
+        "elementos": resueltos,
+        "compatibilidad": _compatibilidad(elementos, entidades, pares_juego, consolas_accesorio),
+        "diferencias": _diferencias(elementos, entidades),
+    }
+
+
+def construir(cursor, elementos: list) -> dict:
+    return _instantanea(elementos, *_cargar(cursor, elementos))
+
+
+def crear(cursor, nombre: str, elementos: list, notas: str = None):
+    """Inserta la comparación con su instantánea y sus elementos; devuelve (id, instantánea)."""
+    instantanea = construir(cursor, elementos)
+    for elemento in instantanea["elementos"]:
+        if elemento["eliminado"]:
+            raise ValueError(f"No existe el elemento {elemento['id']} en {elemento['tipo']}")
+    primero = {tipo: next((i for t, i in elementos if t == tipo), None) for tipo in TIPOS}
+    cursor.execute(
+        """
+        INSERT INTO comparaciones (nombre, juego_id, consola_id, accesorio_id, notas, instantanea, obsoleta)
+        VALUES (%s, %s, %s, %s, %s, %s, false) RETURNING id
+        """,
+        (nombre, primero["juegos"], primero["consolas"], primero["accesorios"], notas,
+         psycopg2.extras.Json(instantanea))
+    )
+    comparacion_id = cursor.fetchone()[0]
+    psycopg2.extras.execute_values(
+        cursor,
+        "INSERT INTO comparacion_elementos (comparacion_id, posicion, tipo, entidad_id) VALUES %s",
+        [(comparacion_id, posicion, tipo, id_) for posicion, (tipo, id_) in enumerate(elementos)]
+    )
+    return comparacion_id, instantanea
+
+
+def refrescar(cursor, ids: list, guardar: bool = True) -> dict:
+    """Reconstruye las instantáneas de las comparaciones dadas con una carga conjunta; devuelve {id: instantánea}.
+
+    Con `guardar=False` sólo las calcula (conexiones de sólo lectura, como las de una réplica).
+    Para guardar, bloquea antes las comparaciones: el trigger que las marque como obsoletas
+    espera a este commit, y no se puede guardar como fresca una instantánea calculada con
+    datos que otro acaba de cambiar. Las que ya tiene bloqueadas otra transacción (un
+    escritor a medias) se calculan, pero no se guardan.
+    """
+    if not ids:
+        return {}
+    bloqueadas = set(ids)
+    if guardar:
+        cursor.execute(
+            "SELECT id FROM comparaciones WHERE id = ANY(%s) ORDER BY id FOR UPDATE SKIP LOCKED", (list(ids),)
+        )
+        bloqueadas = {fila[0] for fila in cursor.fetchall()}
+    cursor.execute(
+        """
+        SELECT comparacion_id, tipo, entidad_id FROM comparacion_elementos
+        WHERE comparacion_id = ANY(%s) ORDER BY comparacion_id, posicion
+        """,
+        (list(ids),)
+    )
+    por_comparacion = {}
+    for comparacion_id, tipo, entidad_id in cursor.fetchall():
+        por_comparacion.setdefault(comparacion_id, []).append((tipo, entidad_id))
+    todos = [e for elementos in por_comparacion.values() for e in elementos]
+    cargado = _cargar(cursor, todos)
+    nuevas = {
+        comparacion_id: _instantanea(elementos, *cargado)
+        for comparacion_id, elementos in por_comparacion.items()
+    }
+    guardadas = {comparacion_id: i for comparacion_id, i in nuevas.items() if comparacion_id in bloqueadas}
+    if not guardar or not guardadas:
+        return nuevas
+    if db.es_sqlite(cursor):
+        cursor.executemany(
+            "UPDATE comparaciones SET instantanea = %s, obsoleta = false, version = version + 1 WHERE id = %s",
+            [(psycopg2.extras.Json(i), comparacion_id) for comparacion_id, i in guardadas.items()]
+        )
+    else:
+        psycopg2.extras.execute_values(
+            cursor,
+            """
+            UPDATE comparaciones c SET instantanea = v.instantanea::jsonb, obsoleta = false, version = c.version + 1
+            FROM (VALUES %s) AS v (id, instantanea) WHERE c.id = v.id
+            """,
+            [(comparacion_id, psycopg2.extras.Json(i)) for comparacion_id, i in guardadas.items()]
+        )
+    return nuevas
+
+
+def obtener_pagina(cursor, tabla: str, orden: str, limite: int, token: str = None, columnas: str = "t.*"):
+    """Como `paginacion.obtener_pagina`, pero refresca antes las instantáneas obsoletas de la página."""
+    filas, siguiente = paginacion.obtener_pagina(cursor, tabla, orden, limite, token, columnas)
+    obsoletas = [fila["id"] for fila in filas if fila.get("obsoleta")]
+    if obsoletas:
+        # En una réplica no se puede escribir: las guardará la siguiente lectura que vaya a la primaria
+        guardar = not getattr(cursor.connection, "readonly", False)
+        nuevas = refrescar(cursor, obsoletas, guardar=guardar)
+        versiones = {}
+        if guardar:
+            # El refresco sube la versión de las que guardó: la página lleva la que verá un If-Match
+            cursor.execute("SELECT id, version FROM comparaciones WHERE id = ANY(%s)", (obsoletas,))
+            versiones = dict(cursor.fetchall())
+            cursor.connection.commit()
+        for fila in filas:
+            if fila["id"] in nuevas:
+                fila["instantanea"], fila["obsoleta"] = nuevas[fila["id"]], False
+            if fila["id"] in versiones:
+                fila["version"] = versiones[fila["id"]]
+    return filas, siguiente
+
+
+def refrescar_obsoletas(conn, lote: int = 500) -> int:
+    """Refresca por lotes todas las comparaciones obsoletas; devuelve cuántas."""
+    total = 0
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute(
+                "SELECT id FROM comparaciones WHERE obsoleta ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED",
+                (lote,)
+            )
+            ids = [fila[0] for fila in cursor.fetchall()]
+            if not ids:
+                conn.commit()
+                return total
+            refrescar(cursor, ids)
+            conn.commit()
+            total += len(ids)
+
+
+def describir(instantanea: dict) -> str:
+    """Texto corto con los nombres de los elementos, para el historial."""
+    nombres = [e["nombre"] or f"{e['tipo']} {e['id']}" for e in (instantanea or {}).get("elementos", [])]
+    return ", ".join(nombres)
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Mantenimiento de las instantáneas de comparaciones")
+    parser.add_argument("accion", choices=["refrescar"])
+    parser.add_argument("--lote", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    conn = db.conectar(os.environ.get("DATABASE_URL"))
+    try:
+        print(f"{refrescar_obsoletas(conn, args.lote)} comparaciones refrescadas")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
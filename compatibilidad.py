@@ -0,0 +1,181 @@
+"""Escritura de las relaciones de compatibilidad mediante operaciones por conjuntos.
+
+Cada sincronización es una sola sentencia para cualquier número de juegos o
+accesorios: calcula el conjunto deseado, borra las filas que sobran e inserta
+sólo las que faltan, de modo que las filas que no cambian (y sus notas) se
+conservan.
+
+SQLite no tiene CTEs que modifiquen datos ni unnest: allí son dos sentencias
+(borrar y luego insertar) y las listas llegan como JSON (json_each).
+"""
+import db
+
+_DESEADO_JUEGOS = """
+    WITH deseado AS (
+        SELECT p.juego_id, p.consola_id, NULL::integer AS accesorio_id
+        FROM unnest(%(pares_juego)s::integer[], %(pares_consola)s::integer[]) AS p (juego_id, consola_id)
+        UNION
+        SELECT p.juego_id, ac.consola_id, ac.accesorio_id
+        FROM unnest(%(accesorios_juego)s::integer[], %(accesorios)s::integer[]) AS p (juego_id, accesorio_id)
+        JOIN accesorio_consola ac ON ac.accesorio_id = p.accesorio_id
+    )
+"""
+
+_DESEADO_JUEGOS_SQLITE = """
+    WITH deseado AS (
+        SELECT json_extract(p.value, '$[0]') AS juego_id, json_extract(p.value, '$[1]') AS consola_id,
+               NULL AS accesorio_id
+        FROM json_each(%(pares_consola)s) p
+        UNION
+        SELECT json_extract(p.value, '$[0]'), ac.consola_id, ac.accesorio_id
+        FROM json_each(%(pares_accesorio)s) p
+        JOIN accesorio_consola ac ON ac.accesorio_id = json_extract(p.value, '$[1]')
+    )
+"""
+
+_SOBRA_JUEGO = """
+    NOT EXISTS (
+        SELECT 1 FROM deseado d
+        WHERE d.juego_id = co.juego_id AND d.consola_id = co.consola_id
+          AND d.accesorio_id IS NOT DISTINCT FROM co.accesorio_id
+    )
+"""
+
+_INSERTAR_JUEGOS = """
+    INSERT INTO compatibilidad (juego_id, consola_id, accesorio_id)
+    SELECT d.juego_id, d.consola_id, d.accesorio_id
+    FROM deseado d
+    WHERE NOT EXISTS (
+        SELECT 1 FROM compatibilidad co
+        WHERE co.juego_id = d.juego_id AND co.consola_id = d.consola_id
+          AND co.accesorio_id IS NOT DISTINCT FROM d.accesorio_id
+    )
+"""
+
+
+def sincronizar_juegos(cursor, deseado: dict):
+    """Deja en `compatibilidad` exactamente las consolas de cada juego y las de sus accesorios.
+
+    `deseado` es {juego_id: (consolas, accesorios)}.
+    """
+    if not deseado:
+        return
+    pares_consola = [(j, c) for j, (consolas, _) in deseado.items() for c in consolas]
+    pares_accesorio = [(j, a) for j, (_, accesorios) in deseado.items() for a in accesorios]
+    if db.es_sqlite(cursor):
+        parametros = {
+            "juegos": list(deseado),
+            "pares_consola": pares_consola,
+            "pares_accesorio": pares_accesorio,
+        }
+        cursor.execute(
+            _DESEADO_JUEGOS_SQLITE + """
+            DELETE FROM compatibilidad AS co
+            WHERE co.juego_id = ANY(%(juegos)s) AND""" + _SOBRA_JUEGO,
+            parametros
+        )
+        cursor.execute(_DESEADO_JUEGOS_SQLITE + _INSERTAR_JUEGOS, parametros)
+        return
+    cursor.execute(
+        _DESEADO_JUEGOS + """,
+        borrados AS (
+            DELETE FROM compatibilidad co
+            WHERE co.juego_id = ANY(%(juegos)s::integer[]) AND""" + _SOBRA_JUEGO + """
+        )
+        """ + _INSERTAR_JUEGOS,
+        {
+            "juegos": list(deseado),
+            "pares_juego": [j for j, _ in pares_consola],
+            "pares_consola": [c for _, c in pares_consola],
+            "accesorios_juego": [j for j, _ in pares_accesorio],
+            "accesorios": [a for _, a in pares_accesorio],
+        }
+    )
+
+
+def sincronizar_juego(cursor, juego_id: int, consolas: list, accesorios: list):
+    sincronizar_juegos(cursor, {juego_id: (consolas, accesorios)})
+
+
+_INSERTAR_ACCESORIOS = """
+    INSERT INTO accesorio_consola (accesorio_id, consola_id)
+    SELECT d.accesorio_id, d.consola_id
+    FROM deseado d
+    WHERE NOT EXISTS (
+        SELECT 1 FROM accesorio_consola ac
+        WHERE ac.accesorio_id = d.accesorio_id AND ac.consola_id = d.consola_id
+    )
+"""
+
+
+def sincronizar_accesorios(cursor, deseado: dict):
+    """Deja en `accesorio_consola` exactamente las consolas indicadas para cada accesorio.
+
+    `deseado` es {accesorio_id: consolas}.
+    """
+    if not deseado:
+        return
+    pares = [(a, c) for a, consolas in deseado.items() for c in consolas]
+    if db.es_sqlite(cursor):
+        parametros = {"accesorios": list(deseado), "pares": pares}
+        deseado_sql = """
+            WITH deseado AS (
+                SELECT DISTINCT json_extract(p.value, '$[0]') AS accesorio_id,
+                                json_extract(p.value, '$[1]') AS consola_id
+                FROM json_each(%(pares)s) p
+            )
+        """
+        cursor.execute(
+            deseado_sql + """
+            DELETE FROM accesorio_consola AS ac
+            WHERE ac.accesorio_id = ANY(%(accesorios)s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM deseado d WHERE d.accesorio_id = ac.accesorio_id AND d.consola_id = ac.consola_id
+              )
+            """,
+            parametros
+        )
+        cursor.execute(deseado_sql + _INSERTAR_ACCESORIOS, parametros)
+        return
+    cursor.execute(
+        """
+        WITH deseado AS (
+            SELECT DISTINCT p.accesorio_id, p.consola_id
+            FROM unnest(%(pares_accesorio)s::integer[], %(pares_consola)s::integer[]) AS p (accesorio_id, consola_id)
+        ),
+        borrados AS (
+            DELETE FROM accesorio_consola ac
+            WHERE ac.accesorio_id = ANY(%(accesorios)s::integer[])
+              AND NOT EXISTS (
+                  SELECT 1 FROM deseado d WHERE d.accesorio_id = ac.accesorio_id AND d.consola_id = ac.consola_id
+              )
+        )
+        """ + _INSERTAR_ACCESORIOS,
+        {
+            "accesorios": list(deseado),
+            "pares_accesorio": [a for a, _ in pares],
+            "pares_consola": [c for _, c in pares],
+        }
+    )
+
+
+def sincronizar_accesorio(cursor, accesorio_id: int, consolas: list):
+    sincronizar_accesorios(cursor, {accesorio_id: consolas})
+
+
+def pares_juegos(cursor, juegos: list) -> dict:
+    """Pares (consola_id, accesorio_id) que quedan en `compatibilidad` para cada juego, en una consulta."""
+    pares = {juego_id: [] for juego_id in juegos}
+    if juegos:
+        cursor.execute(
+            "SELECT juego_id, consola_id, accesorio_id FROM compatibilidad WHERE juego_id = ANY(%s)",
+            (list(juegos),)
+        )
+        for fila in cursor.fetchall():
+            pares[fila[0]].append((fila[1], fila[2]))
+    return pares
+
+
+def pares_juego(cursor, juego_id: int) -> list:
+    """Pares (consola_id, accesorio_id) que quedan en `compatibilidad` para el juego."""
+    return pares_juegos(cursor, [juego_id])[juego_id]
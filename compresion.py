@@ -0,0 +1,131 @@
+"""Middleware ASGI de compresión con negociación gzip/brotli.
+
+Comprime las respuestas de texto (HTML, JSON, NDJSON, CSV, CSS, JS) según el
+Accept-Encoding del cliente, prefiriendo brotli si el paquete opcional está
+instalado. Las respuestas en streaming se comprimen bloque a bloque con un
+flush tras cada uno, para que el navegador pueda ir mostrando la página.
+No toca respuestas que ya traen Content-Encoding (p. ej. los estáticos
+precomprimidos), las parciales (206) ni las más pequeñas que `minimo`.
+A la ETag de una respuesta comprimida se le añade la codificación
+("abc" -> "abc-gzip"): es otra representación del mismo recurso.
+"""
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from estaticos import codificaciones_aceptadas, etiqueta_codificada
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+TIPOS_COMPRIMIBLES = (
+    "text/", "application/json", "application/x-ndjson", "application/javascript", "image/svg+xml",
+)
+# Flujos de larga duración: un compresor abierto por conexión cuesta cientos de KB
+TIPOS_SIN_COMPRIMIR = ("text/event-stream",)
+
+
+class _Gzip:
+    def __init__(self, nivel: int):
+        self._compresor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def bloque(self, datos: bytes) -> bytes:
+        return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def final(self) -> bytes:
+        return self._compresor.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, calidad: int):
+        self._compresor = brotli.Compressor(quality=calidad)
+
+    def bloque(self, datos: bytes) -> bytes:
+        return self._compresor.process(datos) + self._compresor.flush()
+
+    def final(self) -> bytes:
+        return self._compresor.finish()
+
+
+class MiddlewareCompresion:
+    def __init__(self, app, minimo: int = 500, nivel_gzip: int = 6, calidad_brotli: int = 4):
+        self.app = app
+        self.minimo = minimo
+        self.nivel_gzip = nivel_gzip
+        self.calidad_brotli = calidad_brotli
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        aceptadas = codificaciones_aceptadas(Headers(scope=scope).get("accept-encoding", ""))
+        if "br" in aceptadas and brotli is not None:
+            codificacion = "br"
+        elif "gzip" in aceptadas:
+            codificacion = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+        await _Respuesta(self, codificacion, send).ejecutar(scope, receive)
+
+
+class _Respuesta:
+    """Estado de una respuesta: decide con el primer bloque si se comprime o se deja pasar."""
+
+    def __init__(self, middleware: MiddlewareCompresion, codificacion: str, send):
+        self.middleware = middleware
+        self.codificacion = codificacion
+        self.send = send
+        self.inicio = None
+        self.compresor = None
+        self.directo = False
+
+    async def ejecutar(self, scope, receive):
+        await self.middleware.app(scope, receive, self.enviar)
+
+    async def enviar(self, mensaje):
+        if mensaje["type"] == "http.response.start":
+            self.inicio = mensaje
+            cabeceras = Headers(raw=mensaje["headers"])
+            tipo = cabeceras.get("content-type", "")
+            self.directo = (
+                mensaje["status"] in (204, 206, 304)
+                or "content-encoding" in cabeceras
+                or not tipo.startswith(TIPOS_COMPRIMIBLES)
+                or tipo.startswith(TIPOS_SIN_COMPRIMIR)
+            )
+            if self.directo:
+                await self.send(mensaje)
+            return
+        if mensaje["type"] != "http.response.body" or self.directo:
+            await self.send(mensaje)
+            return
+
+        cuerpo = mensaje.get("body", b"")
+        mas = mensaje.get("more_body", False)
+        if self.compresor is None:
+            if not mas and len(cuerpo) < self.middleware.minimo:
+                self.directo = True
+                await self.send(self.inicio)
+                await self.send(mensaje)
+                return
+            self.compresor = (
+                _Brotli(self.middleware.calidad_brotli) if self.codificacion == "br"
+                else _Gzip(self.middleware.nivel_gzip)
+            )
+            cabeceras = MutableHeaders(raw=self.inicio["headers"])
+            cabeceras["content-encoding"] = self.codificacion
+            cabeceras.add_vary_header("Accept-Encoding")
+            if "etag" in cabeceras:
+                cabeceras["etag"] = etiqueta_codificada(cabeceras["etag"], self.codificacion)
+            if "content-length" in cabeceras:
+                del cabeceras["content-length"]
+            await self.send(self.inicio)
+
+        datos = self.compresor.bloque(cuerpo) if cuerpo else b""
+        if not mas:
+            datos += self.compresor.final()
+        if datos or not mas:
+            await self.send({"type": "http.response.body", "body": datos, "more_body": mas})
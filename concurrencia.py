@@ -0,0 +1,115 @@
+"""Actualizar y eliminar una fila en una sola sentencia, con concurrencia optimista.
+
+Juegos, consolas y accesorios tienen una columna `version` que incrementa
+cada UPDATE, también los que cambian su imagen o sus miniaturas. GET
+/api/<tabla>/<id> la envía como ETag ("v3") y PUT/DELETE aceptan If-Match:
+si la fila cambió desde entonces, la sentencia no la toca y la API responde
+412 en lugar de pisar el cambio de otro. Sin If-Match (o con If-Match: *)
+gana la última escritura, como antes. Las comparaciones también la tienen
+(sube al refrescar su instantánea) y su DELETE acepta If-Match.
+
+`actualizar` y `eliminar` comprueban que la fila existe y tiene la versión
+esperada y devuelven el nombre anterior para el historial con un único
+UPDATE/DELETE ... RETURNING. Sólo cuando no afectan a ninguna fila hace
+falta otra consulta para distinguir 404 de 412. En SQLite el RETURNING de
+un UPDATE no puede leer la fila anterior, así que el nombre se lee antes en
+la misma transacción (sin ida y vuelta por red: la base está en el proceso).
+"""
+import re
+from typing import Optional
+
+import db
+
+# Comparación fuerte: una ETag débil (W/"v3") nunca coincide; la compresión sólo añade un sufijo
+_ETIQUETA = re.compile(r'^"v(\d+)(?:-gzip|-br)?"$')
+
+
+class PrecondicionFallida(Exception):
+    """La fila existe, pero su versión no es ninguna de las de If-Match."""
+
+
+def etiqueta(version: int) -> str:
+    return f'"v{version}"'
+
+
+def versiones_if_match(cabecera: Optional[str]) -> Optional[list]:
+    """Versiones aceptables según If-Match, o None si no hay condición (sin cabecera o con '*')."""
+    if cabecera is None:
+        return None
+    versiones = []
+    for candidata in cabecera.split(","):
+        candidata = candidata.strip()
+        if candidata == "*":
+            return None
+        coincidencia = _ETIQUETA.match(candidata)
+        if coincidencia:
+            versiones.append(int(coincidencia.group(1)))
+    return versiones
+
+
+def _condicion(versiones: Optional[list], columna: str) -> tuple:
+    if versiones is None:
+        return "", ()
+    return f" AND {columna} = ANY(%s)", (versiones,)
+
+
+def _sin_filas(cursor, tabla: str, entidad_id: int, versiones: Optional[list]):
+    """La sentencia no tocó nada: None si la fila no existe, PrecondicionFallida si tiene otra versión."""
+    if versiones is not None:
+        cursor.execute(f"SELECT version FROM {tabla} WHERE id = %s", (entidad_id,))
+        fila = cursor.fetchone()
+        if fila is not None:
+            raise PrecondicionFallida(f"El elemento ha cambiado (versión actual {fila[0]}); vuelve a cargarlo")
+    return None
+
+
+def actualizar(cursor, tabla: str, entidad_id: int, valores: dict, versiones: Optional[list] = None):
+    """UPDATE de `valores` en la fila; devuelve (nombre anterior, versión nueva) o None si no existe."""
+    asignaciones = ", ".join(f"{columna} = %s" for columna in valores)
+    if db.es_sqlite(cursor):
+        condicion, extra = _condicion(versiones, "version")
+        cursor.execute(f"SELECT nombre FROM {tabla} WHERE id = %s", (entidad_id,))
+        anterior = cursor.fetchone()
+        cursor.execute(
+            f"""
+            UPDATE {tabla}
+            SET {asignaciones}, version = version + 1, fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE id = %s{condicion}
+            RETURNING version
+            """,
+            (*valores.values(), entidad_id, *extra)
+        )
+        fila = cursor.fetchone()
+        if fila is None:
+            return _sin_filas(cursor, tabla, entidad_id, versiones)
+        return anterior[0], fila[0]
+
+    # `anterior` es la fila antes del UPDATE; la condición de versión se vuelve a evaluar
+    # sobre la última versión confirmada si otra transacción la cambió mientras esperábamos
+    condicion, extra = _condicion(versiones, "t.version")
+    cursor.execute(
+        f"""
+        UPDATE {tabla} AS t
+        SET {asignaciones}, version = t.version + 1, fecha_actualizacion = CURRENT_TIMESTAMP
+        FROM {tabla} AS anterior
+        WHERE t.id = %s AND anterior.id = t.id{condicion}
+        RETURNING anterior.nombre, t.version
+        """,
+        (*valores.values(), entidad_id, *extra)
+    )
+    fila = cursor.fetchone()
+    if fila is None:
+        return _sin_filas(cursor, tabla, entidad_id, versiones)
+    return fila[0], fila[1]
+
+
+def eliminar(cursor, tabla: str, entidad_id: int, versiones: Optional[list] = None, columnas: str = None):
+    """DELETE de la fila; devuelve su nombre (o la fila con `columnas`, si se dan) o None si no existe."""
+    condicion, extra = _condicion(versiones, "version")
+    cursor.execute(
+        f"DELETE FROM {tabla} WHERE id = %s{condicion} RETURNING {columnas or 'nombre'}", (entidad_id, *extra)
+    )
+    fila = cursor.fetchone()
+    if fila is None:
+        return _sin_filas(cursor, tabla, entidad_id, versiones)
+    return fila if columnas else fila[0]
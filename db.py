@@ -0,0 +1,207 @@
+"""Capa de acceso a datos: pool de conexiones acotado y con chequeo de salud.
+
+El motor lo decide DATABASE_URL: PostgreSQL (postgresql://...) o SQLite
+embebido (sqlite:///ruta.db, ver motor_sqlite). Los módulos que necesitan SQL
+distinto en cada uno lo consultan con `es_sqlite(conexion_o_cursor)`.
+Las lecturas que pueden ir a una réplica usan replicas.obtener_conexion_lectura.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.pool
+
+import motor_sqlite
+
+
+class PoolAgotado(Exception):
+    """No se consiguió una conexión libre dentro del tiempo de espera configurado."""
+
+
+class _PoolContado(psycopg2.pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool que lleva la cuenta de las conexiones físicas abiertas."""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self.conexiones_abiertas = 0
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        # psycopg2 cierra al devolverlas las conexiones que exceden minconn;
+        # subiéndolo tras abrir las iniciales se conservan ociosas hasta maxconn.
+        self.minconn = maxconn
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self.conexiones_abiertas += 1
+        return conn
+
+
+class PoolConexiones:
+    """Pool acotado de conexiones con tiempos de espera y de uso medidos."""
+
+    def __init__(self, dsn: str, minimo: int = 1, maximo: int = 10,
+                 espera: float = 5.0, chequeo_inactividad: float = 30.0, connection_factory=None):
+        self.dsn = dsn
+        self.minimo = minimo
+        self.maximo = maximo
+        self.espera = espera
+        self.chequeo_inactividad = chequeo_inactividad
+        if motor_sqlite.es_url(dsn):
+            self._pool = motor_sqlite.PoolSQLite(minimo, maximo, dsn, connection_factory=connection_factory)
+        else:
+            self._pool = _PoolContado(minimo, maximo, dsn, connection_factory=connection_factory)
+        # El semáforo hace que las peticiones esperen turno en vez de que
+        # psycopg2 lance "connection pool exhausted" al llegar al máximo.
+        self._cupos = threading.BoundedSemaphore(maximo)
+        self._ultimo_uso = {}
+        self._lock = threading.Lock()
+        self._en_uso = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._descartadas = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._uso_total = 0.0
+        self._uso_max = 0.0
+
+    def _sana(self, conn) -> bool:
+        if conn.closed:
+            return False
+        ultimo_uso = self._ultimo_uso.get(id(conn))
+        if ultimo_uso is None or time.monotonic() - ultimo_uso < self.chequeo_inactividad:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _tomar(self):
+        conn = self._pool.getconn()
+        while not self._sana(conn):
+            self._ultimo_uso.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+            with self._lock:
+                self._descartadas += 1
+            conn = self._pool.getconn()
+        return conn
+
+    @contextmanager
+    def conexion(self):
+        """Presta una conexión del pool y la devuelve al salir del bloque."""
+        inicio = time.perf_counter()
+        if not self._cupos.acquire(timeout=self.espera):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolAgotado(f"Sin conexiones libres tras {self.espera}s de espera")
+        try:
+            conn = self._tomar()
+        except Exception:
+            self._cupos.release()
+            raise
+        prestada = time.perf_counter()
+        espera = prestada - inicio
+        with self._lock:
+            self._checkouts += 1
+            self._en_uso += 1
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        try:
+            yield conn
+        finally:
+            uso = time.perf_counter() - prestada
+            self._ultimo_uso[id(conn)] = time.monotonic()
+            # putconn hace rollback de cualquier transacción que haya quedado abierta
+            self._pool.putconn(conn, close=conn.closed != 0)
+            with self._lock:
+                self._en_uso -= 1
+                self._uso_total += uso
+                self._uso_max = max(self._uso_max, uso)
+            self._cupos.release()
+
+    @property
+    def en_uso(self) -> int:
+        return self._en_uso
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            checkouts = self._checkouts or 1
+            return {
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "en_uso": self._en_uso,
+                "conexiones_abiertas": self._pool.conexiones_abiertas,
+                "conexiones_descartadas": self._descartadas,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "espera_media_ms": round(self._espera_total / checkouts * 1000, 3),
+                "espera_max_ms": round(self._espera_max * 1000, 3),
+                "uso_medio_ms": round(self._uso_total / checkouts * 1000, 3),
+                "uso_max_ms": round(self._uso_max * 1000, 3),
+            }
+
+    def cerrar(self):
+        self._pool.closeall()
+
+
+_pool = None
+
+
+def iniciar_pool(dsn: str, connection_factory=None) -> PoolConexiones:
+    """Crea el pool global a partir de las variables de entorno DB_POOL_*.
+
+    `connection_factory` se pasa a psycopg2.connect (p. ej. metricas.conexion_medida),
+    o a motor_sqlite.conectar si DATABASE_URL es sqlite:///.
+    """
+    global _pool
+    if _pool is None:
+        _pool = PoolConexiones(
+            dsn,
+            minimo=int(os.environ.get("DB_POOL_MIN", 1)),
+            maximo=int(os.environ.get("DB_POOL_MAX", 10)),
+            espera=float(os.environ.get("DB_POOL_ESPERA", 5)),
+            chequeo_inactividad=float(os.environ.get("DB_POOL_CHEQUEO", 30)),
+            connection_factory=connection_factory,
+        )
+    return _pool
+
+
+def cerrar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.cerrar()
+        _pool = None
+
+
+@contextmanager
+def obtener_conexion():
+    """Obtiene una conexión del pool global (hay que llamar antes a iniciar_pool)."""
+    if _pool is None:
+        raise RuntimeError("El pool de conexiones no está iniciado")
+    with _pool.conexion() as conn:
+        yield conn
+
+
+def estadisticas_pool() -> dict:
+    return _pool.estadisticas() if _pool is not None else {}
+
+
+def es_sqlite(obj) -> bool:
+    """True si la conexión (o el cursor) es del motor SQLite embebido."""
+    return getattr(obj, "motor", None) == "sqlite"
+
+
+def conectar(dsn: str = None, connection_factory=None):
+    """Conexión suelta, fuera del pool (scripts de línea de comandos)."""
+    dsn = dsn or os.environ.get("DATABASE_URL")
+    if motor_sqlite.es_url(dsn):
+        return motor_sqlite.conectar(dsn, connection_factory)
+    return psycopg2.connect(dsn, connection_factory=connection_factory)
+
+
+def como_dicts(cursor) -> list:
+    """Filas del último SELECT como dicts, a partir de tuplas (sin DictRow intermedio)."""
+    nombres = [columna.name for columna in cursor.description]
+    return [dict(zip(nombres, fila)) for fila in cursor.fetchall()]
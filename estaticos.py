@@ -0,0 +1,272 @@
+"""Archivos estáticos con huella, caché de larga duración y variantes precomprimidas.
+
+- `url_estatico("style.css")` devuelve `/static/style.css?v=<hash>`; las
+  plantillas lo usan como `{{ estatico("style.css") }}`. Con la huella
+  correcta el navegador puede guardar el archivo un año sin revalidar.
+- Las subidas nunca se sobrescriben (nombre por hash o uuid4), así que
+  también se sirven como inmutables.
+- Si existe `archivo.br` o `archivo.gz` (ver `precomprimir`) y el cliente lo
+  acepta, se envía esa variante con su Content-Encoding.
+- Se responden peticiones condicionales (ETag/Last-Modified -> 304) y de
+  rango simple (Range: bytes=inicio-fin -> 206).
+
+Uso desde la línea de comandos:
+    python estaticos.py      # genera las variantes .gz/.br de CSS y JS
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+import anyio
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él sólo hay variantes gzip
+    brotli = None
+
+DIRECTORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+PREFIJO_URL = "/static/"
+COMPRIMIBLES = (".css", ".js", ".svg", ".json", ".txt")
+TAM_BLOQUE = 64 * 1024
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "public, no-cache"
+
+_huellas = {}
+_lock_huellas = threading.Lock()
+
+RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def codificaciones_aceptadas(accept_encoding: str) -> set:
+    """Codificaciones de Accept-Encoding con q > 0, p. ej. {'br', 'gzip'}."""
+    aceptadas = set()
+    for parte in (accept_encoding or "").split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            aceptadas.add(nombre)
+    return aceptadas
+
+
+def etiqueta_codificada(etiqueta: str, codificacion: str) -> str:
+    """ETag de la variante comprimida: '"abc"' -> '"abc-gzip"' (cada codificación es otra representación).
+
+    Acepta también etiquetas sin comillas ('abc', como las de FileResponse) y
+    devuelve siempre una entre comillas, conservando el prefijo W/.
+    """
+    debil = etiqueta.startswith("W/")
+    valor = (etiqueta[2:] if debil else etiqueta).strip('"')
+    return f'{"W/" if debil else ""}"{valor}-{codificacion}"'
+
+
+def etiqueta_archivo(estado: os.stat_result) -> str:
+    """ETag entre comillas de un archivo (FileResponse de starlette 0.27 la envía sin ellas)."""
+    return '"' + hashlib.md5(f"{estado.st_mtime}-{estado.st_size}".encode()).hexdigest() + '"'
+
+
+def _sin_codificacion(etiqueta: str) -> str:
+    etiqueta = etiqueta.strip()
+    if etiqueta.startswith("W/"):
+        etiqueta = etiqueta[2:]
+    for sufijo in ('-gzip"', '-br"'):
+        if etiqueta.endswith(sufijo):
+            return etiqueta[:-len(sufijo)] + '"'
+    return etiqueta
+
+
+def etiqueta_coincide(if_none_match: str, etiqueta: str):
+    """La etiqueta de If-None-Match que coincide con `etiqueta` (comparación débil, sin sufijo de codificación)."""
+    for candidata in (if_none_match or "").split(","):
+        candidata = candidata.strip()
+        if candidata == "*" or (candidata and _sin_codificacion(candidata) == _sin_codificacion(etiqueta)):
+            return etiqueta if candidata == "*" else candidata
+    return None
+
+
+def huella(ruta: str, directorio: str = DIRECTORIO) -> str:
+    """Primeros 12 caracteres del SHA-256 del archivo; se recalcula sólo si cambia su mtime o tamaño."""
+    completa = os.path.join(directorio, ruta)
+    estado = os.stat(completa)
+    clave = (completa, estado.st_mtime_ns, estado.st_size)
+    with _lock_huellas:
+        valor = _huellas.get(clave)
+    if valor is None:
+        resumen = hashlib.sha256()
+        with open(completa, "rb") as archivo:
+            for bloque in iter(lambda: archivo.read(TAM_BLOQUE), b""):
+                resumen.update(bloque)
+        valor = resumen.hexdigest()[:12]
+        with _lock_huellas:
+            _huellas[clave] = valor
+    return valor
+
+
+def url_estatico(ruta: str) -> str:
+    try:
+        return f"{PREFIJO_URL}{ruta}?v={huella(ruta)}"
+    except FileNotFoundError:
+        return PREFIJO_URL + ruta
+
+
+def precomprimir(directorio: str = DIRECTORIO) -> int:
+    """Genera `.gz` (y `.br` si hay brotli) de los CSS/JS que no la tengan o la tengan antigua."""
+    generadas = 0
+    for raiz, carpetas, archivos in os.walk(directorio):
+        carpetas[:] = [c for c in carpetas if c != "uploads"]
+        for nombre in archivos:
+            if not nombre.endswith(COMPRIMIBLES):
+                continue
+            ruta = os.path.join(raiz, nombre)
+            with open(ruta, "rb") as archivo:
+                datos = None
+                for extension, comprimir in ((".gz", _gzip), (".br", _brotli)):
+                    if comprimir is None or not _anticuada(ruta, ruta + extension):
+                        continue
+                    if datos is None:
+                        datos = archivo.read()
+                    temporal = ruta + extension + ".tmp"
+                    with open(temporal, "wb") as destino:
+                        destino.write(comprimir(datos))
+                    os.replace(temporal, ruta + extension)
+                    generadas += 1
+    return generadas
+
+
+def _gzip(datos: bytes) -> bytes:
+    return gzip.compress(datos, compresslevel=9, mtime=0)
+
+
+_brotli = (lambda datos: brotli.compress(datos, quality=11)) if brotli else None
+
+
+def _anticuada(original: str, variante: str) -> bool:
+    try:
+        return os.path.getmtime(variante) < os.path.getmtime(original)
+    except FileNotFoundError:
+        return True
+
+
+class RespuestaRango(Response):
+    """Respuesta 206 que envía sólo el tramo [inicio, fin] del archivo, por bloques."""
+
+    def __init__(self, ruta: str, inicio: int, fin: int, cabeceras: dict):
+        self.ruta = ruta
+        self.inicio = inicio
+        self.fin = fin
+        super().__init__(status_code=206, headers={**cabeceras, "content-length": str(fin - inicio + 1)})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        restante = self.fin - self.inicio + 1
+        async with await anyio.open_file(self.ruta, "rb") as archivo:
+            await archivo.seek(self.inicio)
+            while restante > 0:
+                bloque = await archivo.read(min(TAM_BLOQUE, restante))
+                if not bloque:
+                    break
+                restante -= len(bloque)
+                await send({"type": "http.response.body", "body": bloque, "more_body": restante > 0})
+        if restante > 0:
+            await send({"type": "http.response.body", "body": b""})
+
+
+class ArchivosEstaticos(StaticFiles):
+    """StaticFiles con Cache-Control según huella, variantes precomprimidas y rangos."""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        cabeceras = Headers(scope=scope)
+        ruta = self.get_path(scope).replace(os.sep, "/")
+        comprimible = str(full_path).endswith(COMPRIMIBLES)
+
+        servido, estado, codificacion = str(full_path), stat_result, None
+        if comprimible and status_code == 200 and "range" not in cabeceras:
+            aceptadas = codificaciones_aceptadas(cabeceras.get("accept-encoding", ""))
+            for nombre, extension in (("br", ".br"), ("gzip", ".gz")):
+                variante = str(full_path) + extension
+                if nombre in aceptadas and not _anticuada(str(full_path), variante):
+                    servido, estado, codificacion = variante, os.stat(variante), nombre
+                    break
+
+        # La ETag sale del original: la variante precomprimida lleva la misma con el sufijo de su codificación
+        etiqueta = etiqueta_archivo(stat_result)
+        if codificacion:
+            etiqueta = etiqueta_codificada(etiqueta, codificacion)
+        respuesta = FileResponse(
+            servido, status_code=status_code, stat_result=estado, method=scope["method"],
+            media_type=mimetypes.guess_type(str(full_path))[0] or "text/plain",
+            headers={"etag": etiqueta}
+        )
+        respuesta.headers["accept-ranges"] = "bytes"
+        respuesta.headers["cache-control"] = self._politica_cache(ruta, scope)
+        if comprimible:
+            respuesta.headers["vary"] = "Accept-Encoding"
+        if codificacion:
+            respuesta.headers["content-encoding"] = codificacion
+
+        if self.is_not_modified(respuesta.headers, cabeceras):
+            return NotModifiedResponse(respuesta.headers)
+        if "range" in cabeceras and codificacion is None and status_code == 200:
+            return self._rango(servido, estado.st_size, cabeceras, respuesta)
+        return respuesta
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        # La compresión al vuelo añade -gzip/-br a la ETag: se compara sin el sufijo
+        if "if-none-match" in request_headers and "etag" in response_headers:
+            return etiqueta_coincide(request_headers["if-none-match"], response_headers["etag"]) is not None
+        return super().is_not_modified(response_headers, request_headers)
+
+    def _politica_cache(self, ruta: str, scope) -> str:
+        if ruta.startswith("uploads/"):
+            return CACHE_INMUTABLE
+        version = QueryParams(scope.get("query_string", b"")).get("v")
+        try:
+            if version and version == huella(ruta, self.directory):
+                return CACHE_INMUTABLE
+        except FileNotFoundError:
+            pass
+        return CACHE_REVALIDAR
+
+    def _rango(self, ruta: str, total: int, cabeceras: Headers, completa: Response) -> Response:
+        si_rango = cabeceras.get("if-range")
+        if si_rango and si_rango not in (completa.headers.get("etag"), completa.headers.get("last-modified")):
+            return completa
+        coincidencia = RANGO.match(cabeceras["range"].strip())
+        if not coincidencia or coincidencia.groups() == ("", ""):
+            return completa  # varios rangos o sintaxis desconocida: se envía el archivo entero
+        inicio, fin = coincidencia.groups()
+        if inicio == "":
+            inicio, fin = max(0, total - int(fin)), total - 1
+        else:
+            if fin and int(fin) < int(inicio):
+                return completa  # bytes=5-2 no es un rango válido: se ignora la cabecera (RFC 9110)
+            inicio, fin = int(inicio), min(int(fin) if fin else total - 1, total - 1)
+        if inicio >= total:
+            return Response(status_code=416, headers={"content-range": f"bytes */{total}"})
+        base = {clave: valor for clave, valor in completa.headers.items() if clave != "content-length"}
+        base["content-range"] = f"bytes {inicio}-{fin}/{total}"
+        return RespuestaRango(ruta, inicio, fin, base)
+
+
+if __name__ == "__main__":
+    print(f"{precomprimir()} variantes comprimidas generadas")
+    sys.exit(0)
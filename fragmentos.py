@@ -0,0 +1,52 @@
+"""Fragmentos HTML de la página principal, renderizados una vez y guardados en la caché.
+
+Cada elemento del catálogo (su tarjeta y su formulario de edición) se renderiza
+por separado y se guarda bajo la clave (id, version de la fila) en el espacio
+de su tabla, así que cualquier escritura que invalide ese espacio lo descarta.
+Las listas de consolas y accesorios de los <select> se renderizan una sola vez
+por página en un bloque <template> compartido, en vez de repetirse en cada
+formulario de edición.
+"""
+from markupsafe import Markup
+
+# tabla -> (plantilla, nombre de la variable en la plantilla)
+PLANTILLAS = {
+    "juegos": ("fragmentos/juego.html", "juego"),
+    "consolas": ("fragmentos/consola.html", "consola"),
+    "accesorios": ("fragmentos/accesorio.html", "accesorio"),
+}
+
+
+class RenderizadorFragmentos:
+    """Renderiza fragmentos con el entorno Jinja de la aplicación y los cachea por versión."""
+
+    def __init__(self, entorno, cache, guardar=None):
+        self.entorno = entorno
+        self.cache = cache
+        self.guardar = guardar  # como en Cache.obtener: si es falso, el fragmento se renderiza sin guardarlo
+
+    def fragmento(self, tabla: str, item: dict) -> Markup:
+        plantilla, variable = PLANTILLAS[tabla]
+        clave = f"fragmento:{item['id']}:{item.get('version')}"
+        html = self.cache.obtener(
+            tabla, clave,
+            lambda: self.entorno.get_template(plantilla).render({variable: item}),
+            guardar=self.guardar
+        )
+        return Markup(html)
+
+    def opciones(self, tabla: str, opciones: list, etiqueta: str) -> Markup:
+        """Bloque de <option> compartido; `etiqueta` es la columna que va entre paréntesis."""
+        def renderizar():
+            return self.entorno.from_string(
+                "{% for o in opciones %}"
+                "<option value=\"{{ o.id }}\">{{ o.nombre }} ({{ o[etiqueta] }})</option>\n"
+                "{% endfor %}"
+            ).render(opciones=opciones, etiqueta=etiqueta)
+        return Markup(self.cache.obtener(tabla, f"fragmento:opciones:{etiqueta}", renderizar, guardar=self.guardar))
+
+    def registrar(self, entorno=None):
+        """Expone `fragmento` y `opciones` como funciones globales de las plantillas."""
+        entorno = entorno or self.entorno
+        entorno.globals["fragmento"] = self.fragmento
+        entorno.globals["opciones"] = self.opciones
@@ -0,0 +1,459 @@
+"""Historial de actividad: registro diferido, particiones mensuales, retención y consultas.
+
+- Los eventos se encolan y se insertan por lotes (`HistorialDiferido`).
+- La tabla está particionada por mes sobre `fecha` (ver la migración 12):
+  `asegurar_particiones` crea las de los próximos meses y `archivar` vuelca a
+  CSV comprimido y elimina las que superan la retención.
+- `consultar` filtra por tipo_objeto, objeto_id, accion y rango de fechas
+  con paginación por keyset sobre (fecha, id); `exportar_lineas` recorre el
+  mismo filtro con un cursor de servidor.
+
+Con SQLite la tabla no está particionada: `archivar` vuelca por meses las
+filas anteriores a la retención y las borra con DELETE.
+
+Uso desde la línea de comandos:
+    python historial.py particiones           # crea las particiones de los próximos meses
+    python historial.py archivar --meses 12   # archiva y elimina las anteriores a la retención
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+
+import psycopg2.extras
+
+import db
+from db import como_dicts
+from paginacion import CursorInvalido, codificar_cursor, decodificar_cursor
+import versiones
+
+logger = logging.getLogger(__name__)
+
+PARTICION = re.compile(r"^historial_(\d{4})_(\d{2})$")
+PARTICION_DEFECTO = "historial_defecto"
+MESES_ADELANTE = 2
+DIRECTORIO_ARCHIVO = os.environ.get(
+    "HISTORIAL_ARCHIVO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archivo_historial")
+)
+COLUMNAS = ("id", "accion", "detalles", "tipo_objeto", "objeto_id", "fecha")
+
+
+class HistorialDiferido:
+    """Cola acotada de eventos de historial que un hilo vuelca con INSERT multi-fila.
+
+    Si la cola está llena, `registrar` bloquea hasta `espera_encolar` segundos
+    (contrapresión) y, si sigue sin hueco, descarta el evento y lo contabiliza.
+    En modo síncrono cada evento se escribe en el momento, útil para pruebas.
+    """
+
+    def __init__(self, obtener_conexion, tam_lote: int = 200, intervalo: float = 1.0,
+                 capacidad: int = 10000, espera_encolar: float = 1.0, sincrono: bool = False):
+        self._obtener_conexion = obtener_conexion
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.espera_encolar = espera_encolar
+        self.sincrono = sincrono
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._parar = threading.Event()
+        self._hilo = None
+        self._lock_volcado = threading.Lock()
+        self.escritos = 0
+        self.descartados = 0
+        self.errores = 0
+        self.lotes = 0
+
+    def iniciar(self):
+        if self.sincrono or self._hilo is not None:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="historial-diferido", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        """Para el hilo de volcado y escribe todo lo que quede pendiente."""
+        if self._hilo is not None:
+            self._parar.set()
+            self._hilo.join()
+            self._hilo = None
+        self.vaciar()
+
+    def registrar(self, accion: str, detalles: str, tipo_objeto: str = None, objeto_id: int = None):
+        evento = (accion, detalles, tipo_objeto, objeto_id, datetime.now(timezone.utc))
+        if self.sincrono:
+            self._escribir([evento])
+            return
+        try:
+            self._cola.put(evento, timeout=self.espera_encolar)
+        except queue.Full:
+            self.descartados += 1
+            logger.warning("Historial lleno, evento descartado: %s - %s", accion, detalles)
+
+    def vaciar(self):
+        """Vuelca inmediatamente todos los eventos encolados."""
+        while True:
+            lote = self._sacar_lote()
+            if not lote:
+                return
+            self._escribir(lote)
+
+    def pendientes(self) -> int:
+        return self._cola.qsize()
+
+    def _sacar_lote(self, primero=None) -> list:
+        lote = [primero] if primero is not None else []
+        while len(lote) < self.tam_lote:
+            try:
+                lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            try:
+                primero = self._cola.get(timeout=self.intervalo)
+            except queue.Empty:
+                continue
+            # Deja acumular eventos hasta completar el lote o agotar el intervalo
+            if self._cola.qsize() < self.tam_lote - 1:
+                self._parar.wait(self.intervalo)
+            self._escribir(self._sacar_lote(primero))
+
+    def _escribir(self, lote: list):
+        with self._lock_volcado:
+            try:
+                with self._obtener_conexion() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        psycopg2.extras.execute_values(
+                            cursor,
+                            "INSERT INTO historial (accion, detalles, tipo_objeto, objeto_id, fecha) VALUES %s",
+                            lote,
+                            page_size=self.tam_lote
+                        )
+                        conn.commit()
+                        self.escritos += len(lote)
+                        self.lotes += 1
+                    finally:
+                        cursor.close()
+            except Exception:
+                self.descartados += len(lote)
+                self.errores += 1
+                logger.exception("Error al registrar en historial")
+
+    def estadisticas(self) -> dict:
+        return {
+            "pendientes": self.pendientes(),
+            "escritos": self.escritos,
+            "descartados": self.descartados,
+            "errores": self.errores,
+            "lotes": self.lotes,
+            "sincrono": self.sincrono,
+        }
+
+
+# --- Particiones y retención ---
+
+def _mes(fecha: datetime, desplazamiento: int = 0) -> datetime:
+    """Primer instante (UTC) del mes de `fecha` desplazado `desplazamiento` meses."""
+    indice = fecha.year * 12 + fecha.month - 1 + desplazamiento
+    return datetime(indice // 12, indice % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def particiones(cursor) -> list:
+    """Particiones mensuales existentes como (nombre, desde, hasta), de la más antigua a la más nueva."""
+    if db.es_sqlite(cursor):
+        return []
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'historial'::regclass
+    """)
+    resultado = []
+    for (nombre,) in cursor.fetchall():
+        coincidencia = PARTICION.match(nombre)
+        if coincidencia:
+            desde = datetime(int(coincidencia[1]), int(coincidencia[2]), 1, tzinfo=timezone.utc)
+            resultado.append((nombre, desde, _mes(desde, 1)))
+    return sorted(resultado, key=lambda p: p[1])
+
+
+def asegurar_particiones(cursor, desde: datetime = None, meses_adelante: int = MESES_ADELANTE) -> list:
+    """Crea las particiones mensuales de `desde` (por defecto, el mes actual) hasta `meses_adelante` meses después.
+
+    Si la partición por defecto ya tiene filas de ese mes, se mueven a la nueva.
+    """
+    if db.es_sqlite(cursor):
+        return []
+    ahora = datetime.now(timezone.utc)
+    mes, ultimo = _mes(desde or ahora), _mes(ahora, meses_adelante)
+    existentes = {nombre for nombre, _, _ in particiones(cursor)}
+    creadas = []
+    while mes <= ultimo:
+        nombre, siguiente = f"historial_{mes:%Y_%m}", _mes(mes, 1)
+        if nombre not in existentes:
+            cursor.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {PARTICION_DEFECTO} WHERE fecha >= %s AND fecha < %s)",
+                (mes, siguiente)
+            )
+            mover = cursor.fetchone()[0]
+            if mover:
+                cursor.execute(
+                    f"CREATE TEMP TABLE historial_movidas ON COMMIT DROP AS "
+                    f"SELECT * FROM {PARTICION_DEFECTO} WHERE fecha >= %s AND fecha < %s",
+                    (mes, siguiente)
+                )
+                cursor.execute(
+                    f"DELETE FROM {PARTICION_DEFECTO} WHERE fecha >= %s AND fecha < %s", (mes, siguiente)
+                )
+            cursor.execute(
+                f"CREATE TABLE {nombre} PARTITION OF historial FOR VALUES FROM (%s) TO (%s)",
+                (mes, siguiente)
+            )
+            if mover:
+                cursor.execute("INSERT INTO historial SELECT * FROM historial_movidas")
+                cursor.execute("DROP TABLE historial_movidas")
+            creadas.append(nombre)
+        mes = siguiente
+    return creadas
+
+
+def _volcar(cursor, consulta: str, ruta: str):
+    """COPY de `consulta` a un CSV comprimido con gzip, escrito primero a un temporal."""
+    temporal = ruta + ".tmp"
+    with gzip.open(temporal, "wb") as destino:
+        cursor.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER)", destino)
+    os.replace(temporal, ruta)
+
+
+def _volcar_filas(cursor, consulta: str, parametros: tuple, ruta: str):
+    """Como `_volcar`, pero leyendo las filas (motores sin COPY)."""
+    temporal = ruta + ".tmp"
+    cursor.execute(consulta, parametros)
+    with gzip.open(temporal, "wt", encoding="utf-8", newline="") as destino:
+        escritor = csv.writer(destino)
+        escritor.writerow([columna.name for columna in cursor.description])
+        for fila in cursor:
+            escritor.writerow(v.isoformat() if isinstance(v, datetime) else v for v in fila)
+    os.replace(temporal, ruta)
+
+
+def _archivar_sqlite(conn, limite: datetime, directorio: str) -> list:
+    """Un archivo por mes con filas anteriores a `limite`, que después se borran."""
+    archivos = []
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT strftime('%%Y_%%m', fecha) FROM historial WHERE fecha < %s ORDER BY 1", (limite,)
+        )
+        for (mes,) in cursor.fetchall():
+            desde = datetime(int(mes[:4]), int(mes[5:]), 1, tzinfo=timezone.utc)
+            ruta = os.path.join(directorio, f"historial_{mes}.csv.gz")
+            if os.path.exists(ruta):  # filas importadas después de archivar el mes
+                ruta = os.path.join(directorio, f"historial_{mes}_{datetime.now(timezone.utc):%Y%m%d%H%M%S}.csv.gz")
+            rango = (desde, min(_mes(desde, 1), limite))
+            _volcar_filas(
+                cursor, "SELECT * FROM historial WHERE fecha >= %s AND fecha < %s ORDER BY fecha, id", rango, ruta
+            )
+            cursor.execute("DELETE FROM historial WHERE fecha >= %s AND fecha < %s", rango)
+            conn.commit()
+            archivos.append(ruta)
+    return archivos
+
+
+def archivar(conn, retencion_meses: int, directorio: str = DIRECTORIO_ARCHIVO) -> list:
+    """Archiva en `directorio` y elimina las particiones anteriores a la retención; devuelve los archivos."""
+    if retencion_meses <= 0:
+        return []
+    os.makedirs(directorio, exist_ok=True)
+    limite = _mes(datetime.now(timezone.utc), -retencion_meses)
+    if db.es_sqlite(conn):
+        return _archivar_sqlite(conn, limite, directorio)
+    archivos = []
+    with conn.cursor() as cursor:
+        for nombre, _, hasta in particiones(cursor):
+            if hasta > limite:
+                break
+            ruta = os.path.join(directorio, f"{nombre}.csv.gz")
+            _volcar(cursor, f"SELECT * FROM {nombre} ORDER BY fecha, id", ruta)
+            cursor.execute(f"ALTER TABLE historial DETACH PARTITION {nombre}")
+            cursor.execute(f"DROP TABLE {nombre}")
+            versiones.incrementar(cursor, "historial")  # DETACH y DROP no disparan los triggers
+            conn.commit()
+            archivos.append(ruta)
+
+        # Filas antiguas que cayeron en la partición por defecto (p. ej. importadas con fechas pasadas)
+        fecha_limite = cursor.mogrify("%s", (limite,)).decode()
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {PARTICION_DEFECTO} WHERE fecha < {fecha_limite})")
+        if cursor.fetchone()[0]:
+            ruta = os.path.join(directorio, f"{PARTICION_DEFECTO}_{limite:%Y_%m}.csv.gz")
+            _volcar(cursor, f"SELECT * FROM {PARTICION_DEFECTO} WHERE fecha < {fecha_limite} ORDER BY fecha, id", ruta)
+            cursor.execute(f"DELETE FROM {PARTICION_DEFECTO} WHERE fecha < {fecha_limite}")
+            versiones.incrementar(cursor, "historial")
+            conn.commit()
+            archivos.append(ruta)
+    return archivos
+
+
+class MantenimientoHistorial:
+    """Hilo que cada `intervalo` segundos crea las particiones futuras y archiva las caducadas."""
+
+    def __init__(self, obtener_conexion, intervalo: float, retencion_meses: int,
+                 directorio: str = DIRECTORIO_ARCHIVO):
+        self._obtener_conexion = obtener_conexion
+        self.intervalo = intervalo
+        self.retencion_meses = retencion_meses
+        self.directorio = directorio
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        if self.intervalo <= 0 or self._hilo is not None:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="mantenimiento-historial", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if self._hilo is not None:
+            self._parar.set()
+            self._hilo.join()
+            self._hilo = None
+
+    def ejecutar(self):
+        with self._obtener_conexion() as conn:
+            with conn.cursor() as cursor:
+                creadas = asegurar_particiones(cursor)
+            conn.commit()
+            archivos = archivar(conn, self.retencion_meses, self.directorio)
+        if creadas or archivos:
+            logger.info("Historial: %d particiones creadas, %d archivadas", len(creadas), len(archivos))
+
+    def _bucle(self):
+        # La primera pasada es inmediata para tener ya las particiones del mes
+        while not self._parar.is_set():
+            try:
+                self.ejecutar()
+            except Exception:
+                logger.exception("Error en el mantenimiento del historial")
+            self._parar.wait(self.intervalo)
+
+
+# --- Consultas ---
+
+def _filtros(tipo_objeto=None, objeto_id=None, accion=None, desde=None, hasta=None):
+    condiciones, parametros = [], []
+    for condicion, valor in (
+        ("tipo_objeto = %s", tipo_objeto),
+        ("objeto_id = %s", objeto_id),
+        ("accion = %s", accion),
+        ("fecha >= %s", desde),
+        ("fecha < %s", hasta),
+    ):
+        if valor is not None:
+            condiciones.append(condicion)
+            parametros.append(valor)
+    return condiciones, parametros
+
+
+def consultar(cursor, limite: int = 50, token: str = None, **filtros):
+    """Una página del historial, de la más reciente a la más antigua; devuelve (filas, token_siguiente o None)."""
+    condiciones, parametros = _filtros(**filtros)
+    sqlite = db.es_sqlite(cursor)
+    if token:
+        fecha, id_ = decodificar_cursor(token, "fecha")
+        if sqlite:
+            try:
+                fecha = datetime.fromisoformat(fecha)  # se compara como texto, en el formato de CURRENT_TIMESTAMP
+            except (TypeError, ValueError) as e:
+                raise CursorInvalido("Cursor inválido") from e
+        condiciones.append("(fecha, id) < (%s, %s)")
+        parametros.extend([fecha, id_])
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    formato = "strftime('%%Y-%%m-%%d %%H:%%M:%%S', fecha)" if sqlite else "to_char(fecha, 'YYYY-MM-DD HH24:MI:SS')"
+    cursor.execute(
+        f"""
+        SELECT id, accion, detalles, tipo_objeto, objeto_id,
+               {formato} AS fecha, fecha AS marca
+        FROM historial {where}
+        ORDER BY fecha DESC, id DESC
+        LIMIT %s
+        """,
+        parametros + [limite + 1]
+    )
+    filas = como_dicts(cursor)
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor("fecha", filas[-1]["marca"], filas[-1]["id"])
+    for fila in filas:
+        del fila["marca"]
+    return filas, siguiente
+
+
+def exportar_lineas(conn, formato: str, tam_bloque: int = 2000, **filtros):
+    """Genera el historial filtrado en CSV o NDJSON por bloques, con un cursor de servidor."""
+    condiciones, parametros = _filtros(**filtros)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    cursor = conn.cursor(name="exportar_historial")
+    cursor.itersize = tam_bloque
+    try:
+        cursor.execute(
+            f"SELECT {', '.join(COLUMNAS)} FROM historial {where} ORDER BY fecha DESC, id DESC", parametros
+        )
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        if formato == "csv":
+            escritor.writerow(COLUMNAS)
+        pendientes = 0
+        for fila in cursor:
+            fila = fila[:-1] + (fila[-1].isoformat() if fila[-1] else None,)
+            if formato == "csv":
+                escritor.writerow(fila)
+            else:
+                buffer.write(json.dumps(dict(zip(COLUMNAS, fila)), ensure_ascii=False))
+                buffer.write("\n")
+            pendientes += 1
+            if pendientes >= tam_bloque:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+                pendientes = 0
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Mantenimiento de las particiones del historial")
+    parser.add_argument("accion", choices=["particiones", "archivar"])
+    parser.add_argument("--meses", type=int, default=int(os.environ.get("HISTORIAL_RETENCION_MESES", 12)),
+                        help="Meses completos de historial que se conservan en la base de datos")
+    parser.add_argument("--directorio", default=DIRECTORIO_ARCHIVO)
+    args = parser.parse_args(argv)
+
+    conn = db.conectar(os.environ.get("DATABASE_URL"))
+    try:
+        with conn.cursor() as cursor:
+            creadas = asegurar_particiones(cursor)
+        conn.commit()
+        print(f"{len(creadas)} particiones creadas")
+        if args.accion == "archivar":
+            for ruta in archivar(conn, args.meses, args.directorio):
+                print(f"Archivado: {ruta}")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
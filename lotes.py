@@ -0,0 +1,207 @@
+"""Creación, actualización y borrado por lotes de juegos, consolas y accesorios.
+
+Un lote se aplica en una sola transacción y con una sentencia por operación,
+no por elemento: un INSERT multi-fila, un UPDATE ... FROM (VALUES ...), un
+DELETE ... = ANY y una sincronización de compatibilidades para todos los
+elementos tocados. Las referencias se comprueban antes con una consulta por
+tabla; los elementos que no se pueden aplicar (referencias inexistentes, ids
+que no existen o repetidos) se informan uno a uno y no impiden aplicar el
+resto.
+
+Un elemento a actualizar con `version` sólo se aplica si la fila sigue en esa
+versión (ver concurrencia.py); si no, se informa con estado 412.
+"""
+import psycopg2.extras
+
+import compatibilidad
+
+# tipo -> columnas editables (con el cast que necesitan en VALUES), referencias (campo -> tabla) y textos
+ENTIDADES = {
+    "juegos": {
+        "columnas": {"nombre": "", "genero": "", "año": "::integer", "desarrollador": ""},
+        "referencias": {"consolas": "consolas", "accesorios": "accesorios"},
+        "tipo_objeto": "juego",
+        "no_encontrado": "Juego no encontrado",
+    },
+    "consolas": {
+        "columnas": {"nombre": "", "fabricante": "", "año_lanzamiento": "::integer"},
+        "referencias": {},
+        "tipo_objeto": "consola",
+        "no_encontrado": "Consola no encontrada",
+    },
+    "accesorios": {
+        "columnas": {"nombre": "", "tipo": ""},
+        "referencias": {"compatible_con": "consolas"},
+        "tipo_objeto": "accesorio",
+        "no_encontrado": "Accesorio no encontrado",
+    },
+}
+
+MAX_NOMBRES_HISTORIAL = 10
+
+
+def _error(operacion: str, indice: int, id_, estado: int, mensaje: str) -> dict:
+    return {"operacion": operacion, "indice": indice, "id": id_, "estado": estado, "error": mensaje}
+
+
+def _referencias_invalidas(cursor, tipo: str, elementos: list) -> dict:
+    """{posición en `elementos`: mensaje} de los que apuntan a ids que no existen (una consulta por tabla)."""
+    invalidas = {}
+    for campo, tabla in ENTIDADES[tipo]["referencias"].items():
+        pedidos = {i for elemento in elementos for i in elemento[campo]}
+        if not pedidos:
+            continue
+        cursor.execute(f"SELECT id FROM {tabla} WHERE id = ANY(%s)", (sorted(pedidos),))
+        faltan = pedidos - {fila[0] for fila in cursor.fetchall()}
+        for posicion, elemento in enumerate(elementos):
+            desconocidos = sorted(set(elemento[campo]) & faltan)
+            if desconocidos:
+                mensaje = f"{campo} inexistentes: {', '.join(map(str, desconocidos))}"
+                invalidas[posicion] = f"{invalidas[posicion]}; {mensaje}" if posicion in invalidas else mensaje
+    return invalidas
+
+
+def _crear(cursor, tipo: str, elementos: list) -> list:
+    columnas = list(ENTIDADES[tipo]["columnas"])
+    filas = psycopg2.extras.execute_values(
+        cursor,
+        f"INSERT INTO {tipo} ({', '.join(columnas)}) VALUES %s RETURNING id",
+        [tuple(elemento[c] for c in columnas) for elemento in elementos],
+        page_size=len(elementos),
+        fetch=True
+    )
+    # Los ids de una misma sentencia se asignan en el orden de VALUES
+    return sorted(fila[0] for fila in filas)
+
+
+def _actualizar(cursor, tipo: str, elementos: list) -> set:
+    columnas = ENTIDADES[tipo]["columnas"]
+    asignaciones = ", ".join(f"{c} = v.{c}" for c in columnas)
+    plantilla = "(%s::integer, " + ", ".join(f"%s{cast}" for cast in columnas.values()) + ")"
+    filas = psycopg2.extras.execute_values(
+        cursor,
+        f"""
+        WITH v (id_lote, {', '.join(columnas)}) AS (VALUES %s)
+        UPDATE {tipo} AS t SET {asignaciones}, version = t.version + 1, fecha_actualizacion = CURRENT_TIMESTAMP
+        FROM v WHERE t.id = v.id_lote
+        RETURNING id
+        """,
+        [(elemento["id"],) + tuple(elemento[c] for c in columnas) for elemento in elementos],
+        template=plantilla,
+        page_size=len(elementos),
+        fetch=True
+    )
+    return {fila[0] for fila in filas}
+
+
+def procesar(cursor, tipo: str, crear: list, actualizar: list, eliminar: list) -> dict:
+    """Aplica el lote (dicts de los modelos *Base/*Update e ids a eliminar) sin confirmar la transacción.
+
+    Devuelve los resultados por elemento, los nombres para el historial y, para
+    la matriz de compatibilidad, las relaciones finales de los elementos tocados.
+    """
+    entidad = ENTIDADES[tipo]
+    resultados = []
+    nombres = {"creados": [], "actualizados": [], "eliminados": []}
+
+    invalidas = _referencias_invalidas(cursor, tipo, crear + actualizar)
+    validos_crear = []
+    for indice, elemento in enumerate(crear):
+        if indice in invalidas:
+            resultados.append(_error("crear", indice, None, 400, invalidas[indice]))
+        else:
+            validos_crear.append((indice, elemento))
+
+    anteriores = {}
+    if actualizar:
+        # Bloquea las filas hasta el final del lote y recupera los nombres previos y las versiones
+        cursor.execute(
+            f"SELECT id, nombre, version FROM {tipo} WHERE id = ANY(%s) FOR UPDATE",
+            (sorted({elemento["id"] for elemento in actualizar}),)
+        )
+        anteriores = {fila[0]: (fila[1], fila[2]) for fila in cursor.fetchall()}
+    validos_actualizar, vistos = [], set()
+    for indice, elemento in enumerate(actualizar, start=len(crear)):
+        id_ = elemento["id"]
+        posicion = indice - len(crear)
+        if id_ not in anteriores:
+            resultados.append(_error("actualizar", posicion, id_, 404, entidad["no_encontrado"]))
+        elif id_ in vistos:
+            resultados.append(_error("actualizar", posicion, id_, 400, "Id repetido en el lote"))
+        elif indice in invalidas:
+            resultados.append(_error("actualizar", posicion, id_, 400, invalidas[indice]))
+        elif elemento.get("version") is not None and elemento["version"] != anteriores[id_][1]:
+            resultados.append(_error(
+                "actualizar", posicion, id_, 412,
+                f"El elemento ha cambiado (versión actual {anteriores[id_][1]}); vuelve a cargarlo"
+            ))
+        else:
+            vistos.add(id_)
+            validos_actualizar.append((posicion, elemento))
+
+    deseado = {}
+    if validos_crear:
+        ids = _crear(cursor, tipo, [elemento for _, elemento in validos_crear])
+        for (indice, elemento), id_ in zip(validos_crear, ids):
+            resultados.append({"operacion": "crear", "indice": indice, "id": id_, "estado": 201})
+            nombres["creados"].append(elemento["nombre"])
+            deseado[id_] = elemento
+    if validos_actualizar:
+        actualizados = _actualizar(cursor, tipo, [elemento for _, elemento in validos_actualizar])
+        for posicion, elemento in validos_actualizar:
+            id_ = elemento["id"]
+            if id_ not in actualizados:
+                resultados.append(_error("actualizar", posicion, id_, 404, entidad["no_encontrado"]))
+                continue
+            resultados.append({"operacion": "actualizar", "indice": posicion, "id": id_, "estado": 200})
+            nombres["actualizados"].append(f"{anteriores[id_][0]} -> {elemento['nombre']}")
+            deseado[id_] = elemento
+
+    eliminados = []
+    if eliminar:
+        cursor.execute(f"DELETE FROM {tipo} WHERE id = ANY(%s) RETURNING id, nombre", (sorted(set(eliminar)),))
+        borrados = {fila[0]: fila[1] for fila in cursor.fetchall()}
+        for posicion, id_ in enumerate(eliminar):
+            if id_ in borrados:
+                resultados.append({"operacion": "eliminar", "indice": posicion, "id": id_, "estado": 200})
+                nombres["eliminados"].append(borrados.pop(id_))
+                eliminados.append(id_)
+                deseado.pop(id_, None)
+            else:
+                resultados.append(_error("eliminar", posicion, id_, 404, entidad["no_encontrado"]))
+
+    relaciones = {}
+    if tipo == "juegos":
+        compatibilidad.sincronizar_juegos(
+            cursor, {id_: (e["consolas"], e["accesorios"]) for id_, e in deseado.items()}
+        )
+        relaciones = compatibilidad.pares_juegos(cursor, list(deseado))
+    elif tipo == "accesorios":
+        compatibilidad.sincronizar_accesorios(cursor, {id_: e["compatible_con"] for id_, e in deseado.items()})
+        relaciones = {id_: sorted(set(e["compatible_con"])) for id_, e in deseado.items()}
+
+    orden = {"crear": 0, "actualizar": 1, "eliminar": 2}
+    resultados.sort(key=lambda r: (orden[r["operacion"]], r["indice"]))
+    return {
+        "resultados": resultados,
+        "creados": len(nombres["creados"]),
+        "actualizados": len(nombres["actualizados"]),
+        "eliminados": len(eliminados),
+        "errores": sum(1 for r in resultados if "error" in r),
+        "nombres": nombres,
+        "relaciones": relaciones,
+        "ids_eliminados": eliminados,
+    }
+
+
+def detalle_historial(tipo: str, resumen: dict) -> str:
+    """Una sola línea de historial para todo el lote, con los primeros nombres de cada operación."""
+    partes = []
+    for clave in ("creados", "actualizados", "eliminados"):
+        lista = resumen["nombres"][clave]
+        texto = f"{len(lista)} {clave}"
+        if lista:
+            resto = len(lista) - MAX_NOMBRES_HISTORIAL
+            texto += f" ({', '.join(lista[:MAX_NOMBRES_HISTORIAL])}{f' y {resto} más' if resto > 0 else ''})"
+        partes.append(texto)
+    return f"Lote de {tipo}: {', '.join(partes)}, {resumen['errores']} errores"
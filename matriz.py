@@ -0,0 +1,250 @@
+"""Matriz de compatibilidad en memoria con bitsets por id.
+
+Cada consola, accesorio o par (consola, accesorio) tiene un entero de Python
+que hace de bitset de juegos (bit i = juego con id i), y cada accesorio un
+bitset de consolas. Las consultas de intersección ("juegos de la consola X
+con el accesorio Y", "consolas que admiten A y B") son ANDs de enteros.
+
+La matriz se carga completa una vez y después se actualiza por incrementos
+desde las escrituras. Va sincronizada con la generación del espacio
+"compatibilidad" de la caché: si otra escritura (una importación, otro
+worker con Redis) cambia la generación sin aplicar su cambio aquí, o si pasa
+el TTL de la caché, la siguiente lectura la recarga entera.
+"""
+import threading
+import time
+
+
+def sin_cambios(matriz):
+    """Cambio vacío: la escritura no afecta a la compatibilidad."""
+
+
+# Posiciones de los bits activos de cada byte, de mayor a menor
+_BITS_BYTE = [tuple(b for b in range(7, -1, -1) if byte >> b & 1) for byte in range(256)]
+
+
+def _ids(bits: int, limite: int = None) -> list:
+    """Ids de los bits activos, de mayor a menor; con `limite`, sólo los primeros.
+
+    Recorre los bytes del entero una sola vez: quitar bit a bit copiaría el
+    entero entero en cada paso (coste cuadrático con muchos ids).
+    """
+    ids = []
+    if bits <= 0:
+        return ids
+    datos = bits.to_bytes((bits.bit_length() + 7) // 8, "big")
+    ultimo = len(datos) - 1
+    for posicion, byte in enumerate(datos):
+        if not byte:
+            continue
+        base = (ultimo - posicion) * 8
+        for bit in _BITS_BYTE[byte]:
+            ids.append(base + bit)
+        if limite is not None and len(ids) >= limite:
+            return ids[:limite]
+    return ids
+
+
+def _pagina(bits: int, pagina: int = 1, limite: int = None) -> tuple:
+    """(total, ids de la página); sólo se recorren los bits hasta el final de la página."""
+    total = bin(bits).count("1")  # int.bit_count() es de Python 3.10
+    if limite is None:
+        return total, _ids(bits)
+    return total, _ids(bits, pagina * limite)[(pagina - 1) * limite:]
+
+
+def _interseccion(bitsets) -> int:
+    resultado = None
+    for bits in bitsets:
+        resultado = bits if resultado is None else resultado & bits
+        if not resultado:
+            return 0
+    return resultado or 0
+
+
+def _mover(indice: dict, antes: set, despues: set, bit: int):
+    """Quita `bit` de las claves que ya no lo tienen y lo pone en las nuevas."""
+    for clave in antes - despues:
+        restante = indice.get(clave, 0) & ~bit
+        if restante:
+            indice[clave] = restante
+        else:
+            indice.pop(clave, None)
+    for clave in despues - antes:
+        indice[clave] = indice.get(clave, 0) | bit
+
+
+class MatrizCompatibilidad:
+    def __init__(self, ttl: float = None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self.version = None
+        self.cargada = 0.0
+        self.recargas = 0
+        self._vaciar()
+
+    def _vaciar(self):
+        self._pares_juego = {}            # juego -> {(consola, accesorio o None)}
+        self._juegos_por_consola = {}     # consola -> bitset de juegos
+        self._juegos_por_accesorio = {}   # accesorio -> bitset de juegos
+        self._juegos_por_par = {}         # (consola, accesorio) -> bitset de juegos
+        self._consolas_por_accesorio = {}  # accesorio -> bitset de consolas
+        self._accesorios_por_consola = {}  # consola -> bitset de accesorios
+
+    # --- Carga y sincronización ---
+
+    def asegurar(self, version, cargar, al_dia=None):
+        """Recarga con `cargar()` -> (filas compatibilidad, filas accesorio_consola) si está desfasada.
+
+        Si `al_dia()` dice que lo cargado puede estar atrasado, se usa pero sin darlo por
+        válido para `version`: la siguiente consulta vuelve a cargar.
+        """
+        with self._lock:
+            caducada = self.ttl is not None and time.monotonic() - self.cargada > self.ttl
+            if self.version is not None and self.version == version and not caducada:
+                return
+            compatibles, accesorio_consola = cargar()
+            self._vaciar()
+            por_juego = {}
+            for juego_id, consola_id, accesorio_id in compatibles:
+                por_juego.setdefault(juego_id, set()).add((consola_id, accesorio_id))
+            for juego_id, pares in por_juego.items():
+                self._poner_juego(juego_id, pares)
+            por_accesorio = {}
+            for accesorio_id, consola_id in accesorio_consola:
+                por_accesorio.setdefault(accesorio_id, set()).add(consola_id)
+            for accesorio_id, consolas in por_accesorio.items():
+                self._poner_accesorio(accesorio_id, consolas)
+            self.version = version if al_dia is None or al_dia() else None
+            self.cargada = time.monotonic()
+            self.recargas += 1
+
+    def aplicar(self, version_previa, version_nueva, cambio=None):
+        """Aplica `cambio(matriz)` si la matriz estaba al día; si no (o sin cambio), fuerza recarga."""
+        with self._lock:
+            if cambio is None or self.version is None or self.version != version_previa:
+                self.version = None
+                return
+            cambio(self)
+            self.version = version_nueva
+
+    # --- Cambios incrementales ---
+
+    def poner_juego(self, juego_id: int, pares):
+        with self._lock:
+            self._poner_juego(juego_id, set(pares))
+
+    def poner_accesorio(self, accesorio_id: int, consolas):
+        with self._lock:
+            self._poner_accesorio(accesorio_id, set(consolas))
+
+    def eliminar_juego(self, juego_id: int):
+        with self._lock:
+            self._poner_juego(juego_id, set())
+
+    def eliminar_consola(self, consola_id: int):
+        with self._lock:
+            for juego_id in _ids(self._juegos_por_consola.get(consola_id, 0)):
+                pares = {p for p in self._pares_juego.get(juego_id, ()) if p[0] != consola_id}
+                self._poner_juego(juego_id, pares)
+            for accesorio_id in _ids(self._accesorios_por_consola.get(consola_id, 0)):
+                consolas = set(_ids(self._consolas_por_accesorio.get(accesorio_id, 0))) - {consola_id}
+                self._poner_accesorio(accesorio_id, consolas)
+
+    def eliminar_accesorio(self, accesorio_id: int):
+        with self._lock:
+            for juego_id in _ids(self._juegos_por_accesorio.get(accesorio_id, 0)):
+                pares = {p for p in self._pares_juego.get(juego_id, ()) if p[1] != accesorio_id}
+                self._poner_juego(juego_id, pares)
+            self._poner_accesorio(accesorio_id, set())
+
+    def _poner_juego(self, juego_id: int, pares: set):
+        anteriores = self._pares_juego.get(juego_id, set())
+        bit = 1 << juego_id
+        _mover(self._juegos_por_consola, {c for c, _ in anteriores}, {c for c, _ in pares}, bit)
+        _mover(
+            self._juegos_por_accesorio,
+            {a for _, a in anteriores if a is not None}, {a for _, a in pares if a is not None}, bit
+        )
+        _mover(
+            self._juegos_por_par,
+            {p for p in anteriores if p[1] is not None}, {p for p in pares if p[1] is not None}, bit
+        )
+        if pares:
+            self._pares_juego[juego_id] = pares
+        else:
+            self._pares_juego.pop(juego_id, None)
+
+    def _poner_accesorio(self, accesorio_id: int, consolas: set):
+        antes = set(_ids(self._consolas_por_accesorio.get(accesorio_id, 0)))
+        _mover(self._accesorios_por_consola, antes, consolas, 1 << accesorio_id)
+        bits = 0
+        for consola_id in consolas:
+            bits |= 1 << consola_id
+        if bits:
+            self._consolas_por_accesorio[accesorio_id] = bits
+        else:
+            self._consolas_por_accesorio.pop(accesorio_id, None)
+
+    # --- Consultas ---
+
+    # Devuelven (total, ids de la página) de mayor a menor; los ids se sacan del
+    # bitset fuera del lock (los enteros son inmutables)
+
+    def juegos(self, consolas=(), accesorios=(), pagina: int = 1, limite: int = None) -> tuple:
+        """Juegos compatibles con todas las consolas y accesorios dados (con ambos, por pares)."""
+        with self._lock:
+            if consolas and accesorios:
+                bitsets = [self._juegos_por_par.get((c, a), 0) for c in consolas for a in accesorios]
+            else:
+                bitsets = [self._juegos_por_consola.get(c, 0) for c in consolas]
+                bitsets += [self._juegos_por_accesorio.get(a, 0) for a in accesorios]
+            bits = _interseccion(bitsets)
+        return _pagina(bits, pagina, limite)
+
+    def consolas(self, accesorios=(), juegos=(), pagina: int = 1, limite: int = None) -> tuple:
+        """Consolas que admiten todos los accesorios dados y en las que funcionan todos los juegos dados."""
+        with self._lock:
+            bitsets = [self._consolas_por_accesorio.get(a, 0) for a in accesorios]
+            for juego_id in juegos:
+                bits = 0
+                for consola_id, _ in self._pares_juego.get(juego_id, ()):
+                    bits |= 1 << consola_id
+                bitsets.append(bits)
+            bits = _interseccion(bitsets)
+        return _pagina(bits, pagina, limite)
+
+    def accesorios(self, consolas=(), pagina: int = 1, limite: int = None) -> tuple:
+        """Accesorios compatibles con todas las consolas dadas."""
+        with self._lock:
+            bits = _interseccion(self._accesorios_por_consola.get(c, 0) for c in consolas)
+        return _pagina(bits, pagina, limite)
+
+    def de_juego(self, juego_id: int):
+        """(consolas directas, accesorios) de un juego, como conjuntos de ids."""
+        with self._lock:
+            pares = self._pares_juego.get(juego_id, ())
+            return ({c for c, a in pares if a is None}, {a for _, a in pares if a is not None})
+
+    def de_accesorio(self, accesorio_id: int) -> set:
+        with self._lock:
+            return set(_ids(self._consolas_por_accesorio.get(accesorio_id, 0)))
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "recargas": self.recargas,
+                "juegos": len(self._pares_juego),
+                "consolas": len(self._juegos_por_consola),
+                "accesorios": len(self._consolas_por_accesorio),
+                "pares": len(self._juegos_por_par),
+            }
+
+
+def cargar_filas(cursor):
+    """Filas para `MatrizCompatibilidad.asegurar`: dos consultas sobre las tablas de relación."""
+    cursor.execute("SELECT juego_id, consola_id, accesorio_id FROM compatibilidad")
+    compatibles = cursor.fetchall()
+    cursor.execute("SELECT accesorio_id, consola_id FROM accesorio_consola")
+    return compatibles, cursor.fetchall()
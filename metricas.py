@@ -0,0 +1,322 @@
+"""Métricas de la aplicación en formato de exposición de Prometheus.
+
+- `MiddlewareMetricas`: histograma de latencia por método, ruta (la plantilla
+  de la ruta, no la URL) y código de estado.
+- `conexion_medida`: connection_factory de psycopg2 cuyos cursores miden cada
+  sentencia, agrupada por su texto normalizado (literales sustituidos por ?),
+  y avisan por consola de las que superan el umbral de consulta lenta.
+  `conexion_sqlite_medida` es su equivalente para el motor SQLite.
+- `medir_plantillas`: tiempo de render de cada plantilla Jinja.
+- `registro.fuente(...)`: valores numéricos de los `estadisticas()` existentes
+  (pool, caché, historial...) leídos en cada consulta a /metrics.
+
+No depende de prometheus_client: el formato de texto es sencillo y así no hay
+que añadir otra dependencia.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+
+from jinja2 import Template
+from psycopg2.extensions import connection as _Conexion, cursor as _Cursor
+
+from motor_sqlite import ConexionSQLite, CursorSQLite
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SERIES = 500  # por métrica; las series nuevas por encima del límite se agrupan en "otras"
+CONSULTA_LENTA_MS = float(os.environ.get("METRICAS_CONSULTA_LENTA_MS", 0))
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres: tuple, valores: tuple, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, valores: tuple) -> tuple:
+        if valores not in self._series and len(self._series) >= MAX_SERIES:
+            return ("otras",) * len(self.etiquetas)
+        return valores
+
+    def lineas(self) -> list:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def sumar(self, *valores, cantidad: float = 1):
+        with self._lock:
+            clave = self._clave(valores)
+            self._series[clave] = self._series.get(clave, 0) + cantidad
+
+    def lineas(self) -> list:
+        with self._lock:
+            series = dict(self._series)
+        return super().lineas() + [
+            f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}" for clave, valor in sorted(series.items())
+        ]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets: tuple = BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = buckets
+
+    def observar(self, valor: float, *valores):
+        with self._lock:
+            clave = self._clave(valores)
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * len(self.buckets), 0.0, 0]
+            indice = bisect.bisect_left(self.buckets, valor)
+            if indice < len(self.buckets):
+                serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def lineas(self) -> list:
+        with self._lock:
+            series = {clave: (list(cuentas), suma, total) for clave, (cuentas, suma, total) in self._series.items()}
+        lineas = super().lineas()
+        for clave, (cuentas, suma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, cuenta in zip(self.buckets, cuentas):
+                acumulado += cuenta
+                le = 'le="%s"' % limite
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            le = 'le="+Inf"'
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {total}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {suma}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+        self._fuentes = []
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: tuple = ()) -> Contador:
+        metrica = Contador(nombre, ayuda, etiquetas)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets: tuple = BUCKETS_SEGUNDOS) -> Histograma:
+        metrica = Histograma(nombre, ayuda, etiquetas, buckets)
+        self._metricas.append(metrica)
+        return metrica
+
+    def fuente(self, prefijo: str, obtener):
+        """Expone como gauges los valores numéricos del dict que devuelve `obtener()` (los anidados, con _)."""
+        self._fuentes.append((prefijo, obtener))
+
+    def exponer(self) -> str:
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.lineas())
+        for prefijo, obtener in self._fuentes:
+            try:
+                valores = obtener()
+            except Exception:
+                logger.exception("Error al leer las métricas de %s", prefijo)
+                continue
+            for nombre, valor in _aplanar(prefijo, valores):
+                lineas.append(f"# TYPE {nombre} gauge")
+                lineas.append(f"{nombre} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+def _aplanar(prefijo: str, valores: dict):
+    for clave, valor in valores.items():
+        nombre = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefijo}_{clave}")
+        if isinstance(valor, bool):
+            yield nombre, int(valor)
+        elif isinstance(valor, (int, float)):
+            yield nombre, valor
+        elif isinstance(valor, dict):
+            yield from _aplanar(nombre, valor)
+
+
+registro = Registro()
+
+peticiones = registro.histograma(
+    "http_peticion_segundos", "Duración de las peticiones HTTP", ("metodo", "ruta", "estado")
+)
+consultas = registro.histograma("sql_consulta_segundos", "Duración de las sentencias SQL", ("sentencia",))
+consultas_lentas = registro.contador(
+    "sql_consultas_lentas_total", "Sentencias por encima de METRICAS_CONSULTA_LENTA_MS", ("sentencia",)
+)
+plantillas = registro.histograma("plantilla_render_segundos", "Tiempo de render de plantillas", ("plantilla",))
+conexiones = registro.contador("db_conexiones_abiertas_total", "Conexiones físicas abiertas con la base de datos")
+subidas_bytes = registro.contador("subidas_bytes_total", "Bytes de imágenes subidas")
+subidas = registro.histograma("subida_segundos", "Tiempo de escritura de una subida", ())
+
+
+# --- SQL ---
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+_LISTAS = re.compile(r"\((?:\s*\?\s*,)*\s*\?\s*\)(?:\s*,\s*\((?:\s*\?\s*,)*\s*\?\s*\))+")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_sql(sentencia) -> str:
+    """Texto de la sentencia sin literales ni parámetros, con las listas de VALUES colapsadas."""
+    if isinstance(sentencia, bytes):
+        sentencia = sentencia.decode("utf-8", "replace")
+    elif not isinstance(sentencia, str):
+        sentencia = str(sentencia)  # sql.Composed
+    texto = _ESPACIOS.sub(" ", _LITERALES.sub("?", sentencia)).strip()
+    return _LISTAS.sub("(...)", texto)[:300]
+
+
+def _registrar_sql(sentencia, inicio: float):
+    duracion = time.perf_counter() - inicio
+    texto = normalizar_sql(sentencia)
+    consultas.observar(duracion, texto)
+    if CONSULTA_LENTA_MS and duracion * 1000 >= CONSULTA_LENTA_MS:
+        consultas_lentas.sumar(texto)
+        logger.warning("Consulta lenta (%.1f ms): %s", duracion * 1000, texto)
+
+
+class _CursorMedido:
+    """Mezcla para cualquier clase de cursor: mide execute, executemany y COPY."""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _registrar_sql(query, inicio)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _registrar_sql(query, inicio)
+
+    def copy_expert(self, sql, file, size=8192):
+        inicio = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _registrar_sql(sql, inicio)
+
+
+_clases_medidas = {}
+
+
+def _clase_medida(clase):
+    medida = _clases_medidas.get(clase)
+    if medida is None:
+        medida = _clases_medidas[clase] = type(f"{clase.__name__}Medido", (_CursorMedido, clase), {})
+    return medida
+
+
+class conexion_medida(_Conexion):
+    """Conexión de psycopg2 cuyos cursores, de la clase que se pida, miden sus sentencias."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        conexiones.sumar()
+
+    def cursor(self, *args, **kwargs):
+        clase = kwargs.get("cursor_factory") or self.cursor_factory or _Cursor
+        kwargs["cursor_factory"] = _clase_medida(clase)
+        return super().cursor(*args, **kwargs)
+
+
+class conexion_sqlite_medida(ConexionSQLite):
+    """Conexión del motor SQLite cuyos cursores miden sus sentencias."""
+
+    clase_cursor = _clase_medida(CursorSQLite)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        conexiones.sumar()
+
+
+# --- Plantillas ---
+
+class PlantillaMedida(Template):
+    """Template de Jinja que registra el tiempo de render (también el de generate, hasta agotarlo)."""
+
+    def render(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            plantillas.observar(time.perf_counter() - inicio, self.name or "cadena")
+
+    def generate(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            yield from super().generate(*args, **kwargs)
+        finally:
+            plantillas.observar(time.perf_counter() - inicio, self.name or "cadena")
+
+
+def medir_plantillas(entorno):
+    """Hace que las plantillas que cargue `entorno` a partir de ahora midan su render."""
+    entorno.template_class = PlantillaMedida
+
+
+# --- HTTP ---
+
+class MiddlewareMetricas:
+    """Middleware ASGI que mide cada petición hasta el último bloque del cuerpo."""
+
+    # /api/cambios es un flujo SSE de larga duración: su "latencia" no dice nada
+    def __init__(self, app, excluir: tuple = ("/metrics", "/api/cambios")):
+        self.app = app
+        self.excluir = excluir
+        self._rutas = None
+
+    def _ruta(self, scope) -> str:
+        if self._rutas is None:
+            rutas = {}
+            for ruta in getattr(scope.get("app"), "routes", []):
+                destino = getattr(ruta, "endpoint", None) or getattr(ruta, "app", None)
+                rutas[destino] = ruta.path
+            self._rutas = rutas
+        return self._rutas.get(scope.get("endpoint"), "sin_ruta")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluir:
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            peticiones.observar(time.perf_counter() - inicio, scope["method"], self._ruta(scope), str(estado[0]))
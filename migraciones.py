@@ -0,0 +1,601 @@
+"""Migraciones versionadas del esquema.
+
+Cada migración se aplica una sola vez y queda anotada en `schema_migraciones`.
+Un advisory lock evita que varios workers migren a la vez; si el esquema ya
+está al día, el arranque sólo hace una consulta y no ejecuta DDL.
+
+Las migraciones no transaccionales se ejecutan en autocommit porque
+CREATE INDEX CONCURRENTLY no puede ir dentro de una transacción.
+
+Con DATABASE_URL=sqlite:///... se aplican en su lugar las migraciones de
+motor_sqlite (el mismo esquema, versionado con PRAGMA user_version).
+
+Uso desde la línea de comandos:
+    python migraciones.py            # aplica las pendientes
+    python migraciones.py --estado   # muestra las versiones aplicadas y pendientes
+"""
+import argparse
+import os
+import sys
+from typing import Callable, NamedTuple
+
+import busqueda
+import catalogo_io
+import db
+import historial
+import motor_sqlite
+import paginacion
+import versiones
+
+CLAVE_BLOQUEO = 7302519  # identificador arbitrario del advisory lock de migraciones
+
+
+class Migracion(NamedTuple):
+    version: int
+    descripcion: str
+    aplicar: Callable
+    transaccional: bool = True
+
+
+ESQUEMA_INICIAL = [
+    """
+    CREATE TABLE IF NOT EXISTS juegos (
+        id SERIAL PRIMARY KEY,
+        nombre VARCHAR(255) NOT NULL,
+        genero VARCHAR(100) NOT NULL,
+        año INTEGER,
+        desarrollador VARCHAR(255) NOT NULL,
+        imagen VARCHAR(255),
+        fecha_creacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS consolas (
+        id SERIAL PRIMARY KEY,
+        nombre VARCHAR(255) NOT NULL,
+        fabricante VARCHAR(255) NOT NULL,
+        año_lanzamiento INTEGER,
+        imagen VARCHAR(255),
+        fecha_creacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS accesorios (
+        id SERIAL PRIMARY KEY,
+        nombre VARCHAR(255) NOT NULL,
+        tipo VARCHAR(100) NOT NULL,
+        imagen VARCHAR(255),
+        fecha_creacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS compatibilidad (
+        id SERIAL PRIMARY KEY,
+        juego_id INTEGER NOT NULL REFERENCES juegos(id) ON DELETE CASCADE,
+        consola_id INTEGER NOT NULL REFERENCES consolas(id) ON DELETE CASCADE,
+        accesorio_id INTEGER REFERENCES accesorios(id) ON DELETE CASCADE,
+        notas TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS accesorio_consola (
+        id SERIAL PRIMARY KEY,
+        accesorio_id INTEGER NOT NULL REFERENCES accesorios(id) ON DELETE CASCADE,
+        consola_id INTEGER NOT NULL REFERENCES consolas(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS historial (
+        id SERIAL PRIMARY KEY,
+        accion VARCHAR(50) NOT NULL,
+        detalles TEXT NOT NULL,
+        tipo_objeto VARCHAR(50),
+        objeto_id INTEGER,
+        fecha TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS comparaciones (
+        id SERIAL PRIMARY KEY,
+        nombre VARCHAR(255) NOT NULL,
+        juego_id INTEGER NOT NULL REFERENCES juegos(id) ON DELETE CASCADE,
+        consola_id INTEGER NOT NULL REFERENCES consolas(id) ON DELETE CASCADE,
+        accesorio_id INTEGER REFERENCES accesorios(id) ON DELETE SET NULL,
+        notas TEXT,
+        fecha_creacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+
+def _esquema_inicial(cursor):
+    for sentencia in ESQUEMA_INICIAL:
+        cursor.execute(sentencia)
+
+
+def _extension_trigramas(cursor):
+    busqueda.crear_extension_trigramas(cursor)
+
+
+def _crear_indices(cursor, sentencias: list):
+    """Crea índices concurrentemente, descartando antes los que quedaron inválidos."""
+    for nombre, sentencia in sentencias:
+        cursor.execute(
+            """
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s AND NOT i.indisvalid
+            """,
+            (nombre,)
+        )
+        if cursor.fetchone():
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}")
+        cursor.execute(sentencia)
+
+
+def _indices_busqueda(cursor):
+    _crear_indices(cursor, busqueda.sentencias_indices(busqueda.detectar_trigramas(cursor)))
+
+
+def _indices_paginacion(cursor):
+    _crear_indices(cursor, paginacion.sentencias_indices())
+
+
+def _indices_nombre(cursor):
+    _crear_indices(cursor, catalogo_io.sentencias_indices())
+
+
+INDICES_CLAVES_FORANEAS = [
+    ("idx_compatibilidad_consola", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_compatibilidad_consola ON compatibilidad (consola_id)"),
+    ("idx_compatibilidad_accesorio", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_compatibilidad_accesorio ON compatibilidad (accesorio_id)"),
+    ("idx_accesorio_consola_consola", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_accesorio_consola_consola ON accesorio_consola (consola_id)"),
+    ("idx_comparaciones_juego", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comparaciones_juego ON comparaciones (juego_id)"),
+    ("idx_comparaciones_consola", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comparaciones_consola ON comparaciones (consola_id)"),
+    ("idx_comparaciones_accesorio", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comparaciones_accesorio ON comparaciones (accesorio_id)"),
+    ("idx_historial_fecha", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_historial_fecha ON historial (fecha)"),
+]
+
+# Los índices únicos cubren también compatibilidad.juego_id y accesorio_consola.accesorio_id
+INDICES_UNICOS = [
+    ("uq_compatibilidad_juego_consola_accesorio",
+     "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_compatibilidad_juego_consola_accesorio "
+     "ON compatibilidad (juego_id, consola_id, COALESCE(accesorio_id, 0))"),
+    ("uq_accesorio_consola",
+     "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_accesorio_consola ON accesorio_consola (accesorio_id, consola_id)"),
+]
+
+
+def _indices_claves_foraneas(cursor):
+    _crear_indices(cursor, INDICES_CLAVES_FORANEAS)
+
+
+def _eliminar_duplicados(cursor):
+    cursor.execute("""
+        DELETE FROM compatibilidad a USING compatibilidad b
+        WHERE a.juego_id = b.juego_id AND a.consola_id = b.consola_id
+          AND a.accesorio_id IS NOT DISTINCT FROM b.accesorio_id
+          AND a.id > b.id
+    """)
+    cursor.execute("""
+        DELETE FROM accesorio_consola a USING accesorio_consola b
+        WHERE a.accesorio_id = b.accesorio_id AND a.consola_id = b.consola_id AND a.id > b.id
+    """)
+
+
+def _indices_unicos(cursor):
+    _crear_indices(cursor, INDICES_UNICOS)
+
+
+def _referencias_imagenes(cursor):
+    """Tabla de referencias por imagen, mantenida por triggers en las tres tablas con `imagen`."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS imagenes (
+            url VARCHAR(255) PRIMARY KEY,
+            referencias INTEGER NOT NULL DEFAULT 0,
+            actualizada TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION contar_referencias_imagen() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND OLD.imagen IS NOT DISTINCT FROM NEW.imagen THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.imagen LIKE '/static/uploads/%' THEN
+                UPDATE imagenes SET referencias = referencias - 1, actualizada = CURRENT_TIMESTAMP
+                WHERE url = OLD.imagen;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.imagen LIKE '/static/uploads/%' THEN
+                INSERT INTO imagenes (url, referencias) VALUES (NEW.imagen, 1)
+                ON CONFLICT (url) DO UPDATE
+                SET referencias = imagenes.referencias + 1, actualizada = CURRENT_TIMESTAMP;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for tabla in ("juegos", "consolas", "accesorios"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {tabla}_referencias_imagen ON {tabla}")
+        cursor.execute(f"""
+            CREATE TRIGGER {tabla}_referencias_imagen
+            AFTER INSERT OR DELETE OR UPDATE OF imagen ON {tabla}
+            FOR EACH ROW EXECUTE FUNCTION contar_referencias_imagen()
+        """)
+    cursor.execute("""
+        INSERT INTO imagenes (url, referencias)
+        SELECT imagen, count(*) FROM (
+            SELECT imagen FROM juegos
+            UNION ALL SELECT imagen FROM consolas
+            UNION ALL SELECT imagen FROM accesorios
+        ) i
+        WHERE imagen LIKE '/static/uploads/%'
+        GROUP BY imagen
+        ON CONFLICT (url) DO UPDATE SET referencias = EXCLUDED.referencias
+    """)
+
+
+
+def _variantes_imagenes(cursor):
+    """Columna de variantes junto a `imagen`, copiada de `imagenes` al asignar una imagen."""
+    cursor.execute("ALTER TABLE imagenes ADD COLUMN IF NOT EXISTS variantes JSONB")
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION copiar_variantes_imagen() RETURNS trigger AS $$
+        BEGIN
+            NEW.imagen_variantes := (SELECT variantes FROM imagenes WHERE url = NEW.imagen);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for tabla in ("juegos", "consolas", "accesorios"):
+        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS imagen_variantes JSONB")
+        cursor.execute(f"DROP TRIGGER IF EXISTS {tabla}_variantes_imagen ON {tabla}")
+        cursor.execute(f"""
+            CREATE TRIGGER {tabla}_variantes_imagen
+            BEFORE INSERT OR UPDATE OF imagen ON {tabla}
+            FOR EACH ROW EXECUTE FUNCTION copiar_variantes_imagen()
+        """)
+
+
+def _instantaneas_comparaciones(cursor):
+    """Instantáneas de comparaciones con N elementos, marcadas como obsoletas por triggers."""
+    # Las comparaciones sobreviven al borrado de sus elementos: la instantánea los marca como eliminados
+    for columna, tabla in (("juego_id", "juegos"), ("consola_id", "consolas")):
+        cursor.execute(f"ALTER TABLE comparaciones ALTER COLUMN {columna} DROP NOT NULL")
+        cursor.execute(f"ALTER TABLE comparaciones DROP CONSTRAINT IF EXISTS comparaciones_{columna}_fkey")
+        cursor.execute(f"""
+            ALTER TABLE comparaciones ADD CONSTRAINT comparaciones_{columna}_fkey
+            FOREIGN KEY ({columna}) REFERENCES {tabla}(id) ON DELETE SET NULL
+        """)
+    cursor.execute("ALTER TABLE comparaciones ADD COLUMN IF NOT EXISTS instantanea JSONB")
+    cursor.execute("ALTER TABLE comparaciones ADD COLUMN IF NOT EXISTS obsoleta BOOLEAN NOT NULL DEFAULT true")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comparaciones_obsoletas ON comparaciones (id) WHERE obsoleta")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS comparacion_elementos (
+            comparacion_id INTEGER NOT NULL REFERENCES comparaciones(id) ON DELETE CASCADE,
+            posicion SMALLINT NOT NULL,
+            tipo VARCHAR(20) NOT NULL CHECK (tipo IN ('juegos', 'consolas', 'accesorios')),
+            entidad_id INTEGER NOT NULL,
+            PRIMARY KEY (comparacion_id, posicion)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comparacion_elementos_entidad ON comparacion_elementos (tipo, entidad_id)")
+    cursor.execute("""
+        INSERT INTO comparacion_elementos (comparacion_id, posicion, tipo, entidad_id)
+        SELECT id, 0, 'juegos', juego_id FROM comparaciones WHERE juego_id IS NOT NULL
+        UNION ALL
+        SELECT id, 1, 'consolas', consola_id FROM comparaciones WHERE consola_id IS NOT NULL
+        UNION ALL
+        SELECT id, 2, 'accesorios', accesorio_id FROM comparaciones WHERE accesorio_id IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+    # TG_ARGV: tipo de elemento afectado y columna de la fila con su id
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION marcar_comparaciones_obsoletas() RETURNS trigger AS $$
+        BEGIN
+            UPDATE comparaciones c SET obsoleta = true
+            FROM comparacion_elementos e
+            WHERE e.comparacion_id = c.id AND NOT c.obsoleta
+              AND e.tipo = TG_ARGV[0]
+              AND e.entidad_id IN (
+                  (to_jsonb(OLD) ->> TG_ARGV[1])::integer,
+                  (to_jsonb(NEW) ->> TG_ARGV[1])::integer
+              );
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    disparadores = [
+        ("juegos", "UPDATE OR DELETE", "juegos", "id"),
+        ("consolas", "UPDATE OR DELETE", "consolas", "id"),
+        ("accesorios", "UPDATE OR DELETE", "accesorios", "id"),
+        ("compatibilidad", "INSERT OR UPDATE OR DELETE", "juegos", "juego_id"),
+        ("accesorio_consola", "INSERT OR UPDATE OR DELETE", "accesorios", "accesorio_id"),
+    ]
+    for tabla, eventos, tipo, columna in disparadores:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {tabla}_comparaciones_obsoletas ON {tabla}")
+        cursor.execute(f"""
+            CREATE TRIGGER {tabla}_comparaciones_obsoletas
+            AFTER {eventos} ON {tabla}
+            FOR EACH ROW EXECUTE FUNCTION marcar_comparaciones_obsoletas('{tipo}', '{columna}')
+        """)
+
+
+def _historial_particionado(cursor):
+    """Convierte `historial` en una tabla particionada por mes sobre `fecha`, conservando filas e ids."""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'historial'::regclass")
+    if cursor.fetchone()[0] == "p":
+        return
+    cursor.execute("ALTER TABLE historial RENAME TO historial_sin_particionar")
+    cursor.execute("ALTER TABLE historial_sin_particionar RENAME CONSTRAINT historial_pkey TO historial_sin_particionar_pkey")
+    cursor.execute("ALTER SEQUENCE historial_id_seq OWNED BY NONE")
+    cursor.execute("""
+        CREATE TABLE historial (
+            id INTEGER NOT NULL DEFAULT nextval('historial_id_seq'),
+            accion VARCHAR(50) NOT NULL,
+            detalles TEXT NOT NULL,
+            tipo_objeto VARCHAR(50),
+            objeto_id INTEGER,
+            fecha TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (fecha, id)
+        ) PARTITION BY RANGE (fecha)
+    """)
+    cursor.execute("ALTER SEQUENCE historial_id_seq OWNED BY historial.id")
+    cursor.execute(f"CREATE TABLE {historial.PARTICION_DEFECTO} PARTITION OF historial DEFAULT")
+    cursor.execute("SELECT min(fecha) FROM historial_sin_particionar")
+    historial.asegurar_particiones(cursor, desde=cursor.fetchone()[0])
+    cursor.execute("""
+        INSERT INTO historial (id, accion, detalles, tipo_objeto, objeto_id, fecha)
+        SELECT id, accion, detalles, tipo_objeto, objeto_id, COALESCE(fecha, CURRENT_TIMESTAMP)
+        FROM historial_sin_particionar
+    """)
+    cursor.execute("DROP TABLE historial_sin_particionar")
+    # Filtros de /api/historial, todos con el mismo orden (fecha, id) DESC que la paginación
+    cursor.execute("CREATE INDEX idx_historial_objeto ON historial (tipo_objeto, objeto_id, fecha DESC, id DESC)")
+    cursor.execute("CREATE INDEX idx_historial_accion ON historial (accion, fecha DESC, id DESC)")
+
+
+def _notificar_cambios(cursor):
+    """Triggers por sentencia que publican en el canal `cambios` los ids afectados (ver cambios.py)."""
+    # Más de 100 ids no caben holgados en los 8000 bytes de una notificación: se envía ids = null
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION notificar_cambios() RETURNS trigger AS $$
+        DECLARE
+            ids INTEGER[];
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                SELECT array_agg(id ORDER BY id) INTO ids FROM filas_viejas;
+            ELSE
+                SELECT array_agg(id ORDER BY id) INTO ids FROM filas_nuevas;
+            END IF;
+            IF ids IS NULL THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('cambios', json_build_object(
+                'tabla', TG_TABLE_NAME,
+                'accion', lower(TG_OP),
+                'ids', CASE WHEN array_length(ids, 1) <= 100 THEN to_json(ids) END
+            )::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    # Las tablas de transición sólo se admiten en triggers de un único evento
+    eventos = (
+        ("insert", "INSERT", "NEW TABLE AS filas_nuevas"),
+        ("update", "UPDATE", "NEW TABLE AS filas_nuevas"),
+        ("delete", "DELETE", "OLD TABLE AS filas_viejas"),
+    )
+    for tabla in ("juegos", "consolas", "accesorios", "comparaciones"):
+        for sufijo, evento, referencia in eventos:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {tabla}_notificar_{sufijo} ON {tabla}")
+            cursor.execute(f"""
+                CREATE TRIGGER {tabla}_notificar_{sufijo}
+                AFTER {evento} ON {tabla}
+                REFERENCING {referencia}
+                FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambios()
+            """)
+
+
+def _versiones_tablas(cursor):
+    """Contador de versión por tabla para las peticiones condicionales (ver versiones.py)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS versiones_tablas (
+            tabla TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 1,
+            modificada TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute(
+        "INSERT INTO versiones_tablas (tabla) SELECT unnest(%s::text[]) ON CONFLICT (tabla) DO NOTHING",
+        (list(versiones.TABLAS),)
+    )
+    # Las sentencias que no cambian filas (sincronizaciones sin diferencias) no cambian la versión
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION incrementar_version_tabla() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM 1 FROM filas_viejas LIMIT 1;
+            ELSE
+                PERFORM 1 FROM filas_nuevas LIMIT 1;
+            END IF;
+            IF FOUND THEN
+                UPDATE versiones_tablas SET version = version + 1, modificada = clock_timestamp()
+                WHERE tabla = TG_TABLE_NAME;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    eventos = (
+        ("insert", "INSERT", "NEW TABLE AS filas_nuevas"),
+        ("update", "UPDATE", "NEW TABLE AS filas_nuevas"),
+        ("delete", "DELETE", "OLD TABLE AS filas_viejas"),
+    )
+    for tabla in versiones.TABLAS:
+        for sufijo, evento, referencia in eventos:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {tabla}_version_{sufijo} ON {tabla}")
+            cursor.execute(f"""
+                CREATE TRIGGER {tabla}_version_{sufijo}
+                AFTER {evento} ON {tabla}
+                REFERENCING {referencia}
+                FOR EACH STATEMENT EXECUTE FUNCTION incrementar_version_tabla()
+            """)
+
+
+def _version_filas(cursor):
+    """Versión por fila de juegos, consolas y accesorios para If-Match (ver concurrencia.py)."""
+    for tabla in ("juegos", "consolas", "accesorios"):
+        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+
+
+def _marcar_comparaciones_siempre(cursor):
+    """El trigger marca también las comparaciones ya obsoletas.
+
+    Así el escritor siempre toca (y bloquea) sus filas, y espera a un `comparaciones.refrescar`
+    en curso, que las tiene bloqueadas, en vez de cambiar los datos que está leyendo sin que
+    este se entere y acabe guardando la instantánea vieja como fresca.
+    """
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION marcar_comparaciones_obsoletas() RETURNS trigger AS $$
+        BEGIN
+            UPDATE comparaciones c SET obsoleta = true
+            FROM comparacion_elementos e
+            WHERE e.comparacion_id = c.id
+              AND e.tipo = TG_ARGV[0]
+              AND e.entidad_id IN (
+                  (to_jsonb(OLD) ->> TG_ARGV[1])::integer,
+                  (to_jsonb(NEW) ->> TG_ARGV[1])::integer
+              );
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+
+def _version_comparaciones(cursor):
+    """Versión por fila de las comparaciones para el If-Match de su DELETE; sube al refrescar la instantánea."""
+    cursor.execute("ALTER TABLE comparaciones ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+
+
+MIGRACIONES = [
+    Migracion(1, "Esquema inicial", _esquema_inicial),
+    Migracion(2, "Extensión pg_trgm (opcional)", _extension_trigramas),
+    Migracion(3, "Índices GIN de búsqueda", _indices_busqueda, transaccional=False),
+    Migracion(4, "Índices de paginación por keyset", _indices_paginacion, transaccional=False),
+    Migracion(5, "Índices por lower(nombre)", _indices_nombre, transaccional=False),
+    Migracion(6, "Índices de claves foráneas y de historial.fecha", _indices_claves_foraneas, transaccional=False),
+    Migracion(7, "Eliminar compatibilidades duplicadas", _eliminar_duplicados),
+    Migracion(8, "Restricciones de unicidad en compatibilidad y accesorio_consola", _indices_unicos, transaccional=False),
+    Migracion(9, "Recuento de referencias de imágenes subidas", _referencias_imagenes),
+    Migracion(10, "Metadatos de miniaturas de las imágenes", _variantes_imagenes),
+    Migracion(11, "Instantáneas de comparaciones con N elementos", _instantaneas_comparaciones),
+    Migracion(12, "Historial particionado por mes", _historial_particionado),
+    Migracion(13, "Notificaciones de cambios para el flujo en tiempo real", _notificar_cambios),
+    Migracion(14, "Versiones por tabla para ETag y Last-Modified", _versiones_tablas),
+    Migracion(15, "Versión por fila para la concurrencia optimista", _version_filas),
+    Migracion(16, "Marcar como obsoletas también las comparaciones ya obsoletas", _marcar_comparaciones_siempre),
+    Migracion(17, "Versión por fila de las comparaciones", _version_comparaciones),
+]
+
+
+def _asegurar_tabla(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            aplicada TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def versiones_aplicadas(cursor) -> set:
+    cursor.execute("SELECT to_regclass('schema_migraciones') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return set()
+    cursor.execute("SELECT version FROM schema_migraciones")
+    return {fila[0] for fila in cursor.fetchall()}
+
+
+def pendientes(conn) -> list:
+    if db.es_sqlite(conn):
+        return motor_sqlite.pendientes(conn)
+    with conn.cursor() as cursor:
+        aplicadas = versiones_aplicadas(cursor)
+    conn.rollback()
+    return [m for m in MIGRACIONES if m.version not in aplicadas]
+
+
+def migrar(conn, salida=print) -> list:
+    """Aplica las migraciones pendientes y devuelve las versiones aplicadas en esta llamada."""
+    if db.es_sqlite(conn):
+        return motor_sqlite.migrar(conn, salida)
+    if not pendientes(conn):
+        return []
+    autocommit_previo = conn.autocommit
+    conn.autocommit = True
+    cursor = conn.cursor()
+    aplicadas_ahora = []
+    try:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (CLAVE_BLOQUEO,))
+        try:
+            _asegurar_tabla(cursor)
+            # Otro worker pudo migrar mientras esperábamos el bloqueo
+            aplicadas = versiones_aplicadas(cursor)
+            for migracion in MIGRACIONES:
+                if migracion.version in aplicadas:
+                    continue
+                salida(f"Aplicando migración {migracion.version}: {migracion.descripcion}")
+                if migracion.transaccional:
+                    conn.autocommit = False
+                    try:
+                        migracion.aplicar(cursor)
+                        _anotar(cursor, migracion)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    finally:
+                        conn.autocommit = True
+                else:
+                    migracion.aplicar(cursor)
+                    _anotar(cursor, migracion)
+                aplicadas_ahora.append(migracion.version)
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (CLAVE_BLOQUEO,))
+    finally:
+        cursor.close()
+        conn.autocommit = autocommit_previo
+    return aplicadas_ahora
+
+
+def _anotar(cursor, migracion: Migracion):
+    cursor.execute(
+        "INSERT INTO schema_migraciones (version, descripcion) VALUES (%s, %s)",
+        (migracion.version, migracion.descripcion)
+    )
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Aplica las migraciones pendientes del esquema")
+    parser.add_argument("--estado", action="store_true", help="Sólo muestra el estado de las migraciones")
+    args = parser.parse_args(argv)
+
+    conn = db.conectar(os.environ.get("DATABASE_URL"))
+    try:
+        if args.estado:
+            faltan = {m.version for m in pendientes(conn)}
+            for migracion in motor_sqlite.MIGRACIONES if db.es_sqlite(conn) else MIGRACIONES:
+                marca = "pendiente" if migracion.version in faltan else "aplicada"
+                print(f"{migracion.version:>4}  {marca:<10} {migracion.descripcion}")
+            return 0
+        aplicadas = migrar(conn)
+        print(f"{len(aplicadas)} migraciones aplicadas" if aplicadas else "El esquema ya está al día")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,195 @@
+"""Miniaturas y variantes en formatos modernos de las imágenes subidas.
+
+Tras cada subida, la imagen original se procesa en un pool de procesos
+(fuera del camino de la petición). Se generan anchos fijos en WebP y, si
+Pillow lo soporta, en AVIF, en `static/uploads/derivadas/<hash>-<ancho>.<fmt>`.
+Los metadatos se guardan en `imagenes.variantes` y se copian a la columna
+`imagen_variantes` de las filas que usan esa imagen; las plantillas los usan
+para emitir `<picture>` con `srcset` y carga diferida.
+
+Pillow es opcional: sin él no se generan variantes y se sirve el original.
+
+Uso desde la línea de comandos:
+    python miniaturas.py rellenar    # genera las variantes que falten
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2.extras
+
+import db
+from subidas import DERIVADAS, DIRECTORIO, PREFIJO_URL
+
+logger = logging.getLogger(__name__)
+
+ANCHOS = (200, 400)  # .minecraft-img mide 200px; 400 cubre pantallas 2x
+CALIDAD = {"webp": 80, "avif": 55}
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow es opcional
+    Image = None
+
+
+def disponible() -> bool:
+    return Image is not None
+
+
+def formatos() -> list:
+    if Image is None:
+        return []
+    return ["avif", "webp"] if features.check("avif") else ["webp"]
+
+
+def generar_variantes(ruta: str, directorio: str, anchos=ANCHOS, formatos_salida=None) -> dict:
+    """Genera las variantes de `ruta` y devuelve sus metadatos. Se ejecuta en un proceso del pool."""
+    formatos_salida = formatos_salida or formatos()
+    carpeta = os.path.join(directorio, DERIVADAS)
+    os.makedirs(carpeta, exist_ok=True)
+    raiz = os.path.splitext(os.path.basename(ruta))[0]
+    with Image.open(ruta) as original:
+        original = ImageOps.exif_transpose(original)
+        ancho_original, alto_original = original.size
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+        variantes = []
+        for ancho in sorted(set(min(a, ancho_original) for a in anchos)):
+            alto = max(1, round(alto_original * ancho / ancho_original))
+            reducida = None
+            for formato in formatos_salida:
+                nombre = f"{raiz}-{ancho}.{formato}"
+                destino = os.path.join(carpeta, nombre)
+                if not os.path.exists(destino):
+                    if reducida is None:
+                        reducida = original.resize((ancho, alto), Image.LANCZOS)
+                    temporal = destino + ".tmp"
+                    reducida.save(temporal, format=formato.upper(), quality=CALIDAD[formato])
+                    os.replace(temporal, destino)
+                variantes.append({
+                    "url": f"{PREFIJO_URL}{DERIVADAS}/{nombre}",
+                    "formato": formato,
+                    "ancho": ancho,
+                    "alto": alto,
+                })
+    return {"ancho": ancho_original, "alto": alto_original, "variantes": variantes}
+
+
+def guardar_variantes(cursor, url: str, metadatos: dict):
+    """Guarda los metadatos en `imagenes` y en las filas que usan la imagen (cambia su ETag)."""
+    valor = psycopg2.extras.Json(metadatos)
+    cursor.execute("UPDATE imagenes SET variantes = %s WHERE url = %s", (valor, url))
+    for tabla in ("juegos", "consolas", "accesorios"):
+        cursor.execute(
+            f"UPDATE {tabla} SET imagen_variantes = %s, version = version + 1 WHERE imagen = %s", (valor, url)
+        )
+
+
+class ProcesadorImagenes:
+    """Pool de procesos que genera variantes en segundo plano y las anota en la base de datos.
+
+    `al_terminar(url)` se llama tras guardar los metadatos, p. ej. para invalidar la caché.
+    """
+
+    def __init__(self, obtener_conexion, procesos: int = 2, directorio: str = DIRECTORIO, al_terminar=None):
+        self._obtener_conexion = obtener_conexion
+        self.procesos = procesos
+        self.directorio = directorio
+        self.al_terminar = al_terminar
+        self._pool = None
+        self.procesadas = 0
+        self.errores = 0
+
+    def iniciar(self):
+        if not disponible():
+            logger.warning("Pillow no está instalado; no se generarán miniaturas")
+            return
+        if self.procesos <= 0 or self._pool is not None:
+            return
+        # spawn: los procesos hijos no heredan los hilos ni las conexiones del servidor
+        self._pool = ProcessPoolExecutor(self.procesos, mp_context=multiprocessing.get_context("spawn"))
+
+    def detener(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def encolar(self, url: str):
+        if self._pool is None or not url or not url.startswith(PREFIJO_URL):
+            return
+        ruta = os.path.join(self.directorio, os.path.basename(url))
+        futuro = self._pool.submit(generar_variantes, ruta, self.directorio)
+        futuro.add_done_callback(lambda f: self._terminado(url, f))
+
+    def _terminado(self, url: str, futuro):
+        try:
+            metadatos = futuro.result()
+            with self._obtener_conexion() as conn:
+                with conn.cursor() as cursor:
+                    guardar_variantes(cursor, url, metadatos)
+                conn.commit()
+            self.procesadas += 1
+            if self.al_terminar:
+                self.al_terminar(url)
+        except Exception:
+            self.errores += 1
+            logger.exception("Error al generar las miniaturas de %s", url)
+
+    def estadisticas(self) -> dict:
+        return {
+            "activo": self._pool is not None,
+            "formatos": formatos(),
+            "procesadas": self.procesadas,
+            "errores": self.errores,
+        }
+
+
+def rellenar(conn, procesos: int = None, directorio: str = DIRECTORIO) -> int:
+    """Genera las variantes de todas las imágenes referenciadas que aún no las tienen."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT url FROM imagenes WHERE variantes IS NULL AND referencias > 0 ORDER BY url")
+        urls = [fila[0] for fila in cursor.fetchall()]
+    conn.rollback()
+    hechas = 0
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(procesos, mp_context=contexto) as pool:
+        futuros = {}
+        for url in urls:
+            ruta = os.path.join(directorio, os.path.basename(url))
+            if os.path.isfile(ruta):
+                futuros[url] = pool.submit(generar_variantes, ruta, directorio)
+        for url, futuro in futuros.items():
+            try:
+                metadatos = futuro.result()
+            except Exception as e:
+                print(f"{url}: {e}")
+                continue
+            with conn.cursor() as cursor:
+                guardar_variantes(cursor, url, metadatos)
+            conn.commit()
+            hechas += 1
+    return hechas
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera miniaturas y variantes de las imágenes subidas")
+    parser.add_argument("accion", choices=["rellenar"])
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos del pool (por defecto, uno por CPU)")
+    args = parser.parse_args(argv)
+
+    if not disponible():
+        print("Se necesita Pillow para generar miniaturas")
+        return 1
+    conn = db.conectar(os.environ.get("DATABASE_URL"))
+    try:
+        print(f"{rellenar(conn, args.procesos)} imágenes procesadas")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,745 @@
+"""Motor SQLite embebido para instalaciones de un solo nodo, pruebas y benchmarks locales.
+
+Se elige con la configuración: DATABASE_URL=sqlite:///ruta/catalogo.db (con
+cuatro barras, ruta absoluta). `ConexionSQLite` y `CursorSQLite` ofrecen la
+parte de la interfaz de psycopg2 que usa la aplicación, así que el SQL común
+se escribe una sola vez:
+- parámetros %s y %(nombre)s (se traducen a ? y :nombre), `= ANY(%s)` con
+  listas (json_each), casts ::tipo, IS [NOT] DISTINCT FROM y FOR UPDATE (que
+  abre la transacción con BEGIN IMMEDIATE: los demás escritores esperan a su fin);
+- `mogrify`, con lo que psycopg2.extras.execute_values funciona igual;
+- filas accesibles por posición y por nombre, como DictCursor;
+- Json, dict y datetime como parámetros; JSONB, BOOLEAN y TIMESTAMP de vuelta
+  como dict, bool y datetime en UTC.
+Lo que no tiene equivalente directo (búsqueda, sincronización de
+compatibilidades, particiones del historial, importación con COPY) tiene su
+rama en cada módulo según `db.es_sqlite(cursor)`.
+
+Ajustes de cada conexión: WAL (lectores concurrentes con un escritor),
+synchronous=NORMAL, mmap, caché de páginas, claves foráneas y espera ante
+bloqueos. Las sentencias preparadas quedan en la caché de sqlite3
+(`cached_statements`), y la traducción de cada texto SQL se memoriza, así que
+la misma consulta reutiliza su sentencia compilada.
+
+El esquema se crea con sus propias migraciones (PRAGMA user_version), con
+FTS5 para la búsqueda y triggers para las referencias de imágenes y las
+comparaciones obsoletas. Actualiza también bases antiguas como database/juegos.db.
+
+No hay flujo de cambios en tiempo real (no existe LISTEN/NOTIFY).
+
+Uso:
+    DATABASE_URL=sqlite:///database/juegos.db python migraciones.py
+"""
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple
+
+from psycopg2.extras import Json
+
+PREFIJO_URL = "sqlite://"
+CACHE_SENTENCIAS = int(os.environ.get("SQLITE_SENTENCIAS_PREPARADAS", 256))
+MMAP_BYTES = int(os.environ.get("SQLITE_MMAP_BYTES", 256 * 1024 * 1024))
+CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", 64 * 1024))
+ESPERA_MS = int(os.environ.get("SQLITE_ESPERA_MS", 5000))
+
+
+def es_url(dsn: str) -> bool:
+    return bool(dsn) and dsn.startswith(PREFIJO_URL)
+
+
+def ruta_de_url(dsn: str) -> str:
+    """sqlite:///relativa.db -> relativa.db, sqlite:////abs/ruta.db -> /abs/ruta.db"""
+    ruta = dsn[len(PREFIJO_URL):]
+    if ruta.startswith("/"):
+        ruta = ruta[1:]
+    if not ruta or ruta == ":memory:":
+        raise ValueError("SQLite necesita un archivo: cada conexión del pool tendría su propia base en memoria")
+    return ruta
+
+
+# --- Tipos ---
+
+def _a_texto_fecha(valor: datetime) -> str:
+    """Mismo formato que CURRENT_TIMESTAMP (UTC), para que las comparaciones de texto ordenen bien."""
+    if valor.tzinfo is not None:
+        valor = valor.astimezone(timezone.utc)
+    return valor.strftime("%Y-%m-%d %H:%M:%S.%f" if valor.microsecond else "%Y-%m-%d %H:%M:%S")
+
+
+def _fecha(texto: bytes):
+    valor = datetime.fromisoformat(texto.decode())
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor
+
+
+# Sólo se aplican a las conexiones con detect_types, es decir, a las de este módulo
+sqlite3.register_converter("TIMESTAMP", _fecha)
+sqlite3.register_converter("JSONB", json.loads)
+sqlite3.register_converter("BOOLEAN", lambda texto: texto not in (b"0", b"false"))
+
+
+def _valor(valor):
+    if isinstance(valor, Json):
+        return json.dumps(valor.adapted, default=str)
+    if isinstance(valor, (dict, list, tuple)):
+        return json.dumps(list(valor) if isinstance(valor, tuple) else valor, default=str)
+    if isinstance(valor, datetime):
+        return _a_texto_fecha(valor)
+    return valor
+
+
+def _parametros(vars):
+    if vars is None:
+        return ()
+    if isinstance(vars, dict):
+        return {clave: _valor(v) for clave, v in vars.items()}
+    return [_valor(v) for v in vars]
+
+
+def _literal(valor) -> str:
+    valor = _valor(valor)
+    if valor is None:
+        return "NULL"
+    if isinstance(valor, bool):
+        return "1" if valor else "0"
+    if isinstance(valor, (int, float)):
+        return repr(valor)
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return "X'" + bytes(valor).hex() + "'"
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+# --- Traducción del SQL ---
+
+_ANY = re.compile(r"=\s*ANY\s*\(\s*(%s|%\(\w+\)s)(?:::\w+\[\])?\s*\)", re.IGNORECASE)
+_CAST = re.compile(r"::\w+(\[\])?")
+_NO_DISTINTO = re.compile(r"\bIS\s+NOT\s+DISTINCT\s+FROM\b", re.IGNORECASE)
+_DISTINTO = re.compile(r"\bIS\s+DISTINCT\s+FROM\b", re.IGNORECASE)
+_BLOQUEO = re.compile(r"\bFOR\s+UPDATE(\s+SKIP\s+LOCKED)?\b", re.IGNORECASE)
+_MARCADOR = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def _traducir_fragmento(sql: str) -> str:
+    sql = _ANY.sub(r"IN (SELECT value FROM json_each(\1))", sql)
+    sql = _NO_DISTINTO.sub("IS", sql)
+    sql = _DISTINTO.sub("IS NOT", sql)
+    sql = _BLOQUEO.sub("", sql)
+    return _CAST.sub("", sql)
+
+
+@functools.lru_cache(maxsize=1024)
+def bloquea(sql: str) -> bool:
+    """¿Es un SELECT ... FOR UPDATE? En SQLite no hay bloqueos de fila: se toma el de escritura."""
+    return any(_BLOQUEO.search(p) for p in _LITERAL.split(sql)[::2])
+
+
+@functools.lru_cache(maxsize=1024)
+def traducir(sql: str, con_parametros: bool) -> str:
+    """SQL de la aplicación (dialecto de psycopg2/PostgreSQL) a SQLite.
+
+    Los literales entre comillas (p. ej. los valores que incrusta execute_values) no se reescriben.
+    """
+    partes = _LITERAL.split(sql)
+    sql = "".join(_traducir_fragmento(p) if i % 2 == 0 else p for i, p in enumerate(partes))
+    if not con_parametros:
+        return sql  # como psycopg2: sin parámetros, % no es un marcador
+    return _MARCADOR.sub(lambda m: "%" if m[0] == "%%" else (f":{m[1]}" if m[1] else "?"), sql)
+
+
+# --- Conexión y cursor ---
+
+class Columna(tuple):
+    """Elemento de `description` con `.name`, como el de psycopg2."""
+
+    @property
+    def name(self):
+        return self[0]
+
+
+class CursorSQLite:
+    motor = "sqlite"
+
+    def __init__(self, conexion):
+        self.connection = conexion
+        self._cursor = conexion._conn.cursor()
+        self.itersize = 2000
+        self.closed = False
+
+    def execute(self, query, vars=None):
+        if isinstance(query, bytes):
+            query = query.decode("utf-8")
+        conexion = self.connection
+        if bloquea(query) and not conexion.autocommit and not conexion.en_transaccion:
+            self._cursor.execute("BEGIN IMMEDIATE")
+        self._cursor.execute(traducir(query, vars is not None), _parametros(vars))
+
+    def executemany(self, query, vars_list):
+        if isinstance(query, bytes):
+            query = query.decode("utf-8")
+        self._cursor.executemany(traducir(query, True), [_parametros(v) for v in vars_list])
+
+    def mogrify(self, query, vars=None) -> bytes:
+        """Sentencia con los valores como literales (la usa psycopg2.extras.execute_values)."""
+        if isinstance(query, bytes):
+            query = query.decode("utf-8")
+        if vars is None:
+            return query.encode("utf-8")
+        if isinstance(vars, dict):
+            texto = _MARCADOR.sub(lambda m: "%" if m[0] == "%%" else _literal(vars[m[1]]), query)
+        else:
+            valores = iter(vars)
+            texto = _MARCADOR.sub(lambda m: "%" if m[0] == "%%" else _literal(next(valores)), query)
+        return texto.encode("utf-8")
+
+    def copy_expert(self, sql, file, size=8192):
+        raise sqlite3.NotSupportedError("SQLite no tiene COPY")
+
+    @property
+    def description(self):
+        descripcion = self._cursor.description
+        return None if descripcion is None else [Columna(c) for c in descripcion]
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self.itersize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        while True:
+            filas = self._cursor.fetchmany(self.itersize)
+            if not filas:
+                return
+            yield from filas
+
+    def close(self):
+        if not self.closed:
+            self._cursor.close()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConexionSQLite:
+    """Conexión sqlite3 con la interfaz de psycopg2 que usa la aplicación."""
+
+    motor = "sqlite"
+    encoding = "UTF8"  # execute_values codifica con psycopg2.extensions.encodings[encoding]
+    clase_cursor = CursorSQLite
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        # IMMEDIATE: la transacción toma el bloqueo de escritura al empezar, en vez de fallar
+        # al intentar ampliarlo a mitad (SQLITE_BUSY sin espera)
+        self._conn = sqlite3.connect(
+            ruta,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level="IMMEDIATE",
+            check_same_thread=False,  # el pool la presta a un hilo cada vez
+            cached_statements=CACHE_SENTENCIAS,
+        )
+        self._conn.row_factory = sqlite3.Row
+        # lower() de SQLite sólo entiende ASCII; la de Python coincide con la de PostgreSQL
+        self._conn.create_function("lower", 1, lambda t: t.lower() if isinstance(t, str) else t, deterministic=True)
+        for pragma in (
+            "journal_mode = WAL",
+            "synchronous = NORMAL",
+            "foreign_keys = ON",
+            f"busy_timeout = {ESPERA_MS}",
+            f"mmap_size = {MMAP_BYTES}",
+            f"cache_size = -{CACHE_KB}",
+            "temp_store = MEMORY",
+        ):
+            self._conn.execute(f"PRAGMA {pragma}")
+        self.closed = 0
+
+    def cursor(self, name=None, cursor_factory=None, **kwargs):
+        # Todas las filas se leen ya como sqlite3.Row (posición y nombre), sea cual sea cursor_factory
+        return self.clase_cursor(self)
+
+    @property
+    def autocommit(self) -> bool:
+        return self._conn.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, valor: bool):
+        if valor and self._conn.in_transaction:
+            self._conn.commit()
+        self._conn.isolation_level = None if valor else "IMMEDIATE"
+
+    @property
+    def en_transaccion(self) -> bool:
+        return self._conn.in_transaction
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            self._conn.close()
+            self.closed = 1
+
+
+def conectar(dsn: str, connection_factory=None) -> ConexionSQLite:
+    return (connection_factory or ConexionSQLite)(ruta_de_url(dsn))
+
+
+class PoolSQLite:
+    """Conexiones abiertas bajo demanda y reutilizadas; misma interfaz que el pool de psycopg2 que usa db.py."""
+
+    def __init__(self, minimo: int, maximo: int, dsn: str, connection_factory=None):
+        self._dsn = dsn
+        self._fabrica = connection_factory
+        self._libres = []
+        self._lock = threading.Lock()
+        self.conexiones_abiertas = 0
+        for _ in range(minimo):
+            self._libres.append(self._abrir())
+
+    def _abrir(self):
+        conn = conectar(self._dsn, self._fabrica)
+        self.conexiones_abiertas += 1
+        return conn
+
+    def getconn(self):
+        with self._lock:
+            if self._libres:
+                return self._libres.pop()
+        return self._abrir()
+
+    def putconn(self, conn, close=False):
+        if close or conn.closed:
+            conn.close()
+            return
+        if conn.en_transaccion:
+            conn.rollback()
+        with self._lock:
+            self._libres.append(conn)
+
+    def closeall(self):
+        with self._lock:
+            libres, self._libres = self._libres, []
+        for conn in libres:
+            conn.close()
+
+
+# --- Esquema ---
+
+TABLAS_CATALOGO = ("juegos", "consolas", "accesorios")
+
+# Texto indexado por FTS5: nombre (peso A) y el resto (peso B), como en busqueda.ENTIDADES
+TEXTO_BUSQUEDA = {
+    "juegos": "NEW.genero || ' ' || NEW.desarrollador",
+    "consolas": "NEW.fabricante",
+    "accesorios": "NEW.tipo",
+}
+
+ESQUEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS juegos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        genero TEXT NOT NULL,
+        año INTEGER,
+        desarrollador TEXT NOT NULL,
+        imagen TEXT,
+        imagen_variantes JSONB,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS consolas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        fabricante TEXT NOT NULL,
+        año_lanzamiento INTEGER,
+        imagen TEXT,
+        imagen_variantes JSONB,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS accesorios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        imagen TEXT,
+        imagen_variantes JSONB,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS compatibilidad (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        juego_id INTEGER NOT NULL REFERENCES juegos(id) ON DELETE CASCADE,
+        consola_id INTEGER NOT NULL REFERENCES consolas(id) ON DELETE CASCADE,
+        accesorio_id INTEGER REFERENCES accesorios(id) ON DELETE CASCADE,
+        notas TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS accesorio_consola (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        accesorio_id INTEGER NOT NULL REFERENCES accesorios(id) ON DELETE CASCADE,
+        consola_id INTEGER NOT NULL REFERENCES consolas(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS historial (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        accion TEXT NOT NULL,
+        detalles TEXT NOT NULL,
+        tipo_objeto TEXT,
+        objeto_id INTEGER,
+        fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS comparaciones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        juego_id INTEGER REFERENCES juegos(id) ON DELETE SET NULL,
+        consola_id INTEGER REFERENCES consolas(id) ON DELETE SET NULL,
+        accesorio_id INTEGER REFERENCES accesorios(id) ON DELETE SET NULL,
+        notas TEXT,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        instantanea JSONB,
+        obsoleta BOOLEAN NOT NULL DEFAULT 1
+    )
+    """,
+]
+
+
+def _columnas(cursor, tabla: str) -> list:
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    return [fila["name"] for fila in cursor.fetchall()]
+
+
+def _rehacer(cursor, tabla: str, definicion: str):
+    """Recrea `tabla` con la definición actual conservando filas e ids (SQLite no altera restricciones).
+
+    Se crea la tabla nueva aparte y se renombra al final: renombrar la
+    antigua haría que las claves foráneas de otras tablas apuntaran a ella.
+    Sus índices y triggers desaparecen con la antigua; quien llama los recrea.
+    """
+    antiguas = _columnas(cursor, tabla)
+    cursor.execute(definicion.replace(f"EXISTS {tabla} (", f"EXISTS {tabla}_nueva (", 1))
+    comunes = ", ".join(c for c in _columnas(cursor, f"{tabla}_nueva") if c in antiguas)
+    cursor.execute(f"INSERT INTO {tabla}_nueva ({comunes}) SELECT {comunes} FROM {tabla}")
+    cursor.execute(f"DROP TABLE {tabla}")
+    # Sin el modo antiguo, RENAME valida los triggers que ya nombran `tabla` y falla porque aún no existe
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute(f"ALTER TABLE {tabla}_nueva RENAME TO {tabla}")
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+
+
+def _esquema(cursor):
+    for sentencia in ESQUEMA:
+        cursor.execute(sentencia)
+
+
+def _adaptar_tablas_antiguas(cursor):
+    """Bases creadas por versiones anteriores (database/juegos.db): columnas nuevas y claves en cascada."""
+    definiciones = {re.search(r"EXISTS (\w+)", s)[1]: s for s in ESQUEMA}
+    for tabla in TABLAS_CATALOGO:
+        if "imagen_variantes" not in _columnas(cursor, tabla):
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN imagen_variantes JSONB")
+    for tabla in ("compatibilidad", "accesorio_consola", "comparaciones"):
+        cursor.execute(f"PRAGMA foreign_key_list({tabla})")
+        acciones = {fila["on_delete"] for fila in cursor.fetchall()}
+        if "NO ACTION" in acciones or (tabla == "comparaciones" and "obsoleta" not in _columnas(cursor, tabla)):
+            _rehacer(cursor, tabla, definiciones[tabla])
+
+
+def _indices(cursor):
+    # Compatibilidades repetidas de versiones anteriores, antes de los índices únicos
+    cursor.execute("""
+        DELETE FROM compatibilidad WHERE id NOT IN (
+            SELECT min(id) FROM compatibilidad GROUP BY juego_id, consola_id, COALESCE(accesorio_id, 0)
+        )
+    """)
+    cursor.execute("""
+        DELETE FROM accesorio_consola WHERE id NOT IN (
+            SELECT min(id) FROM accesorio_consola GROUP BY accesorio_id, consola_id
+        )
+    """)
+    sentencias = [
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_compatibilidad_juego_consola_accesorio "
+        "ON compatibilidad (juego_id, consola_id, COALESCE(accesorio_id, 0))",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_accesorio_consola ON accesorio_consola (accesorio_id, consola_id)",
+        "CREATE INDEX IF NOT EXISTS idx_compatibilidad_consola ON compatibilidad (consola_id)",
+        "CREATE INDEX IF NOT EXISTS idx_compatibilidad_accesorio ON compatibilidad (accesorio_id)",
+        "CREATE INDEX IF NOT EXISTS idx_accesorio_consola_consola ON accesorio_consola (consola_id)",
+        "CREATE INDEX IF NOT EXISTS idx_comparaciones_juego ON comparaciones (juego_id)",
+        "CREATE INDEX IF NOT EXISTS idx_comparaciones_consola ON comparaciones (consola_id)",
+        "CREATE INDEX IF NOT EXISTS idx_comparaciones_accesorio ON comparaciones (accesorio_id)",
+        "CREATE INDEX IF NOT EXISTS idx_comparaciones_obsoletas ON comparaciones (id) WHERE obsoleta",
+        "CREATE INDEX IF NOT EXISTS idx_historial_fecha ON historial (fecha DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_historial_objeto ON historial (tipo_objeto, objeto_id, fecha DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_historial_accion ON historial (accion, fecha DESC, id DESC)",
+    ]
+    for tabla in TABLAS_CATALOGO + ("comparaciones",):
+        for columna in ("nombre", "fecha_creacion"):
+            sentencias.append(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_{columna}_id ON {tabla} ({columna}, id)")
+    for tabla in TABLAS_CATALOGO:
+        sentencias.append(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_nombre_lower ON {tabla} (lower(nombre))")
+    for sentencia in sentencias:
+        cursor.execute(sentencia)
+
+
+def _busqueda(cursor):
+    """Tablas FTS5 (nombre y detalle) mantenidas por triggers; rowid = id de la entidad."""
+    for tabla, detalle in TEXTO_BUSQUEDA.items():
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {tabla}_fts USING fts5(
+                nombre, detalle, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            )
+        """)
+        insertar = (f"INSERT INTO {tabla}_fts (rowid, nombre, detalle) "
+                    f"VALUES (NEW.id, NEW.nombre, {detalle});")
+        columnas = ", ".join(re.findall(r"NEW\.(\w+)", detalle) + ["nombre"])
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {tabla}_fts_insertar AFTER INSERT ON {tabla} BEGIN {insertar} END")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {tabla}_fts_actualizar AFTER UPDATE OF {columnas} ON {tabla} BEGIN
+                DELETE FROM {tabla}_fts WHERE rowid = OLD.id; {insertar}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {tabla}_fts_eliminar AFTER DELETE ON {tabla} BEGIN
+                DELETE FROM {tabla}_fts WHERE rowid = OLD.id;
+            END
+        """)
+        cursor.execute(f"DELETE FROM {tabla}_fts")
+        cursor.execute(
+            f"INSERT INTO {tabla}_fts (rowid, nombre, detalle) "
+            f"SELECT id, nombre, {detalle.replace('NEW.', '')} FROM {tabla}"
+        )
+
+
+def _imagenes(cursor):
+    """Referencias y variantes de las imágenes subidas, como las migraciones 9 y 10 de PostgreSQL."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS imagenes (
+            url TEXT PRIMARY KEY,
+            referencias INTEGER NOT NULL DEFAULT 0,
+            actualizada TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            variantes JSONB
+        )
+    """)
+    sumar = """
+        INSERT INTO imagenes (url, referencias) SELECT NEW.imagen, 1 WHERE NEW.imagen LIKE '/static/uploads/%'
+        ON CONFLICT (url) DO UPDATE SET referencias = referencias + 1, actualizada = CURRENT_TIMESTAMP;
+    """
+    restar = """
+        UPDATE imagenes SET referencias = referencias - 1, actualizada = CURRENT_TIMESTAMP
+        WHERE url = OLD.imagen AND OLD.imagen LIKE '/static/uploads/%';
+    """
+    for tabla in TABLAS_CATALOGO:
+        copiar = (f"UPDATE {tabla} SET imagen_variantes = (SELECT variantes FROM imagenes WHERE url = NEW.imagen) "
+                  f"WHERE id = NEW.id;")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {tabla}_imagen_insertar AFTER INSERT ON {tabla}
+            WHEN NEW.imagen IS NOT NULL BEGIN {sumar} {copiar} END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {tabla}_imagen_actualizar AFTER UPDATE OF imagen ON {tabla}
+            WHEN OLD.imagen IS NOT NEW.imagen BEGIN {restar} {sumar} {copiar} END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {tabla}_imagen_eliminar AFTER DELETE ON {tabla}
+            WHEN OLD.imagen IS NOT NULL BEGIN {restar} END
+        """)
+    cursor.execute("""
+        INSERT INTO imagenes (url, referencias)
+        SELECT imagen, count(*) FROM (
+            SELECT imagen FROM juegos
+            UNION ALL SELECT imagen FROM consolas
+            UNION ALL SELECT imagen FROM accesorios
+        ) i
+        WHERE imagen LIKE '/static/uploads/%'
+        GROUP BY imagen
+        ON CONFLICT (url) DO UPDATE SET referencias = excluded.referencias
+    """)
+
+
+def _comparaciones(cursor):
+    """Elementos de las comparaciones y triggers que marcan sus instantáneas como obsoletas (migración 11)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS comparacion_elementos (
+            comparacion_id INTEGER NOT NULL REFERENCES comparaciones(id) ON DELETE CASCADE,
+            posicion INTEGER NOT NULL,
+            tipo TEXT NOT NULL CHECK (tipo IN ('juegos', 'consolas', 'accesorios')),
+            entidad_id INTEGER NOT NULL,
+            PRIMARY KEY (comparacion_id, posicion)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comparacion_elementos_entidad ON comparacion_elementos (tipo, entidad_id)")
+    cursor.execute("""
+        INSERT OR IGNORE INTO comparacion_elementos (comparacion_id, posicion, tipo, entidad_id)
+        SELECT id, 0, 'juegos', juego_id FROM comparaciones WHERE juego_id IS NOT NULL
+        UNION ALL
+        SELECT id, 1, 'consolas', consola_id FROM comparaciones WHERE consola_id IS NOT NULL
+        UNION ALL
+        SELECT id, 2, 'accesorios', accesorio_id FROM comparaciones WHERE accesorio_id IS NOT NULL
+    """)
+    disparadores = [
+        ("juegos", ("UPDATE", "DELETE"), "juegos", "id"),
+        ("consolas", ("UPDATE", "DELETE"), "consolas", "id"),
+        ("accesorios", ("UPDATE", "DELETE"), "accesorios", "id"),
+        ("compatibilidad", ("INSERT", "UPDATE", "DELETE"), "juegos", "juego_id"),
+        ("accesorio_consola", ("INSERT", "UPDATE", "DELETE"), "accesorios", "accesorio_id"),
+    ]
+    for tabla, eventos, tipo, columna in disparadores:
+        for evento in eventos:
+            ids = {"INSERT": f"NEW.{columna}", "DELETE": f"OLD.{columna}"}.get(evento, f"OLD.{columna}, NEW.{columna}")
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {tabla}_comparaciones_obsoletas_{evento.lower()}
+                AFTER {evento} ON {tabla} BEGIN
+                    UPDATE comparaciones SET obsoleta = 1
+                    WHERE NOT obsoleta AND id IN (
+                        SELECT comparacion_id FROM comparacion_elementos
+                        WHERE tipo = '{tipo}' AND entidad_id IN ({ids})
+                    );
+                END
+            """)
+
+
+def _versiones_tablas(cursor):
+    """Contador de versión por tabla (migración 14); aquí los triggers son por fila."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS versiones_tablas (
+            tabla TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1,
+            modificada TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    tablas = TABLAS_CATALOGO + ("comparaciones", "compatibilidad", "accesorio_consola", "historial")
+    for tabla in tablas:
+        cursor.execute("INSERT OR IGNORE INTO versiones_tablas (tabla) VALUES (%s)", (tabla,))
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {tabla}_version_{evento.lower()} AFTER {evento} ON {tabla} BEGIN
+                    UPDATE versiones_tablas SET version = version + 1, modificada = CURRENT_TIMESTAMP
+                    WHERE tabla = '{tabla}';
+                END
+            """)
+
+
+def _version_filas(cursor):
+    """Versión por fila para If-Match (migración 15)."""
+    for tabla in TABLAS_CATALOGO:
+        if "version" not in _columnas(cursor, tabla):
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+def _accesorio_comparaciones(cursor):
+    """comparaciones.accesorio_id pasa a ON DELETE SET NULL, como en PostgreSQL (antes borraba la comparación)."""
+    cursor.execute("PRAGMA foreign_key_list(comparaciones)")
+    if any(fila["from"] == "accesorio_id" and fila["on_delete"] == "CASCADE" for fila in cursor.fetchall()):
+        definiciones = {re.search(r"EXISTS (\w+)", s)[1]: s for s in ESQUEMA}
+        _rehacer(cursor, "comparaciones", definiciones["comparaciones"])
+        _indices(cursor)
+        _versiones_tablas(cursor)
+
+
+def _version_comparaciones(cursor):
+    """Versión por fila de las comparaciones (migración 17)."""
+    if "version" not in _columnas(cursor, "comparaciones"):
+        cursor.execute("ALTER TABLE comparaciones ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+class Migracion(NamedTuple):
+    version: int
+    descripcion: str
+    aplicar: Callable
+
+
+MIGRACIONES = [
+    Migracion(1, "Esquema inicial", _esquema),
+    Migracion(2, "Columnas y claves foráneas de versiones posteriores en bases antiguas", _adaptar_tablas_antiguas),
+    Migracion(3, "Índices de paginación, claves foráneas, unicidad e historial", _indices),
+    Migracion(4, "Búsqueda con FTS5", _busqueda),
+    Migracion(5, "Referencias y variantes de imágenes", _imagenes),
+    Migracion(6, "Instantáneas de comparaciones con N elementos", _comparaciones),
+    Migracion(7, "Versiones por tabla para ETag y Last-Modified", _versiones_tablas),
+    Migracion(8, "Versión por fila para la concurrencia optimista", _version_filas),
+    Migracion(9, "Comparaciones sin accesorio al borrarlo, como en PostgreSQL", _accesorio_comparaciones),
+    Migracion(10, "Versión por fila de las comparaciones", _version_comparaciones),
+]
+
+
+def version(cursor) -> int:
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+
+def pendientes(conn) -> list:
+    with conn.cursor() as cursor:
+        actual = version(cursor)
+    return [m for m in MIGRACIONES if m.version > actual]
+
+
+def migrar(conn, salida=print) -> list:
+    """Aplica las migraciones pendientes en una transacción cada una; devuelve las versiones aplicadas."""
+    if not pendientes(conn):
+        return []
+    conn.commit()
+    # Con las claves foráneas activas, rehacer una tabla borraría en cascada sus filas dependientes
+    conn._conn.execute("PRAGMA foreign_keys = OFF")
+    aplicadas = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("BEGIN IMMEDIATE")  # otro proceso pudo migrar mientras esperábamos el bloqueo
+            try:
+                actual = version(cursor)
+                for migracion in MIGRACIONES:
+                    if migracion.version <= actual:
+                        continue
+                    salida(f"Aplicando migración SQLite {migracion.version}: {migracion.descripcion}")
+                    migracion.aplicar(cursor)
+                    cursor.execute(f"PRAGMA user_version = {migracion.version}")
+                    aplicadas.append(migracion.version)
+                cursor.execute("PRAGMA foreign_key_check")
+                if cursor.fetchone():
+                    raise sqlite3.IntegrityError("Las migraciones dejan referencias rotas")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn._conn.execute("PRAGMA foreign_keys = ON")
+    return aplicadas
@@ -0,0 +1,97 @@
+"""Paginación por keyset (cursor) para los listados del catálogo.
+
+El cursor es un token opaco: JSON en base64url con la versión del formato,
+el orden usado y la clave (valor, id) de la última fila entregada. La página
+siguiente se pide con una comparación de tuplas sobre un índice compuesto
+(columna, id), de modo que cualquier página cuesta lo mismo que la primera.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from db import como_dicts, es_sqlite
+
+VERSION_CURSOR = 1
+
+# orden -> (columna, dirección)
+ORDENES = {
+    "id": ("id", "DESC"),
+    "nombre": ("nombre", "ASC"),
+    "fecha_creacion": ("fecha_creacion", "DESC"),
+}
+
+TABLAS = ("juegos", "consolas", "accesorios", "comparaciones")
+
+
+class CursorInvalido(ValueError):
+    """El token de cursor no se puede decodificar o no corresponde al orden pedido."""
+
+
+def sentencias_indices() -> list:
+    """Índices compuestos (columna, id) que sostienen la paginación, como pares (nombre, sentencia)."""
+    sentencias = []
+    for tabla in TABLAS:
+        for columna in ("nombre", "fecha_creacion"):
+            nombre = f"idx_{tabla}_{columna}_id"
+            sentencias.append((nombre, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nombre} ON {tabla} ({columna}, id)"))
+    return sentencias
+
+
+def codificar_cursor(orden: str, valor, id_: int) -> str:
+    if isinstance(valor, datetime):
+        valor = valor.isoformat()
+    datos = json.dumps({"v": VERSION_CURSOR, "o": orden, "k": [valor, id_]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(token: str, orden: str):
+    """Devuelve la clave (valor, id) del token o lanza CursorInvalido."""
+    try:
+        relleno = "=" * (-len(token) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(token + relleno))
+        valor, id_ = datos["k"]
+        if datos["v"] != VERSION_CURSOR or datos["o"] != orden or not isinstance(id_, int):
+            raise CursorInvalido("Cursor inválido para este orden")
+        return valor, id_
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        if isinstance(e, CursorInvalido):
+            raise
+        raise CursorInvalido("Cursor inválido") from e
+
+
+def obtener_pagina(cursor, tabla: str, orden: str = "id", limite: int = 50,
+                   token: str = None, columnas: str = "t.*"):
+    """Lee una página de `tabla` (con alias t) y devuelve (filas, token_siguiente o None)."""
+    if tabla not in TABLAS or orden not in ORDENES:
+        raise ValueError(f"Listado no soportado: {tabla}/{orden}")
+    columna, direccion = ORDENES[orden]
+    comparador = "<" if direccion == "DESC" else ">"
+    parametros = []
+    where = ""
+    if token:
+        valor, id_ = decodificar_cursor(token, orden)
+        if columna == "id":
+            where = f"WHERE id {comparador} %s"
+            parametros.append(id_)
+        else:
+            if es_sqlite(cursor) and columna.startswith("fecha") and isinstance(valor, str):
+                # SQLite guarda las fechas como texto: hay que comparar con el mismo formato
+                try:
+                    valor = datetime.fromisoformat(valor)
+                except ValueError as e:
+                    raise CursorInvalido("Cursor inválido") from e
+            where = f"WHERE ({columna}, id) {comparador} (%s, %s)"
+            parametros.extend([valor, id_])
+    cursor.execute(
+        f"SELECT {columnas} FROM {tabla} t {where} "
+        f"ORDER BY {columna} {direccion}, id {direccion} LIMIT %s",
+        parametros + [limite + 1]
+    )
+    filas = como_dicts(cursor)
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = codificar_cursor(orden, ultima[columna], ultima["id"])
+    return filas, siguiente
@@ -0,0 +1,327 @@
+"""Réplicas de lectura de PostgreSQL: balanceo, chequeo de retraso y lectura de lo escrito.
+
+DATABASE_REPLICAS lista, separados por comas, los DSN de réplicas en
+streaming de la primaria (DATABASE_URL). Cada réplica tiene su propio
+db.PoolConexiones (mismos DB_POOL_*) y sus conexiones son de sólo lectura.
+
+- Un hilo comprueba cada DB_REPLICAS_CHEQUEO segundos que cada réplica
+  responde, que recibe WAL de la primaria y cuánto retraso lleva. Las que
+  fallan o pasan de DB_REPLICAS_RETRASO_MAX segundos dejan de recibir
+  lecturas hasta el siguiente chequeo correcto.
+- `obtener_conexion_lectura()` presta una conexión de la réplica sana con
+  menos conexiones en uso (a igualdad, por turnos) o, si no hay ninguna, de
+  la primaria.
+- Lectura de lo escrito: durante DB_LECTURA_PRIMARIA segundos (por defecto el
+  retraso máximo más un intervalo de chequeo) tras una escritura, el cliente
+  que la hizo lee de la primaria; lo marca la cookie que pone
+  `MiddlewareLecturaPropia`. Los demás clientes siguen leyendo de las réplicas.
+- Caché: `anotar_escritura()` apunta la hora de cada escritura del proceso o
+  de cada cambio de otros que este ve. Una lectura de una réplica cuyo último
+  chequeo no garantiza que la tenga cuenta en `lecturas_atrasadas()`, y quien
+  cachea no guarda lo que cargó con ella, para no rellenar la caché recién
+  invalidada con datos atrasados. Por lo mismo, la respuesta de una petición
+  con lecturas atrasadas sale sin ETag ni Last-Modified.
+
+Sin DATABASE_REPLICAS, o con SQLite, todas las lecturas van a la primaria.
+
+Para probarlo en local con dos instancias:
+    pg_basebackup -h localhost -p 5432 -U postgres -D /tmp/replica -R -X stream
+    pg_ctl -D /tmp/replica -o "-p 5433" start
+    DATABASE_REPLICAS=postgresql://postgres@localhost:5433/postgres uvicorn main:app
+"""
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+import psycopg2
+from psycopg2.extensions import parse_dsn
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+
+import db
+
+logger = logging.getLogger(__name__)
+
+COOKIE = "leer_primaria"
+METODOS_ESCRITURA = ("POST", "PUT", "PATCH", "DELETE")
+
+# Una réplica sin walreceiver en streaming no avanza aunque su retraso aparente sea 0
+CONSULTA_ESTADO = """
+    SELECT pg_is_in_recovery(),
+           EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'),
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+"""
+
+_cliente_escribio = ContextVar("cliente_escribio", default=False)
+# Lista de un elemento: el middleware la crea por petición y los hilos del threadpool la comparten
+_lecturas_atrasadas = ContextVar("lecturas_atrasadas", default=None)
+
+
+def _nombre(dsn: str) -> str:
+    """host:puerto/base del DSN, sin credenciales, para mensajes y estadísticas."""
+    try:
+        partes = parse_dsn(dsn)
+    except psycopg2.ProgrammingError:
+        return "réplica"
+    return f"{partes.get('host', 'localhost')}:{partes.get('port', 5432)}/{partes.get('dbname', '')}"
+
+
+class Replica:
+    def __init__(self, dsn: str, pool: db.PoolConexiones):
+        self.nombre = _nombre(dsn)
+        self.pool = pool
+        self.sana = False
+        self.retraso = None
+        self.comprobada = 0.0  # time.time() del último chequeo correcto
+        self.error = "sin comprobar"
+        self.lecturas = 0
+        self.lecturas_atrasadas = 0
+
+    def tiene(self, instante: float) -> bool:
+        """Si en el último chequeo ya había reproducido lo confirmado en la primaria hasta `instante`."""
+        return self.comprobada - (self.retraso or 0.0) >= instante
+
+
+def _contar_atrasada():
+    contador = _lecturas_atrasadas.get()
+    if contador is None:
+        contador = [0]
+        _lecturas_atrasadas.set(contador)
+    contador[0] += 1
+
+
+class Replicas:
+    """Conjunto de réplicas con su chequeo periódico y la elección de la de cada lectura."""
+
+    def __init__(self, dsns: list, retraso_maximo: float = 5.0, intervalo: float = 2.0,
+                 connection_factory=None, **opciones_pool):
+        self.replicas = [
+            Replica(dsn, db.PoolConexiones(dsn, connection_factory=connection_factory, **opciones_pool))
+            for dsn in dsns
+        ]
+        self.retraso_maximo = retraso_maximo
+        self.intervalo = intervalo
+        self.ultima_escritura = 0.0
+        self._turno = 0
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._hilo = None
+        self.lecturas_primaria = 0
+
+    def anotar_escritura(self):
+        self.ultima_escritura = time.time()
+
+    def _elegir(self):
+        if _cliente_escribio.get():
+            return None
+        sanas = [replica for replica in self.replicas if replica.sana]
+        if not sanas:
+            return None
+        with self._lock:
+            self._turno += 1
+            turno = self._turno
+        return min(
+            enumerate(sanas),
+            key=lambda par: (par[1].pool.en_uso, (par[0] - turno) % len(sanas))
+        )[1]
+
+    @contextmanager
+    def conexion(self):
+        replica = self._elegir()
+        with ExitStack() as pila:
+            conn = None
+            if replica is not None:
+                try:
+                    conn = pila.enter_context(replica.pool.conexion())
+                    if not conn.readonly:
+                        conn.readonly = True
+                    replica.lecturas += 1
+                    if not replica.tiene(self.ultima_escritura):
+                        replica.lecturas_atrasadas += 1
+                        _contar_atrasada()
+                except (psycopg2.Error, db.PoolAgotado) as e:
+                    # Se aparta hasta el siguiente chequeo y la lectura va a la primaria
+                    self._apartar(replica, str(e))
+                    conn = None
+            if conn is None:
+                with self._lock:
+                    self.lecturas_primaria += 1
+                conn = pila.enter_context(db.obtener_conexion())
+            yield conn
+
+    def _apartar(self, replica: Replica, error: str):
+        if replica.sana:
+            logger.warning("Réplica %s fuera de servicio: %s", replica.nombre, error)
+        replica.sana = False
+        replica.error = error
+
+    def chequear(self):
+        for replica in self.replicas:
+            try:
+                with replica.pool.conexion() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(CONSULTA_ESTADO)
+                        en_recuperacion, recibiendo, retraso = cursor.fetchone()
+                    conn.rollback()
+            except Exception as e:
+                self._apartar(replica, str(e))
+                continue
+            replica.retraso = float(retraso)
+            replica.comprobada = time.time()
+            if not en_recuperacion:
+                self._apartar(replica, "no es una réplica (no está en recuperación)")
+            elif not recibiendo:
+                self._apartar(replica, "no recibe WAL de la primaria")
+            elif replica.retraso > self.retraso_maximo:
+                self._apartar(replica, f"retraso de {replica.retraso:.1f}s")
+            else:
+                if not replica.sana:
+                    logger.info("Réplica %s en servicio (retraso %.1fs)", replica.nombre, replica.retraso)
+                replica.sana = True
+                replica.error = None
+
+    def iniciar(self):
+        self.chequear()
+        if self.intervalo <= 0 or self._hilo is not None:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="chequeo-replicas", daemon=True)
+        self._hilo.start()
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            self.chequear()
+
+    def detener(self):
+        if self._hilo is not None:
+            self._parar.set()
+            self._hilo.join()
+            self._hilo = None
+        for replica in self.replicas:
+            replica.pool.cerrar()
+
+    def estadisticas(self) -> dict:
+        return {
+            "lecturas_primaria": self.lecturas_primaria,
+            "replicas": {
+                replica.nombre: {
+                    "sana": replica.sana,
+                    "retraso_s": replica.retraso,
+                    "error": replica.error,
+                    "lecturas": replica.lecturas,
+                    "lecturas_atrasadas": replica.lecturas_atrasadas,
+                    "pool": replica.pool.estadisticas(),
+                }
+                for replica in self.replicas
+            },
+        }
+
+
+_replicas = None
+
+
+def dsns_de_entorno() -> list:
+    return [dsn.strip() for dsn in os.environ.get("DATABASE_REPLICAS", "").split(",") if dsn.strip()]
+
+
+def ventana_de_entorno() -> float:
+    if "DB_LECTURA_PRIMARIA" in os.environ:
+        return float(os.environ["DB_LECTURA_PRIMARIA"])
+    return float(os.environ.get("DB_REPLICAS_RETRASO_MAX", 5)) + float(os.environ.get("DB_REPLICAS_CHEQUEO", 2))
+
+
+def iniciar_replicas(dsns: list, connection_factory=None):
+    """Crea las réplicas (opciones de DB_REPLICAS_* y DB_POOL_*) y hace el primer chequeo."""
+    global _replicas
+    if _replicas is None and dsns:
+        _replicas = Replicas(
+            dsns,
+            retraso_maximo=float(os.environ.get("DB_REPLICAS_RETRASO_MAX", 5)),
+            intervalo=float(os.environ.get("DB_REPLICAS_CHEQUEO", 2)),
+            connection_factory=connection_factory,
+            minimo=int(os.environ.get("DB_POOL_MIN", 1)),
+            maximo=int(os.environ.get("DB_POOL_MAX", 10)),
+            espera=float(os.environ.get("DB_POOL_ESPERA", 5)),
+            chequeo_inactividad=float(os.environ.get("DB_POOL_CHEQUEO", 30)),
+        )
+        _replicas.iniciar()
+    return _replicas
+
+
+def cerrar_replicas():
+    global _replicas
+    if _replicas is not None:
+        _replicas.detener()
+        _replicas = None
+
+
+@contextmanager
+def obtener_conexion_lectura():
+    """Conexión para una lectura: de una réplica sana o, si no toca o no hay, de la primaria."""
+    if _replicas is None:
+        with db.obtener_conexion() as conn:
+            yield conn
+    else:
+        with _replicas.conexion() as conn:
+            yield conn
+
+
+def anotar_escritura():
+    """Apunta que la primaria acaba de cambiar: las réplicas que aún no lo tienen dejan de ser cacheables."""
+    if _replicas is not None:
+        _replicas.anotar_escritura()
+
+
+def lecturas_atrasadas() -> int:
+    """Lecturas de réplica de este contexto (la petición en curso) que podían no tener la última escritura."""
+    contador = _lecturas_atrasadas.get()
+    return contador[0] if contador else 0
+
+
+def estadisticas() -> dict:
+    return _replicas.estadisticas() if _replicas is not None else {}
+
+
+class MiddlewareLecturaPropia:
+    """Middleware ASGI: tras una escritura correcta pone la cookie, y con ella las lecturas van a la primaria.
+
+    También quita los validadores de las respuestas con lecturas atrasadas: su ETag, calculada
+    con las versiones de la primaria, no debe quedar asociada a datos anteriores.
+    """
+
+    def __init__(self, app, ventana: float):
+        self.app = app
+        self.cookie = f"{COOKIE}=1; Max-Age={math.ceil(ventana)}; Path=/; HttpOnly; SameSite=Lax"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        escritura = scope["method"] in METODOS_ESCRITURA
+
+        atrasadas = [0]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                cabeceras = MutableHeaders(raw=mensaje["headers"])
+                if escritura and mensaje["status"] < 400:
+                    cabeceras.append("set-cookie", self.cookie)
+                if atrasadas[0]:
+                    for cabecera in ("etag", "last-modified"):
+                        if cabecera in cabeceras:
+                            del cabeceras[cabecera]
+            await send(mensaje)
+
+        marca = _cliente_escribio.set(COOKIE in cookie_parser(Headers(scope=scope).get("cookie", "")))
+        marca_atrasadas = _lecturas_atrasadas.set(atrasadas)
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _lecturas_atrasadas.reset(marca_atrasadas)
+            _cliente_escribio.reset(marca)
@@ -0,0 +1,41 @@
+"""Serialización JSON rápida para las respuestas de la API.
+
+Con orjson (opcional) los datetime, date y UUID se serializan de forma nativa;
+sin él se usa json de la biblioteca estándar con un `default` equivalente.
+Los handlers que devuelven `RespuestaJSON(...)` directamente se saltan además
+el `jsonable_encoder` de FastAPI, que recorre todo el contenido en Python.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+
+def _por_defecto(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, (UUID, Decimal)):
+        return str(valor)
+    raise TypeError(f"{type(valor).__name__} no es serializable a JSON")
+
+
+def serializar(contenido) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(contenido, default=_por_defecto, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        contenido, default=_por_defecto, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse que serializa con `serializar` (orjson si está instalado)."""
+
+    def render(self, content) -> bytes:
+        return serializar(content)
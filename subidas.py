@@ -0,0 +1,298 @@
+"""Subidas de imágenes: escritura por bloques, direccionamiento por contenido y recolección.
+
+Cada archivo se escribe a disco en bloques mientras se calcula su SHA-256 y
+se guarda como `<sha256>.<ext>`, así que subir dos veces la misma imagen deja
+un único archivo. Las referencias desde juegos, consolas y accesorios se
+cuentan en la tabla `imagenes` mediante triggers (ver la migración 9), y la
+recolección borra los archivos que se quedan sin referencias tras una
+actualización o un borrado.
+
+El tipo se decide por la firma de los primeros bytes, no por el nombre ni por
+el Content-Type que envía el cliente.
+
+Uso desde la línea de comandos:
+    python subidas.py recolectar     # borra las imágenes sin referencias
+    python subidas.py consolidar     # renombra las subidas antiguas a su hash
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import db
+
+logger = logging.getLogger(__name__)
+
+TAM_BLOQUE = 64 * 1024
+PREFIJO_URL = "/static/uploads/"
+DERIVADAS = "derivadas"  # subcarpeta de miniaturas (ver miniaturas.py)
+DIRECTORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "uploads")
+MAX_BYTES = int(os.environ.get("SUBIDAS_MAX_BYTES", 10 * 1024 * 1024))
+# Un archivo sin referencias no se borra hasta pasado este margen: cubre las
+# subidas que ya están en disco pero cuya fila aún no se ha confirmado.
+GRACIA_SEGUNDOS = float(os.environ.get("SUBIDAS_GRACIA", 3600))
+
+# Sólo se barren como huérfanos los archivos con nombre de hash y los temporales;
+# las subidas antiguas (uuid4) se pasan antes por `consolidar`.
+NOMBRE_RECOLECTABLE = re.compile(r"^([0-9a-f]{64}\.\w+|\.subida-.*|\.borrada-.*)$")
+PREFIJO_LAPIDA = ".borrada-"  # original apartado por `recolectar` hasta confirmar el borrado de su fila
+
+# firma -> extensión
+FIRMAS = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+
+
+class SubidaInvalida(ValueError):
+    """El archivo subido no es una imagen de un tipo admitido."""
+
+
+class SubidaDemasiadoGrande(SubidaInvalida):
+    """El archivo subido supera el tamaño máximo permitido."""
+
+
+def detectar_extension(cabecera: bytes):
+    for firma, extension in FIRMAS:
+        if cabecera.startswith(firma):
+            return extension
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "webp"
+    if cabecera[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    return None
+
+
+def guardar(archivo, directorio: str = DIRECTORIO, max_bytes: int = MAX_BYTES):
+    """Guarda un UploadFile por bloques y devuelve su URL, o None si no se envió archivo.
+
+    Se llama desde handlers síncronos, que FastAPI ejecuta en su threadpool,
+    así que la lectura y la escritura no bloquean el event loop.
+    """
+    if archivo is None or not archivo.filename:
+        return None
+    origen = archivo.file
+    origen.seek(0)
+    primero = origen.read(TAM_BLOQUE)
+    if not primero:
+        return None
+    extension = detectar_extension(primero)
+    if extension is None:
+        raise SubidaInvalida("Tipo de imagen no admitido (se aceptan JPEG, PNG, GIF, WebP y AVIF)")
+
+    resumen = hashlib.sha256()
+    total = 0
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=".subida-")
+    try:
+        with os.fdopen(descriptor, "wb") as destino:
+            bloque = primero
+            while bloque:
+                total += len(bloque)
+                if total > max_bytes:
+                    raise SubidaDemasiadoGrande(f"La imagen supera el máximo de {max_bytes} bytes")
+                resumen.update(bloque)
+                destino.write(bloque)
+                bloque = origen.read(TAM_BLOQUE)
+        nombre = f"{resumen.hexdigest()}.{extension}"
+        ruta = os.path.join(directorio, nombre)
+        try:
+            # Ya existe el mismo contenido: se reutiliza y se renueva su margen de gracia
+            os.utime(ruta)
+            os.remove(temporal)
+        except FileNotFoundError:
+            # No existe o el recolector acaba de apartarlo: se guarda esta copia
+            os.chmod(temporal, 0o644)
+            os.replace(temporal, ruta)
+        return PREFIJO_URL + nombre
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+def _antiguo(ruta: str, gracia: float) -> bool:
+    try:
+        return time.time() - os.path.getmtime(ruta) > gracia
+    except FileNotFoundError:
+        return False
+
+
+def borrar_archivos(directorio: str, nombre: str) -> int:
+    """Borra un original y sus derivadas `<raiz>-*`; devuelve cuántos archivos se borraron."""
+    rutas = [os.path.join(directorio, nombre)]
+    carpeta = os.path.join(directorio, DERIVADAS)
+    if os.path.isdir(carpeta):
+        raiz = os.path.splitext(nombre)[0] + "-"
+        rutas += [os.path.join(carpeta, n) for n in os.listdir(carpeta) if n.startswith(raiz)]
+    borrados = 0
+    for ruta in rutas:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+            borrados += 1
+    return borrados
+
+
+def _apartar(directorio: str, nombre: str, gracia: float):
+    """Renombra el original a su lápida; devuelve la ruta de la lápida, o None si no hay que borrarlo.
+
+    Una subida del mismo contenido que llegue antes del renombrado renueva la fecha del
+    archivo (os.utime en `guardar`) y aquí se devuelve a su sitio; una que llegue después
+    ya no lo encuentra y guarda su propia copia. En ningún caso se borra lo que acaba de
+    referenciarse.
+    """
+    ruta = os.path.join(directorio, nombre)
+    lapida = os.path.join(directorio, PREFIJO_LAPIDA + nombre)
+    try:
+        os.replace(ruta, lapida)
+    except FileNotFoundError:
+        return lapida if not os.path.exists(ruta) else None
+    if not _antiguo(lapida, gracia):
+        os.replace(lapida, ruta)
+        return None
+    return lapida
+
+
+def recolectar(conn, directorio: str = DIRECTORIO, gracia: float = GRACIA_SEGUNDOS) -> int:
+    """Borra las imágenes sin referencias y los archivos huérfanos; devuelve cuántos se borraron.
+
+    Los originales se apartan como lápidas antes de confirmar el DELETE de sus filas y sólo
+    se borran después: si la transacción falla, vuelven a su sitio.
+    """
+    borrados = 0
+    lapidas = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT url FROM imagenes WHERE referencias <= 0 AND actualizada < %s FOR UPDATE SKIP LOCKED",
+                (datetime.now(timezone.utc) - timedelta(seconds=gracia),)
+            )
+            sin_referencias = [fila[0] for fila in cursor.fetchall()]
+            eliminadas = []
+            for url in sin_referencias:
+                nombre = os.path.basename(url)
+                lapida = _apartar(directorio, nombre, gracia)
+                if lapida is None:
+                    continue
+                lapidas.append((nombre, lapida))
+                eliminadas.append(url)
+            if eliminadas:
+                cursor.execute("DELETE FROM imagenes WHERE url = ANY(%s) AND referencias <= 0", (eliminadas,))
+            cursor.execute("SELECT url FROM imagenes")
+            conocidas = {os.path.basename(fila[0]) for fila in cursor.fetchall()}
+        conn.commit()
+    except BaseException:
+        for nombre, lapida in lapidas:
+            if os.path.exists(lapida) and not os.path.exists(os.path.join(directorio, nombre)):
+                os.replace(lapida, os.path.join(directorio, nombre))
+        raise
+
+    for nombre, lapida in lapidas:
+        if os.path.exists(lapida):
+            os.remove(lapida)
+            borrados += 1
+        # Si entretanto se volvió a subir, sus miniaturas son las de la nueva subida
+        if not os.path.exists(os.path.join(directorio, nombre)):
+            borrados += borrar_archivos(directorio, nombre)
+    # Archivos que nunca llegaron a referenciarse (p. ej. la fila falló al insertarse)
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        if nombre in conocidas or not NOMBRE_RECOLECTABLE.match(nombre):
+            continue
+        if not os.path.isfile(ruta) or not _antiguo(ruta, gracia):
+            continue
+        borrados += borrar_archivos(directorio, nombre)
+    return borrados
+
+
+def consolidar(conn, directorio: str = DIRECTORIO) -> int:
+    """Renombra las subidas antiguas (uuid4) a su hash y repunta las filas; devuelve cuántas cambiaron."""
+    cambiadas = 0
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT url FROM imagenes WHERE referencias > 0")
+        for (url,) in cursor.fetchall():
+            ruta = os.path.join(directorio, os.path.basename(url))
+            if not os.path.isfile(ruta):
+                continue
+            with open(ruta, "rb") as origen:
+                extension = detectar_extension(origen.read(16))
+                origen.seek(0)
+                resumen = hashlib.sha256()
+                for bloque in iter(lambda: origen.read(TAM_BLOQUE), b""):
+                    resumen.update(bloque)
+            if extension is None:
+                continue
+            nuevo = f"{resumen.hexdigest()}.{extension}"
+            if nuevo == os.path.basename(url):
+                continue
+            destino = os.path.join(directorio, nuevo)
+            if not os.path.exists(destino):
+                os.link(ruta, destino)
+            for tabla in ("juegos", "consolas", "accesorios"):
+                cursor.execute(
+                    f"UPDATE {tabla} SET imagen = %s, version = version + 1 WHERE imagen = %s", (PREFIJO_URL + nuevo, url)
+                )
+            cambiadas += 1
+    conn.commit()
+    return cambiadas
+
+
+class RecolectorPeriodico:
+    """Hilo que llama a `recolectar` cada `intervalo` segundos con una conexión del pool."""
+
+    def __init__(self, obtener_conexion, intervalo: float):
+        self._obtener_conexion = obtener_conexion
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        if self.intervalo <= 0 or self._hilo is not None:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="recolector-subidas", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if self._hilo is not None:
+            self._parar.set()
+            self._hilo.join()
+            self._hilo = None
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                with self._obtener_conexion() as conn:
+                    borrados = recolectar(conn)
+                if borrados:
+                    logger.info("Recolector de subidas: %d archivos borrados", borrados)
+            except Exception:
+                logger.exception("Error en el recolector de subidas")
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Mantenimiento de las imágenes subidas")
+    parser.add_argument("accion", choices=["recolectar", "consolidar"])
+    parser.add_argument("--gracia", type=float, default=GRACIA_SEGUNDOS,
+                        help="Segundos que se conserva un archivo sin referencias")
+    args = parser.parse_args(argv)
+
+    conn = db.conectar(os.environ.get("DATABASE_URL"))
+    try:
+        if args.accion == "consolidar":
+            print(f"{consolidar(conn)} imágenes renombradas a su hash")
+        print(f"{recolectar(conn, gracia=args.gracia)} archivos borrados")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,411 @@
+"""Sugerencias de búsqueda mientras se escribe (/api/sugerencias).
+
+Índice en memoria con los nombres de juegos, consolas y accesorios y con los
+desarrolladores y fabricantes. Se construye al arrancar y se actualiza por
+incrementos en cada escritura de este proceso, así que una consulta no toca
+la base de datos: es una búsqueda binaria en una lista ordenada de claves y
+los k mejores del rango por popularidad. Cada palabra de un nombre empieza
+una clave, para que "zel" encuentre "The Legend of Zelda".
+
+Los prefijos de una o dos letras abarcan gran parte del índice, así que sus
+MAX_LIMITE mejores por tipo se precalculan y cada cambio sólo recoloca los
+elementos que toca. Los resultados de los prefijos más largos se guardan
+hasta que cambia algún elemento con una clave que empieza por ellos.
+`sugerir_rapido` responde sólo con lo ya calculado y sin esperar al lock
+(para el bucle de eventos); lo que haya que recorrer se hace con `sugerir`
+en el threadpool.
+
+Popularidad: relaciones del elemento (consolas de un juego, juegos de una
+consola, consolas de un accesorio, elementos de un desarrollador o de un
+fabricante) más las veces que ha salido en /api/buscar en este proceso.
+
+Los cambios de otros workers o de importaciones se recogen reconstruyendo el
+índice cada `intervalo` segundos si las versiones de las tablas (ver
+versiones.py) han cambiado.
+"""
+import bisect
+import functools
+import heapq
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Tipo de cada sugerencia y, para juegos y consolas, el grupo al que pertenecen
+GRUPOS = {"juegos": "desarrolladores", "consolas": "fabricantes"}
+TIPOS = ("juegos", "consolas", "accesorios", "desarrolladores", "fabricantes")
+TABLAS_ORIGEN = ("juegos", "consolas", "accesorios", "compatibilidad", "accesorio_consola")
+MAX_PALABRAS = 8  # claves por nombre: las palabras a partir de la octava no inician sugerencias
+MAX_RESULTADOS_CACHEADOS = 1024
+MAX_LIMITE = 20  # el máximo de /api/sugerencias: lo que guarda cada lista precalculada
+LARGO_CORTO = 2  # prefijos de hasta tantas letras con lista precalculada
+_FIN = "\U0010ffff"
+
+CONSULTAS = {
+    "juegos": """
+        SELECT j.id, j.nombre, j.desarrollador,
+               (SELECT count(DISTINCT c.consola_id) FROM compatibilidad c WHERE c.juego_id = j.id)
+        FROM juegos j
+    """,
+    "consolas": """
+        SELECT co.id, co.nombre, co.fabricante,
+               (SELECT count(DISTINCT c.juego_id) FROM compatibilidad c WHERE c.consola_id = co.id)
+        FROM consolas co
+    """,
+    "accesorios": """
+        SELECT a.id, a.nombre, NULL,
+               (SELECT count(*) FROM accesorio_consola ac WHERE ac.accesorio_id = a.id)
+        FROM accesorios a
+    """,
+}
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con los espacios colapsados."""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_tildes.casefold().split())
+
+
+def _claves(texto: str) -> list:
+    palabras = normalizar(texto).split()
+    return [" ".join(palabras[i:]) for i in range(min(len(palabras), MAX_PALABRAS))]
+
+
+def _prefijos_cortos(texto: str) -> set:
+    return {clave[:largo] for clave in _claves(texto) for largo in range(1, min(len(clave), LARGO_CORTO) + 1)}
+
+
+def _orden(elementos: dict, aciertos: dict, elemento: tuple):
+    texto, relaciones, _ = elementos[elemento]
+    # Desempate por tipo e id: el mismo orden venga la lista precalculada o del recorrido
+    return (-(relaciones + aciertos.get(elemento, 0)), len(texto), texto.casefold(), elemento[0], str(elemento[1]))
+
+
+def _calcular_cortos(elementos: dict, aciertos: dict) -> dict:
+    """{(prefijo corto, tipo): sus MAX_LIMITE mejores elementos, en orden}."""
+    por_prefijo = {}
+    for elemento, (texto, _, _) in elementos.items():
+        for prefijo in _prefijos_cortos(texto):
+            por_prefijo.setdefault((prefijo, elemento[0]), []).append(elemento)
+    orden = functools.partial(_orden, elementos, aciertos)
+    return {clave: heapq.nsmallest(MAX_LIMITE, lista, key=orden) for clave, lista in por_prefijo.items()}
+
+
+class IndiceSugerencias:
+    """Lista ordenada de (clave, tipo, id) más los datos de cada elemento; seguro entre hilos."""
+
+    def __init__(self, obtener_conexion, intervalo: float = 30.0, versiones=None):
+        self._obtener_conexion = obtener_conexion
+        self.intervalo = intervalo
+        self._versiones = versiones  # () -> {tabla: (version, modificada)} o None
+        self._lock = threading.Lock()
+        self._claves = []
+        self._elementos = {}  # (tipo, id) -> [texto, relaciones, grupo]
+        self._aciertos = {}   # (tipo, id) -> veces en resultados de /api/buscar
+        self._cortos = {}     # (prefijo corto, tipo) -> sus MAX_LIMITE mejores; sin entrada, ningún candidato
+        self._pendientes = set()  # listas de _cortos que hay que recalcular recorriendo el índice
+        self._resultados = OrderedDict()
+        self._firma = None
+        self._parar = threading.Event()
+        self._hilo = None
+        self.recargas = 0
+        self.consultas = 0
+        self.aciertos_cache = 0
+        self.precalculadas = 0
+
+    # --- Construcción ---
+
+    def recargar(self):
+        """Reconstruye el índice desde la base de datos y lo sustituye de una vez."""
+        firma = self._firma_actual()
+        filas = {}
+        with self._obtener_conexion() as conn:
+            cursor = conn.cursor()
+            try:
+                for tipo, consulta in CONSULTAS.items():
+                    cursor.execute(consulta)
+                    filas[tipo] = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        claves, elementos = [], {}
+        for tipo, lista in filas.items():
+            for id_, texto, grupo, relaciones in lista:
+                clave_grupo = self._sumar_grupo(elementos, tipo, grupo, 1)
+                elementos[(tipo, id_)] = [texto, relaciones, clave_grupo]
+        for (tipo, id_), (texto, _, _) in elementos.items():
+            claves.extend((clave, tipo, id_) for clave in _claves(texto))
+        claves.sort()
+        with self._lock:
+            aciertos = dict(self._aciertos)
+        cortos = _calcular_cortos(elementos, aciertos)
+        with self._lock:
+            self._claves = claves
+            self._elementos = elementos
+            self._cortos = cortos
+            self._pendientes.clear()
+            self._resultados.clear()
+            self._firma = firma
+            self.recargas += 1
+
+    def _firma_actual(self):
+        mapa = self._versiones() if self._versiones else None
+        return tuple(mapa.get(tabla, (None,))[0] for tabla in TABLAS_ORIGEN) if mapa else None
+
+    # --- Cambios incrementales ---
+
+    @staticmethod
+    def _clave_grupo(tipo: str, texto):
+        if tipo not in GRUPOS or not normalizar(texto):
+            return None
+        return GRUPOS[tipo], normalizar(texto)
+
+    @classmethod
+    def _sumar_grupo(cls, elementos: dict, tipo: str, texto, cantidad: int):
+        """Cuenta un elemento más (o menos) en su desarrollador/fabricante; devuelve la clave del grupo."""
+        clave = cls._clave_grupo(tipo, texto)
+        if clave is None:
+            return None
+        grupo = elementos.setdefault(clave, [texto, 0, None])
+        grupo[1] += cantidad
+        return clave
+
+    def _insertar(self, tipo: str, id_, texto: str):
+        for clave in _claves(texto):
+            bisect.insort(self._claves, (clave, tipo, id_))
+
+    def _borrar(self, tipo: str, id_, texto: str):
+        for clave in _claves(texto):
+            posicion = bisect.bisect_left(self._claves, (clave, tipo, id_))
+            if posicion < len(self._claves) and self._claves[posicion] == (clave, tipo, id_):
+                del self._claves[posicion]
+
+    def _quitar(self, tipo: str, id_):
+        elemento = self._elementos.pop((tipo, id_), None)
+        if elemento is None:
+            return None
+        texto, relaciones, clave_grupo = elemento
+        self._borrar(tipo, id_, texto)
+        if clave_grupo is not None:
+            grupo = self._elementos[clave_grupo]
+            grupo[1] -= 1
+            if grupo[1] <= 0:
+                del self._elementos[clave_grupo]
+                self._borrar(*clave_grupo, grupo[0])
+        return relaciones
+
+    def _textos(self, *elementos) -> dict:
+        """{elemento: su texto actual o None} de los que se van a tocar, para `_actualizar` después."""
+        return {
+            elemento: self._elementos[elemento][0] if elemento in self._elementos else None
+            for elemento in elementos if elemento is not None
+        }
+
+    def _actualizar(self, anteriores: dict):
+        """Recoloca en las listas precalculadas los elementos cambiados y olvida los resultados que dependían de ellos."""
+        claves = set()
+        # Primero los que ya no existen, para que ninguna lista ordene con un elemento borrado
+        for elemento, anterior in sorted(anteriores.items(), key=lambda par: par[0] in self._elementos):
+            actual = self._elementos.get(elemento)
+            textos = {texto for texto in (anterior, actual and actual[0]) if texto}
+            claves.update(clave for texto in textos for clave in _claves(texto))
+            self._recolocar(elemento, {prefijo for texto in textos for prefijo in _prefijos_cortos(texto)})
+        self._olvidar(claves)
+
+    def _olvidar(self, claves: set):
+        """Descarta los resultados guardados de prefijos de alguna de `claves`."""
+        for consulta in [c for c in self._resultados if any(clave.startswith(c[0]) for clave in claves)]:
+            del self._resultados[consulta]
+
+    def _recolocar(self, elemento: tuple, prefijos: set):
+        """Pone al día las listas de `prefijos` del tipo de `elemento` tras cambiarlo o quitarlo."""
+        actual = self._elementos.get(elemento)
+        ahora = _prefijos_cortos(actual[0]) if actual else set()
+        for prefijo in prefijos | ahora:
+            clave = (prefijo, elemento[0])
+            if clave in self._pendientes:
+                continue
+            previa = self._cortos.get(clave, [])
+            lista = [e for e in previa if e != elemento]
+            if prefijo in ahora:
+                lista.append(elemento)
+                lista.sort(key=self._orden)
+            # Si estaba en una lista llena y ha bajado al final (o salido), quizá otro de fuera la supera
+            if elemento in previa and len(previa) == MAX_LIMITE and (
+                    prefijo not in ahora or lista.index(elemento) >= MAX_LIMITE - 1):
+                self._pendientes.add(clave)
+            elif lista:
+                self._cortos[clave] = lista[:MAX_LIMITE]
+            else:
+                self._cortos.pop(clave, None)
+
+    def poner(self, tipo: str, id_: int, nombre: str, grupo: str = None, relaciones: int = None):
+        """Crea o sustituye un elemento; sin `relaciones` conserva las que tenía."""
+        with self._lock:
+            previo = self._elementos.get((tipo, id_))
+            anteriores = self._textos((tipo, id_), previo and previo[2], self._clave_grupo(tipo, grupo))
+            relaciones_previas = self._quitar(tipo, id_)
+            clave_grupo = self._sumar_grupo(self._elementos, tipo, grupo, 1)
+            if clave_grupo is not None and self._elementos[clave_grupo][1] == 1:
+                self._insertar(*clave_grupo, grupo)
+            if relaciones is None:
+                relaciones = relaciones_previas or 0
+            self._elementos[(tipo, id_)] = [nombre, relaciones, clave_grupo]
+            self._insertar(tipo, id_, nombre)
+            self._actualizar(anteriores)
+
+    def quitar(self, tipo: str, id_: int):
+        with self._lock:
+            previo = self._elementos.get((tipo, id_))
+            anteriores = self._textos((tipo, id_), previo and previo[2])
+            self._quitar(tipo, id_)
+            self._aciertos.pop((tipo, id_), None)
+            self._actualizar(anteriores)
+
+    def anotar_resultados(self, resultados: dict):
+        """Suma un acierto a cada elemento de una respuesta de /api/buscar ({tipo: [filas con id]})."""
+        with self._lock:
+            claves = set()
+            for tipo in ("juegos", "consolas", "accesorios"):
+                for fila in resultados.get(tipo, ()):
+                    clave = (tipo, fila["id"])
+                    self._aciertos[clave] = self._aciertos.get(clave, 0) + 1
+                    if clave in self._elementos:
+                        self._subir(clave)
+                        claves.update(_claves(self._elementos[clave][0]))
+            self._olvidar(claves)
+
+    def _subir(self, elemento: tuple):
+        """Tras sumarle un acierto: sólo puede ganar puestos, nunca deja una lista incompleta."""
+        for prefijo in _prefijos_cortos(self._elementos[elemento][0]):
+            clave = (prefijo, elemento[0])
+            lista = self._cortos.get(clave, [])
+            if clave in self._pendientes:
+                continue
+            if elemento in lista or len(lista) < MAX_LIMITE or self._orden(elemento) < self._orden(lista[-1]):
+                self._cortos[clave] = sorted(set(lista) | {elemento}, key=self._orden)[:MAX_LIMITE]
+
+    # --- Consulta ---
+
+    def sugerir(self, prefijo: str, limite: int = 8, tipos: tuple = None) -> list:
+        """Los `limite` elementos más populares cuyo nombre tiene una palabra que empieza por `prefijo`.
+
+        Puede recorrer el rango del prefijo en el índice: desde el bucle de eventos, mejor
+        `sugerir_rapido` y, si devuelve None, esta en el threadpool.
+        """
+        clave = normalizar(prefijo)
+        if not clave:
+            return []
+        with self._lock:
+            self.consultas += 1
+            resultado = self._en_memoria(clave, limite, tipos)
+            if resultado is not None:
+                return resultado
+            if len(clave) <= LARGO_CORTO and limite <= MAX_LIMITE:
+                for tipo in tipos or TIPOS:
+                    if (clave, tipo) in self._pendientes:
+                        self._recalcular(clave, tipo)
+                return self._en_memoria(clave, limite, tipos)
+            candidatos = {(tipo, id_) for _, tipo, id_ in self._rango(clave) if not tipos or tipo in tipos}
+            resultado = self._formatear(heapq.nsmallest(limite, candidatos, key=self._orden))
+            self._resultados[(clave, limite, tipos)] = resultado
+            if len(self._resultados) > MAX_RESULTADOS_CACHEADOS:
+                self._resultados.popitem(last=False)
+            return resultado
+
+    def sugerir_rapido(self, prefijo: str, limite: int = 8, tipos: tuple = None):
+        """Como `sugerir` si sale de lo ya calculado y el lock está libre; si no, None (sin bloquear)."""
+        clave = normalizar(prefijo)
+        if not clave:
+            return []
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            resultado = self._en_memoria(clave, limite, tipos)
+            if resultado is not None:
+                self.consultas += 1
+            return resultado
+        finally:
+            self._lock.release()
+
+    def _en_memoria(self, clave: str, limite: int, tipos: tuple):
+        """Resultado de las listas precalculadas o de los guardados, o None si hay que recorrer el índice."""
+        if len(clave) <= LARGO_CORTO and limite <= MAX_LIMITE:
+            tipos = tipos or TIPOS
+            if any((clave, tipo) in self._pendientes for tipo in tipos):
+                return None
+            self.precalculadas += 1
+            listas = [self._cortos.get((clave, tipo), ()) for tipo in tipos]
+            return self._formatear(heapq.nsmallest(limite, [e for lista in listas for e in lista], key=self._orden))
+        consulta = (clave, limite, tipos)
+        guardado = self._resultados.get(consulta)
+        if guardado is not None:
+            self._resultados.move_to_end(consulta)
+            self.aciertos_cache += 1
+        return guardado
+
+    def _rango(self, clave: str) -> list:
+        inicio = bisect.bisect_left(self._claves, (clave,))
+        fin = bisect.bisect_left(self._claves, (clave + _FIN,), inicio)
+        return self._claves[inicio:fin]
+
+    def _recalcular(self, prefijo: str, tipo: str):
+        candidatos = {(t, id_) for _, t, id_ in self._rango(prefijo) if t == tipo}
+        self._pendientes.discard((prefijo, tipo))
+        if candidatos:
+            self._cortos[(prefijo, tipo)] = heapq.nsmallest(MAX_LIMITE, candidatos, key=self._orden)
+        else:
+            self._cortos.pop((prefijo, tipo), None)
+
+    def _formatear(self, mejores: list) -> list:
+        return [
+            {"tipo": tipo, "id": id_ if isinstance(id_, int) else None, "texto": self._elementos[(tipo, id_)][0]}
+            for tipo, id_ in mejores
+        ]
+
+    def _orden(self, elemento: tuple):
+        return _orden(self._elementos, self._aciertos, elemento)
+
+    # --- Reconstrucción periódica ---
+
+    def iniciar(self):
+        """Construye el índice y arranca el hilo que lo reconstruye si otro proceso cambió el catálogo."""
+        try:
+            self.recargar()
+        except Exception:
+            logger.exception("Error al construir el índice de sugerencias")
+        if self.intervalo <= 0 or self._hilo is not None:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="indice-sugerencias", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if self._hilo is not None:
+            self._parar.set()
+            self._hilo.join()
+            self._hilo = None
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                firma = self._firma_actual()
+                if firma is None or firma != self._firma:
+                    self.recargar()
+            except Exception:
+                logger.exception("Error al reconstruir el índice de sugerencias")
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "claves": len(self._claves),
+                "elementos": len(self._elementos),
+                "recargas": self.recargas,
+                "consultas": self.consultas,
+                "aciertos_cache": self.aciertos_cache,
+                "precalculadas": self.precalculadas,
+                "listas_precalculadas": len(self._cortos),
+            }
@@ -0,0 +1,81 @@
+"""Fixtures comunes: la aplicación contra SQLite y, si se indica, contra PostgreSQL.
+
+Las pruebas parametrizadas con `url_base` se ejecutan una vez por motor. SQLite
+usa un archivo temporal; PostgreSQL sólo se prueba con PRUEBAS_POSTGRES_URL,
+que debe apuntar a una base de datos desechable: cada módulo de pruebas borra
+y recrea su esquema public.
+
+main.py lee la configuración del entorno al importarse, así que `cliente` lo
+importa de nuevo en cada módulo con el entorno de su motor.
+"""
+import importlib
+import os
+import sys
+
+import psycopg2
+import pytest
+from fastapi.testclient import TestClient
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+POSTGRES_URL = os.environ.get("PRUEBAS_POSTGRES_URL")
+CLAVE_HISTORIAL = "0000"
+
+
+def _vaciar_postgres(url: str):
+    conn = psycopg2.connect(url)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("DROP SCHEMA public CASCADE")
+            cursor.execute("CREATE SCHEMA public")
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="module", params=["sqlite", "postgresql"])
+def url_base(request, tmp_path_factory):
+    if request.param == "sqlite":
+        return f"sqlite:///{tmp_path_factory.mktemp('sqlite') / 'catalogo.db'}"
+    if not POSTGRES_URL:
+        pytest.skip("PRUEBAS_POSTGRES_URL no está definida")
+    try:
+        _vaciar_postgres(POSTGRES_URL)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL no disponible: {e}")
+    return POSTGRES_URL
+
+
+@pytest.fixture(scope="module")
+def cliente(url_base, tmp_path_factory):
+    """TestClient con la aplicación arrancada (migraciones incluidas) sobre `url_base`."""
+    entorno = pytest.MonkeyPatch()
+    entorno.setenv("DATABASE_URL", url_base)
+    entorno.delenv("DATABASE_REPLICAS", raising=False)
+    entorno.setenv("HISTORIAL_SINCRONO", "1")
+    entorno.setenv("HISTORIAL_MANTENIMIENTO", "0")
+    entorno.setenv("CAMBIOS_TIEMPO_REAL", "0")
+    entorno.setenv("MINIATURAS_PROCESOS", "0")
+    entorno.setenv("CACHE_BACKEND", "memoria")
+    entorno.chdir(RAIZ)
+    sys.modules.pop("main", None)
+    main = importlib.import_module("main")
+    main.mantenimiento_historial.directorio = str(tmp_path_factory.mktemp("archivo_historial"))
+    try:
+        with TestClient(main.app) as cliente:
+            yield cliente
+    finally:
+        sys.modules.pop("main", None)
+        entorno.undo()
+
+
+@pytest.fixture(scope="module")
+def main(cliente):
+    """El módulo main importado por `cliente`."""
+    return sys.modules["main"]
+
+
+@pytest.fixture(scope="module")
+def es_sqlite(url_base) -> bool:
+    return url_base.startswith("sqlite:")
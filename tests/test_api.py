@@ -0,0 +1,215 @@
+"""La API de punta a punta con SQLite y PostgreSQL: CRUD, búsqueda, compatibilidad, comparaciones e historial."""
+from conftest import CLAVE_HISTORIAL
+
+
+def ok(respuesta, codigo=200):
+    assert respuesta.status_code == codigo, (respuesta.status_code, respuesta.text)
+    return respuesta.json()
+
+
+def crear_consola(cliente, nombre, fabricante="Nintendo"):
+    return ok(cliente.post("/api/consolas", data={"nombre": nombre, "fabricante": fabricante}), 201)["id"]
+
+
+def crear_accesorio(cliente, nombre, consolas, tipo="Mando"):
+    datos = {"nombre": nombre, "tipo": tipo, "consolas_compatibles": [str(c) for c in consolas]}
+    return ok(cliente.post("/api/accesorios", data=datos), 201)["id"]
+
+
+def crear_juego(cliente, nombre, consolas=(), accesorios=(), desarrollador="Nintendo"):
+    datos = {
+        "nombre": nombre, "genero": "Aventura", "desarrollador": desarrollador,
+        "consolas": [str(c) for c in consolas], "accesorios": [str(a) for a in accesorios],
+    }
+    return ok(cliente.post("/api/juegos", data=datos), 201)["id"]
+
+
+def nombres(resultado, tipo):
+    return [item["nombre"] for item in resultado[tipo]]
+
+
+def ids(pagina):
+    return [item["id"] for item in pagina["items"]]
+
+
+# --- CRUD ---
+
+def test_crear_leer_actualizar_y_eliminar_juego(cliente):
+    consola = crear_consola(cliente, "Wii U")
+    juego = crear_juego(cliente, "Pikmin 3", [consola])
+
+    respuesta = cliente.get(f"/api/juegos/{juego}")
+    assert ok(respuesta)["nombre"] == "Pikmin 3"
+    etiqueta = respuesta.headers["etag"]
+    assert cliente.get(f"/api/juegos/{juego}", headers={"If-None-Match": etiqueta}).status_code == 304
+
+    datos = {"nombre": "Pikmin 3 Deluxe", "genero": "Estrategia", "desarrollador": "Nintendo", "consolas": [str(consola)]}
+    respuesta = cliente.put(f"/api/juegos/{juego}", data=datos, headers={"If-Match": etiqueta})
+    ok(respuesta)
+    assert respuesta.headers["etag"] != etiqueta
+    assert ok(cliente.get(f"/api/juegos/{juego}"))["genero"] == "Estrategia"
+    assert juego in ids(ok(cliente.get("/api/juegos", params={"limite": 200})))
+
+    ok(cliente.delete(f"/api/juegos/{juego}"))
+    assert cliente.get(f"/api/juegos/{juego}").status_code == 404
+    assert cliente.delete(f"/api/juegos/{juego}").status_code == 404
+
+
+def test_if_match_obsoleto_no_pisa_el_cambio(cliente):
+    consola = crear_consola(cliente, "Game Boy")
+    etiqueta = cliente.get(f"/api/consolas/{consola}").headers["etag"]
+    ok(cliente.put(f"/api/consolas/{consola}", data={"nombre": "Game Boy Color", "fabricante": "Nintendo"}))
+
+    datos = {"nombre": "Game Boy Pocket", "fabricante": "Nintendo"}
+    assert cliente.put(f"/api/consolas/{consola}", data=datos, headers={"If-Match": etiqueta}).status_code == 412
+    assert cliente.delete(f"/api/consolas/{consola}", headers={"If-Match": etiqueta}).status_code == 412
+    assert ok(cliente.get(f"/api/consolas/{consola}"))["nombre"] == "Game Boy Color"
+
+
+def test_actualizar_accesorio_cambia_sus_consolas(cliente):
+    primera, segunda = crear_consola(cliente, "Xbox One", "Microsoft"), crear_consola(cliente, "Xbox Series", "Microsoft")
+    accesorio = crear_accesorio(cliente, "Mando Elite", [primera])
+    datos = {"nombre": "Mando Elite 2", "tipo": "Mando", "consolas_compatibles": [str(segunda)]}
+    ok(cliente.put(f"/api/accesorios/{accesorio}", data=datos))
+
+    assert ids(ok(cliente.get("/api/compatibilidad/accesorios", params={"consola": [primera]}))) == []
+    assert ids(ok(cliente.get("/api/compatibilidad/accesorios", params={"consola": [segunda]}))) == [accesorio]
+
+
+def test_las_miniaturas_cambian_la_etiqueta(cliente, main):
+    juego = crear_juego(cliente, "Pikmin 4")
+    url = "/static/uploads/pikmin4.png"
+    with main.obtener_conexion() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE juegos SET imagen = %s WHERE id = %s", (url, juego))
+        conn.commit()
+    etiqueta = cliente.get(f"/api/juegos/{juego}").headers["etag"]
+
+    with main.obtener_conexion() as conn:
+        with conn.cursor() as cursor:
+            main.miniaturas.guardar_variantes(cursor, url, {"ancho": 64, "alto": 64, "variantes": []})
+        conn.commit()
+    main.cache.invalidar("juegos")  # lo que hace el procesador de imágenes al terminar
+
+    respuesta = cliente.get(f"/api/juegos/{juego}", headers={"If-None-Match": etiqueta})
+    assert ok(respuesta)["imagen_variantes"]["ancho"] == 64
+    assert respuesta.headers["etag"] != etiqueta
+
+
+# --- Búsqueda ---
+
+def test_busqueda_por_prefijo_en_todas_las_tablas(cliente):
+    consola = crear_consola(cliente, "Mega Drive", "Sega")
+    crear_juego(cliente, "Sonic the Hedgehog", [consola], desarrollador="Sega")
+    crear_accesorio(cliente, "Mando Sega", [consola])
+
+    resultado = ok(cliente.get("/api/buscar", params={"q": "son hedge"}))
+    assert nombres(resultado, "juegos") == ["Sonic the Hedgehog"]
+
+    resultado = ok(cliente.get("/api/buscar", params={"q": "sega"}))
+    assert "Sonic the Hedgehog" in nombres(resultado, "juegos")
+    assert "Mega Drive" in nombres(resultado, "consolas")
+    assert "Mando Sega" in nombres(resultado, "accesorios")
+    # El nombre pesa más que el resto de columnas
+    assert nombres(resultado, "accesorios")[0] == "Mando Sega"
+
+
+def test_busqueda_con_errores_tipograficos_solo_con_trigramas(cliente, main):
+    crear_juego(cliente, "Metroid Dread")
+    resultado = ok(cliente.get("/api/buscar", params={"q": "metorid"}))
+    if main.busqueda.trigramas_disponibles():
+        assert "Metroid Dread" in nombres(resultado, "juegos")
+    else:
+        # SQLite (FTS5) y PostgreSQL sin pg_trgm sólo encuentran prefijos de palabra
+        assert resultado["total"] == 0
+
+
+# --- Compatibilidad ---
+
+def test_compatibilidad_entre_juegos_consolas_y_accesorios(cliente):
+    switch, ps5 = crear_consola(cliente, "Switch"), crear_consola(cliente, "PlayStation 5", "Sony")
+    joycon = crear_accesorio(cliente, "Joy-Con", [switch])
+    zelda = crear_juego(cliente, "Zelda Breath of the Wild", [switch], [joycon])
+    multiplataforma = crear_juego(cliente, "Hades", [switch, ps5])
+
+    assert set(ids(ok(cliente.get("/api/compatibilidad/juegos", params={"consola": [switch]})))) >= {zelda, multiplataforma}
+    assert ids(ok(cliente.get("/api/compatibilidad/juegos", params={"consola": [switch, ps5]}))) == [multiplataforma]
+    assert ids(ok(cliente.get("/api/compatibilidad/juegos", params={"accesorio": [joycon]}))) == [zelda]
+    assert ids(ok(cliente.get("/api/compatibilidad/consolas", params={"juego": [multiplataforma]}))) == [ps5, switch]
+    assert ids(ok(cliente.get("/api/compatibilidad/accesorios", params={"consola": [switch]}))) == [joycon]
+    assert cliente.get("/api/compatibilidad/juegos").status_code == 400
+
+    # La matriz se actualiza con las escrituras
+    ok(cliente.delete(f"/api/juegos/{multiplataforma}"))
+    assert ids(ok(cliente.get("/api/compatibilidad/juegos", params={"consola": [switch, ps5]}))) == []
+
+
+# --- Comparaciones ---
+
+def test_comparacion_con_compatibilidad_y_borrado(cliente):
+    consola = crear_consola(cliente, "Nintendo 64")
+    accesorio = crear_accesorio(cliente, "Rumble Pak", [consola])
+    juego = crear_juego(cliente, "Star Fox 64", [consola], [accesorio])
+    datos = {"nombre": "Star Fox con Rumble", "juego_id": juego, "consola_id": consola, "accesorio_id": accesorio}
+    creada = ok(cliente.post("/api/comparaciones", data=datos), 201)
+    assert creada["compatibilidad"] == "compatible"
+
+    comparacion = next(c for c in ok(cliente.get("/api/comparaciones"))["items"] if c["id"] == creada["id"])
+    tipos = [elemento["tipo"] for elemento in comparacion["instantanea"]["elementos"]]
+    assert tipos == ["juegos", "consolas", "accesorios"]
+
+    assert cliente.post("/api/comparaciones", data={"nombre": "Sola", "juego_id": juego}).status_code == 400
+    etiqueta = f'"v{comparacion["version"]}"'
+    ok(cliente.put(f"/api/juegos/{juego}", data={"nombre": "Star Fox 64 3D", "genero": "Disparos", "desarrollador": "Nintendo"}))
+    # Al listarla se refresca la instantánea y sube su versión: borrar con la anterior responde 412
+    comparacion = next(c for c in ok(cliente.get("/api/comparaciones"))["items"] if c["id"] == creada["id"])
+    assert "Star Fox 64 3D" in [e["nombre"] for e in comparacion["instantanea"]["elementos"]]
+    assert cliente.delete(f"/api/comparaciones/{creada['id']}", headers={"If-Match": etiqueta}).status_code == 412
+    ok(cliente.delete(f"/api/comparaciones/{creada['id']}", headers={"If-Match": f'"v{comparacion["version"]}"'}))
+    assert cliente.delete(f"/api/comparaciones/{creada['id']}").status_code == 404
+
+
+def test_eliminar_accesorio_conserva_la_comparacion(cliente):
+    consola = crear_consola(cliente, "GameCube")
+    accesorio = crear_accesorio(cliente, "Bongos", [consola])
+    juego = crear_juego(cliente, "Donkey Konga", [consola], [accesorio])
+    datos = {"nombre": "Donkey Konga con bongos", "juego_id": juego, "consola_id": consola, "accesorio_id": accesorio}
+    comparacion = ok(cliente.post("/api/comparaciones", data=datos), 201)["id"]
+
+    ok(cliente.delete(f"/api/accesorios/{accesorio}"))
+
+    comparaciones = {c["id"]: c for c in ok(cliente.get("/api/comparaciones"))["items"]}
+    assert comparacion in comparaciones
+    elementos = comparaciones[comparacion]["instantanea"]["elementos"]
+    assert [e["eliminado"] for e in elementos if e["tipo"] == "accesorios"] == [True]
+
+
+# --- Historial ---
+
+def test_historial_registra_las_escrituras(cliente):
+    juego = crear_juego(cliente, "Kirby")
+    datos = {"nombre": "Kirby Forgotten Land", "genero": "Plataformas", "desarrollador": "HAL"}
+    ok(cliente.put(f"/api/juegos/{juego}", data=datos))
+    ok(cliente.delete(f"/api/juegos/{juego}"))
+
+    parametros = {"clave": CLAVE_HISTORIAL, "tipo_objeto": "juego", "objeto_id": juego}
+    eventos = ok(cliente.get("/api/historial", params=parametros))["historial"]
+    assert [e["accion"] for e in eventos] == ["Eliminación", "Actualización", "Creación"]
+    assert eventos[1]["detalles"] == "Juego actualizado: Kirby -> Kirby Forgotten Land"
+
+    assert cliente.get("/api/historial", params={"clave": "mal"}).status_code == 403
+
+
+def test_historial_paginado_por_cursor(cliente):
+    parametros = {"clave": CLAVE_HISTORIAL, "accion": "Creación", "limite": 2}
+    vistos, cursor = [], None
+    while True:
+        pagina = ok(cliente.get("/api/historial", params={**parametros, "cursor": cursor} if cursor else parametros))
+        vistos.extend(e["id"] for e in pagina["historial"])
+        cursor = pagina["siguiente"]
+        if cursor is None:
+            break
+    todos = ok(cliente.get("/api/historial", params={**parametros, "limite": 500}))["historial"]
+    assert vistos == [e["id"] for e in todos]
+    assert len(vistos) > 2
+    assert cliente.get("/api/historial", params={**parametros, "cursor": "no-es-un-cursor"}).status_code == 400
@@ -0,0 +1,56 @@
+"""Difusor de cambios por SSE: ids con el origen del worker y reconexión con Last-Event-ID."""
+import asyncio
+
+import pytest
+
+from cambios import Difusor
+
+
+def publicar(difusor: Difusor, *ids) -> list:
+    for id_ in ids:
+        difusor.publicar({"tabla": "juegos", "accion": "update", "ids": [id_]})
+    return [evento["id"] for _, evento in difusor._recientes]
+
+
+def primeros(difusor: Difusor, ultimo_id: str, cantidad: int = 2) -> list:
+    """Los primeros mensajes del flujo de un cliente que reconecta con `ultimo_id`."""
+    async def leer():
+        flujo = difusor.eventos(ultimo_id)
+        try:
+            return [await flujo.__anext__() for _ in range(cantidad)]
+        finally:
+            await flujo.aclose()
+    return asyncio.run(leer())
+
+
+def test_los_ids_llevan_el_origen_del_difusor():
+    difusor = Difusor()
+    assert publicar(difusor, 1, 2) == [f"{difusor.origen}-1", f"{difusor.origen}-2"]
+    assert Difusor().origen != difusor.origen
+
+
+def test_reconexion_al_mismo_difusor_reenvia_lo_pendiente():
+    difusor = Difusor()
+    primero, segundo, tercero = publicar(difusor, 1, 2, 3)
+    assert [e["ids"] for e in difusor._pendientes_desde(primero)] == [[2], [3]]
+    assert difusor._pendientes_desde(tercero) == []
+
+    _, mensaje = primeros(difusor, segundo)
+    assert mensaje.startswith(f"id: {tercero}\nevent: cambio\n")
+
+
+@pytest.mark.parametrize("ultimo_id", ["otro0worker0-2", "2", "basura", "-2"])
+def test_id_de_otro_worker_o_mal_formado_pide_recargar(ultimo_id):
+    difusor = Difusor()
+    publicar(difusor, 1, 2, 3)
+    # Con la misma secuencia, otro worker habría reenviado eventos que el cliente nunca recibió
+    assert difusor._pendientes_desde(ultimo_id) is None
+    _, mensaje = primeros(difusor, ultimo_id)
+    assert mensaje.startswith("event: recargar\n")
+
+
+def test_id_que_ya_salio_de_los_recientes_pide_recargar():
+    difusor = Difusor(recientes=2)
+    assert publicar(difusor, 1, 2, 3, 4) == [f"{difusor.origen}-3", f"{difusor.origen}-4"]
+    assert difusor._pendientes_desde(f"{difusor.origen}-1") is None
+    assert [e["ids"] for e in difusor._pendientes_desde(f"{difusor.origen}-2")] == [[3], [4]]
@@ -0,0 +1,71 @@
+"""Refresco de instantáneas de comparaciones con escritores concurrentes, con SQLite y PostgreSQL."""
+import threading
+
+import db
+import comparaciones
+from test_api import crear_consola, crear_juego, ok
+
+
+def _comparacion(cliente, nombre):
+    consola = crear_consola(cliente, f"Consola {nombre}")
+    juego = crear_juego(cliente, f"Juego {nombre}", [consola])
+    datos = {"nombre": nombre, "juego_id": juego, "consola_id": consola}
+    return ok(cliente.post("/api/comparaciones", data=datos), 201)["id"], juego
+
+
+def _estado(comparacion_id):
+    with db.obtener_conexion() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT obsoleta, instantanea FROM comparaciones WHERE id = %s", (comparacion_id,))
+            obsoleta, instantanea = cursor.fetchone()
+        conn.rollback()
+    return obsoleta, instantanea
+
+
+def test_no_se_pierde_la_invalidacion_de_un_escritor_concurrente(cliente, url_base, monkeypatch):
+    comparacion_id, juego = _comparacion(cliente, "carrera")
+    with db.obtener_conexion() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE comparaciones SET obsoleta = true WHERE id = %s", (comparacion_id,))
+        conn.commit()
+
+    # Mientras refrescar lee los elementos, otra conexión renombra el juego (el trigger marca la comparación)
+    escritor_terminado = threading.Event()
+
+    def escribir():
+        otra = db.conectar(url_base)
+        try:
+            with otra.cursor() as cursor:
+                cursor.execute("UPDATE juegos SET nombre = 'Renombrado' WHERE id = %s", (juego,))
+            otra.commit()
+        finally:
+            otra.close()
+        escritor_terminado.set()
+
+    cargar = comparaciones._cargar
+    escritor = threading.Thread(target=escribir)
+
+    def cargar_con_escritor(cursor, elementos):
+        resultado = cargar(cursor, elementos)
+        escritor.start()
+        # El escritor espera al bloqueo de la comparación en lugar de marcarla antes de nuestro UPDATE
+        assert not escritor_terminado.wait(0.3)
+        return resultado
+
+    monkeypatch.setattr(comparaciones, "_cargar", cargar_con_escritor)
+    with db.obtener_conexion() as conn:
+        cursor = conn.cursor()
+        try:
+            comparaciones.refrescar(cursor, [comparacion_id])
+            conn.commit()
+        finally:
+            cursor.close()
+    escritor.join(10)
+    assert escritor_terminado.is_set()
+    monkeypatch.undo()
+
+    obsoleta, _ = _estado(comparacion_id)
+    assert obsoleta  # el cambio del escritor sigue pendiente de refresco
+
+    elementos = next(c for c in ok(cliente.get("/api/comparaciones"))["items"] if c["id"] == comparacion_id)
+    assert "Renombrado" in [e["nombre"] for e in elementos["instantanea"]["elementos"]]
@@ -0,0 +1,216 @@
+"""HistorialDiferido (síncrono y con cola), particiones mensuales y archivado, con SQLite y PostgreSQL."""
+import csv
+import gzip
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+import db
+import historial
+from historial import HistorialDiferido
+
+
+@pytest.fixture
+def marca(cliente):
+    """Prefijo único para reconocer en la tabla los eventos de cada prueba."""
+    return f"prueba-{uuid.uuid4().hex[:8]}"
+
+
+def contar(marca: str) -> int:
+    with db.obtener_conexion() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM historial WHERE detalles LIKE %s", (marca + "%",))
+            total = cursor.fetchone()[0]
+        conn.rollback()
+    return total
+
+
+def test_sincrono_escribe_cada_evento_al_registrarlo(marca):
+    diferido = HistorialDiferido(db.obtener_conexion, sincrono=True)
+    diferido.iniciar()
+    diferido.registrar("Prueba", f"{marca} uno", "juego", 1)
+    diferido.registrar("Prueba", f"{marca} dos")
+    assert contar(marca) == 2
+    assert diferido.estadisticas() == {
+        "pendientes": 0, "escritos": 2, "descartados": 0, "errores": 0, "lotes": 2, "sincrono": True,
+    }
+    diferido.detener()
+
+
+def test_con_cola_no_escribe_hasta_vaciar(marca):
+    diferido = HistorialDiferido(db.obtener_conexion, tam_lote=10)
+    for i in range(3):
+        diferido.registrar("Prueba", f"{marca} {i}")
+    assert diferido.pendientes() == 3
+    assert contar(marca) == 0
+
+    diferido.vaciar()
+    assert diferido.pendientes() == 0
+    assert contar(marca) == 3
+    assert (diferido.escritos, diferido.lotes) == (3, 1)
+
+
+def test_vaciar_respeta_el_tamano_de_lote(marca):
+    diferido = HistorialDiferido(db.obtener_conexion, tam_lote=2)
+    for i in range(5):
+        diferido.registrar("Prueba", f"{marca} {i}")
+    diferido.vaciar()
+    assert contar(marca) == 5
+    assert diferido.lotes == 3
+
+
+def test_el_hilo_vuelca_por_lotes(marca):
+    diferido = HistorialDiferido(db.obtener_conexion, tam_lote=4, intervalo=0.05)
+    diferido.iniciar()
+    try:
+        for i in range(4):
+            diferido.registrar("Prueba", f"{marca} {i}")
+        limite = time.monotonic() + 5
+        while contar(marca) < 4 and time.monotonic() < limite:
+            time.sleep(0.02)
+        assert contar(marca) == 4
+    finally:
+        diferido.detener()
+
+
+def test_detener_vuelca_lo_pendiente(marca):
+    # Con un intervalo largo el hilo sigue esperando a completar el lote cuando se detiene
+    diferido = HistorialDiferido(db.obtener_conexion, tam_lote=100, intervalo=30)
+    diferido.iniciar()
+    for i in range(3):
+        diferido.registrar("Prueba", f"{marca} {i}")
+    diferido.detener()
+    assert contar(marca) == 3
+    assert diferido.pendientes() == 0
+    assert diferido.descartados == 0
+
+
+def test_detener_sin_hilo_vuelca_la_cola(marca):
+    diferido = HistorialDiferido(db.obtener_conexion)
+    diferido.registrar("Prueba", f"{marca} 0")
+    diferido.detener()
+    assert contar(marca) == 1
+
+
+def test_contrapresion_descarta_cuando_la_cola_sigue_llena(marca, caplog):
+    diferido = HistorialDiferido(db.obtener_conexion, capacidad=2, espera_encolar=0.05)
+    diferido.registrar("Prueba", f"{marca} 0")
+    diferido.registrar("Prueba", f"{marca} 1")
+
+    inicio = time.monotonic()
+    with caplog.at_level(logging.WARNING, logger="historial"):
+        diferido.registrar("Prueba", f"{marca} 2")
+    assert time.monotonic() - inicio >= 0.05
+    assert diferido.descartados == 1
+    assert "Historial lleno" in caplog.text
+
+    diferido.vaciar()
+    assert contar(marca) == 2
+
+
+def test_error_al_escribir_cuenta_el_lote_como_descartado(marca, caplog):
+    def sin_conexion():
+        raise RuntimeError("sin base de datos")
+
+    diferido = HistorialDiferido(sin_conexion)
+    diferido.registrar("Prueba", f"{marca} 0")
+    diferido.registrar("Prueba", f"{marca} 1")
+    with caplog.at_level(logging.ERROR, logger="historial"):
+        diferido.vaciar()
+    assert (diferido.descartados, diferido.errores, diferido.escritos) == (2, 1, 0)
+    assert "sin base de datos" in caplog.text
+
+
+# --- Particiones y archivado ---
+
+def _insertar(conn, detalles: str, fecha: datetime):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO historial (accion, detalles, fecha) VALUES (%s, %s, %s)", ("Prueba", detalles, fecha)
+        )
+    conn.commit()
+
+
+def _hace_meses(meses: int) -> datetime:
+    """Un instante a mitad del mes de hace `meses` meses (fuera de la retención de 12 si meses > 12)."""
+    return historial._mes(datetime.now(timezone.utc), -meses).replace(day=15)
+
+
+def _filas_archivadas(archivos: list) -> list:
+    filas = []
+    for ruta in archivos:
+        with gzip.open(ruta, "rt", encoding="utf-8", newline="") as origen:
+            filas.extend(csv.DictReader(origen))
+    return filas
+
+
+def test_particiones_del_mes_actual_y_siguientes(cliente, es_sqlite):
+    with db.obtener_conexion() as conn:
+        with conn.cursor() as cursor:
+            historial.asegurar_particiones(cursor)
+            nombres = [nombre for nombre, _, _ in historial.particiones(cursor)]
+        conn.commit()
+    if es_sqlite:
+        assert nombres == []
+        return
+    ahora = datetime.now(timezone.utc)
+    esperadas = [f"historial_{historial._mes(ahora, i):%Y_%m}" for i in range(historial.MESES_ADELANTE + 1)]
+    assert set(esperadas) <= set(nombres)
+
+
+def test_crear_particion_mueve_las_filas_de_la_defecto(cliente, es_sqlite, marca):
+    if es_sqlite:
+        pytest.skip("SQLite no particiona el historial")
+    antigua = _hace_meses(14)
+    particion = f"historial_{antigua:%Y_%m}"
+    with db.obtener_conexion() as conn:
+        _insertar(conn, marca, antigua)
+        with conn.cursor() as cursor:
+            creadas = historial.asegurar_particiones(cursor, desde=antigua)
+            cursor.execute(f"SELECT count(*) FROM {particion} WHERE detalles = %s", (marca,))
+            en_particion = cursor.fetchone()[0]
+            cursor.execute(f"SELECT count(*) FROM {historial.PARTICION_DEFECTO} WHERE detalles = %s", (marca,))
+            en_defecto = cursor.fetchone()[0]
+        conn.commit()
+    assert particion in creadas
+    assert (en_particion, en_defecto) == (1, 0)
+
+
+def test_archivar_vuelca_y_elimina_lo_anterior_a_la_retencion(cliente, marca, tmp_path):
+    antigua = _hace_meses(16)
+    reciente = datetime.now(timezone.utc)
+    with db.obtener_conexion() as conn:
+        with conn.cursor() as cursor:
+            historial.asegurar_particiones(cursor, desde=antigua)
+        conn.commit()
+        _insertar(conn, f"{marca} antigua", antigua)
+        _insertar(conn, f"{marca} reciente", reciente)
+
+        archivos = historial.archivar(conn, 12, str(tmp_path))
+        assert historial.archivar(conn, 0, str(tmp_path)) == []
+
+        with conn.cursor() as cursor:
+            restantes = [nombre for nombre, _, _ in historial.particiones(cursor)]
+        conn.rollback()
+
+    assert archivos and all(ruta.startswith(str(tmp_path)) for ruta in archivos)
+    assert f"{marca} antigua" in [fila["detalles"] for fila in _filas_archivadas(archivos)]
+    assert contar(f"{marca} antigua") == 0
+    assert contar(f"{marca} reciente") == 1
+    assert f"historial_{antigua:%Y_%m}" not in restantes
+
+
+def test_mantenimiento_ejecuta_particiones_y_archivado(cliente, marca, tmp_path):
+    with db.obtener_conexion() as conn:
+        _insertar(conn, marca, _hace_meses(18))
+    mantenimiento = historial.MantenimientoHistorial(
+        db.obtener_conexion, intervalo=0, retencion_meses=12, directorio=str(tmp_path)
+    )
+    mantenimiento.iniciar()  # con intervalo 0 no arranca el hilo
+    assert mantenimiento._hilo is None
+    mantenimiento.ejecutar()
+    assert contar(marca) == 0
+    assert marca in [fila["detalles"] for fila in _filas_archivadas(sorted(map(str, tmp_path.iterdir())))]
@@ -0,0 +1,263 @@
+"""Elección de réplica de lectura con pools falsos: cookie de lectura propia, lecturas atrasadas, chequeo y caída."""
+import logging
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+from starlette.testclient import TestClient
+
+import db
+import replicas
+from cache import Cache, MemoriaLRU
+from replicas import COOKIE, MiddlewareLecturaPropia, Replica, Replicas
+
+PRIMARIA = "primaria"
+ESTADO_SANO = (True, True, 0.0)  # en recuperación, recibiendo WAL, retraso
+
+
+class CursorFalso:
+    def __init__(self, estado):
+        self.estado = estado
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        return False
+
+    def execute(self, sql, parametros=None):
+        pass
+
+    def fetchone(self):
+        return self.estado
+
+
+class ConexionFalsa:
+    def __init__(self, pool):
+        self.pool = pool
+        self.readonly = False
+
+    def cursor(self):
+        return CursorFalso(self.pool.estado)
+
+    def rollback(self):
+        pass
+
+
+class PoolFalso:
+    """Lo que Replicas usa de db.PoolConexiones: conexion(), en_uso, cerrar() y estadisticas()."""
+
+    def __init__(self, estado=ESTADO_SANO, error=None):
+        self.estado = estado
+        self.error = error
+        self.en_uso = 0
+
+    @contextmanager
+    def conexion(self):
+        if self.error is not None:
+            raise self.error
+        self.en_uso += 1
+        try:
+            yield ConexionFalsa(self)
+        finally:
+            self.en_uso -= 1
+
+    def cerrar(self):
+        pass
+
+    def estadisticas(self) -> dict:
+        return {"en_uso": self.en_uso}
+
+
+@pytest.fixture(autouse=True)
+def primaria(monkeypatch):
+    """La primaria (db.obtener_conexion) presta siempre PRIMARIA."""
+    @contextmanager
+    def obtener_conexion():
+        yield PRIMARIA
+
+    monkeypatch.setattr(db, "obtener_conexion", obtener_conexion)
+
+
+def crear(*pools, retraso_maximo=5.0) -> Replicas:
+    conjunto = Replicas([], retraso_maximo=retraso_maximo, intervalo=0)
+    conjunto.replicas = [Replica(f"postgresql://replica{i}:5432/juegos", pool) for i, pool in enumerate(pools)]
+    conjunto.chequear()
+    return conjunto
+
+
+def leer(conjunto: Replicas):
+    with conjunto.conexion() as conn:
+        return conn if conn == PRIMARIA else conn.pool
+
+
+def test_lee_de_la_replica_sana_en_solo_lectura():
+    pool = PoolFalso()
+    conjunto = crear(pool)
+    with conjunto.conexion() as conn:
+        assert conn.pool is pool
+        assert conn.readonly
+    assert conjunto.replicas[0].lecturas == 1
+    assert conjunto.lecturas_primaria == 0
+
+
+def test_tras_escribir_se_sigue_leyendo_de_la_replica_pero_cuenta_como_atrasada():
+    pool = PoolFalso()
+    conjunto = crear(pool)
+    previas = replicas.lecturas_atrasadas()
+    conjunto.anotar_escritura()
+    assert leer(conjunto) is pool
+    assert conjunto.lecturas_primaria == 0
+    assert replicas.lecturas_atrasadas() == previas + 1
+
+    conjunto.chequear()  # sin retraso tras la escritura: ya la tiene
+    assert leer(conjunto) is pool
+    assert replicas.lecturas_atrasadas() == previas + 1
+    assert conjunto.replicas[0].lecturas_atrasadas == 1
+
+
+def test_una_replica_con_retraso_no_tiene_lo_escrito_durante_ese_retraso():
+    pool = PoolFalso((True, True, 3.0))
+    conjunto = crear(pool)
+    conjunto.ultima_escritura = conjunto.replicas[0].comprobada - 1.0
+    assert not conjunto.replicas[0].tiene(conjunto.ultima_escritura)
+    assert conjunto.replicas[0].tiene(conjunto.ultima_escritura - 2.0)
+
+
+def test_no_se_cachea_lo_leido_de_una_replica_atrasada(monkeypatch):
+    pool = PoolFalso()
+    conjunto = crear(pool)
+    monkeypatch.setattr(replicas, "_replicas", conjunto)
+    cache = Cache(MemoriaLRU())
+    cargas = []
+
+    def obtener():
+        def cargar():
+            with replicas.obtener_conexion_lectura():
+                cargas.append(1)
+            return len(cargas)
+        previas = replicas.lecturas_atrasadas()
+        return cache.obtener("juegos", "clave", cargar, guardar=lambda: replicas.lecturas_atrasadas() == previas)
+
+    replicas.anotar_escritura()
+    assert [obtener(), obtener()] == [1, 2]
+    conjunto.chequear()
+    assert [obtener(), obtener()] == [3, 3]
+
+
+def test_anotar_escritura_del_modulo_sin_replicas_no_hace_nada(monkeypatch):
+    monkeypatch.setattr(replicas, "_replicas", None)
+    replicas.anotar_escritura()
+    with replicas.obtener_conexion_lectura() as conn:
+        assert conn == PRIMARIA
+    assert replicas.estadisticas() == {}
+
+
+def test_se_reparte_entre_replicas_por_conexiones_en_uso_y_por_turnos():
+    primera, segunda = PoolFalso(), PoolFalso()
+    conjunto = crear(primera, segunda)
+    assert {leer(conjunto) for _ in range(4)} == {primera, segunda}
+
+    primera.en_uso = 3
+    assert [leer(conjunto) for _ in range(3)] == [segunda] * 3
+
+
+@pytest.mark.parametrize("estado, error", [
+    ((True, True, 30.0), "retraso de 30.0s"),
+    ((False, False, 0.0), "no es una réplica (no está en recuperación)"),
+    ((True, False, 0.0), "no recibe WAL de la primaria"),
+])
+def test_el_chequeo_aparta_replicas_atrasadas_o_que_no_replican(estado, error):
+    sana, mala = PoolFalso(), PoolFalso(estado)
+    conjunto = crear(sana, mala)
+    assert [replica.sana for replica in conjunto.replicas] == [True, False]
+    assert conjunto.replicas[1].error == error
+    assert {leer(conjunto) for _ in range(4)} == {sana}
+
+
+def test_el_chequeo_aparta_la_replica_que_no_responde_y_la_recupera():
+    pool = PoolFalso(error=psycopg2.OperationalError("conexión rechazada"))
+    conjunto = crear(pool)
+    assert not conjunto.replicas[0].sana
+    assert "conexión rechazada" in conjunto.replicas[0].error
+    assert leer(conjunto) == PRIMARIA
+
+    pool.error = None
+    conjunto.chequear()
+    assert conjunto.replicas[0].sana and conjunto.replicas[0].error is None
+    assert leer(conjunto) is pool
+
+
+@pytest.mark.parametrize("error", [psycopg2.OperationalError("se cayó"), db.PoolAgotado("sin conexiones")])
+def test_si_falla_el_prestamo_aparta_la_replica_y_lee_de_la_primaria(error, monkeypatch, caplog):
+    pool = PoolFalso()
+    conjunto = crear(pool)
+    apartadas = []
+    apartar = conjunto._apartar
+
+    def apartar_y_anotar(replica, motivo):
+        apartadas.append(motivo)
+        apartar(replica, motivo)
+
+    monkeypatch.setattr(conjunto, "_apartar", apartar_y_anotar)
+    pool.error = error
+
+    with caplog.at_level(logging.WARNING, logger="replicas"):
+        assert leer(conjunto) == PRIMARIA
+    assert apartadas == [str(error)]
+    assert not conjunto.replicas[0].sana
+    assert conjunto.lecturas_primaria == 1
+    assert "fuera de servicio" in caplog.text
+
+    # Apartada, las lecturas siguientes ni la intentan hasta el próximo chequeo
+    assert leer(conjunto) == PRIMARIA
+    assert apartadas == [str(error)]
+
+
+# --- Cookie de lectura de lo escrito ---
+
+@pytest.fixture
+def conjunto(monkeypatch):
+    conjunto = crear(PoolFalso())
+    monkeypatch.setattr(replicas, "_replicas", conjunto)
+    return conjunto
+
+
+@pytest.fixture
+def cliente(conjunto):
+    """Aplicación ASGI mínima tras MiddlewareLecturaPropia que responde de dónde leyó, con ETag."""
+    async def aplicacion(scope, receive, send):
+        with replicas.obtener_conexion_lectura() as conn:
+            origen = b"primaria" if conn == PRIMARIA else b"replica"
+        estado = 400 if scope["path"] == "/falla" else 200
+        cabeceras = [(b"etag", b'"v1"'), (b"last-modified", b"Sat, 17 Oct 2026 00:00:00 GMT")]
+        await send({"type": "http.response.start", "status": estado, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": origen})
+
+    return TestClient(MiddlewareLecturaPropia(aplicacion, ventana=6.5))
+
+
+def test_escritura_correcta_pone_la_cookie(cliente):
+    respuesta = cliente.post("/")
+    assert respuesta.headers["set-cookie"] == f"{COOKIE}=1; Max-Age=7; Path=/; HttpOnly; SameSite=Lax"
+    assert "set-cookie" not in cliente.post("/falla").headers
+    assert "set-cookie" not in cliente.get("/").headers
+
+
+def test_con_la_cookie_se_lee_de_la_primaria(cliente):
+    assert cliente.get("/").text == "replica"
+    assert cliente.get("/", headers={"cookie": f"{COOKIE}=1"}).text == "primaria"
+    # La marca es de cada petición: la siguiente sin cookie vuelve a la réplica
+    assert cliente.get("/").text == "replica"
+
+
+def test_respuesta_con_lecturas_atrasadas_sin_validadores(cliente, conjunto):
+    assert cliente.get("/").headers["etag"] == '"v1"'
+
+    conjunto.anotar_escritura()
+    respuesta = cliente.get("/")
+    assert respuesta.text == "replica"
+    assert "etag" not in respuesta.headers and "last-modified" not in respuesta.headers
+
+    conjunto.chequear()
+    assert cliente.get("/").headers["etag"] == '"v1"'
@@ -0,0 +1,67 @@
+"""Recolector de subidas frente a una nueva subida del mismo contenido, con SQLite y PostgreSQL."""
+import io
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import db
+import subidas
+
+GRACIA = 60
+
+
+@pytest.fixture
+def huerfana(cliente, tmp_path):
+    """Imagen sin referencias y fuera del margen de gracia: archivo y fila en `imagenes`."""
+    contenido = b"\x89PNG\r\n\x1a\n" + uuid.uuid4().bytes
+    url = subidas.guardar(SimpleNamespace(filename="a.png", file=io.BytesIO(contenido)), str(tmp_path))
+    ruta = os.path.join(tmp_path, os.path.basename(url))
+    antes = time.time() - 2 * GRACIA
+    os.utime(ruta, (antes, antes))
+    with db.obtener_conexion() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO imagenes (url, referencias, actualizada) VALUES (%s, 0, %s)",
+                (url, datetime.now(timezone.utc) - timedelta(seconds=2 * GRACIA))
+            )
+        conn.commit()
+    return SimpleNamespace(url=url, ruta=ruta, contenido=contenido, directorio=str(tmp_path))
+
+
+def _volver_a_subir(imagen):
+    return subidas.guardar(SimpleNamespace(filename="b.png", file=io.BytesIO(imagen.contenido)), imagen.directorio)
+
+
+def _recolectar(imagen) -> int:
+    with db.obtener_conexion() as conn:
+        return subidas.recolectar(conn, imagen.directorio, gracia=GRACIA)
+
+
+def test_recolecta_la_imagen_huerfana(huerfana):
+    assert _recolectar(huerfana) == 1
+    assert not os.path.exists(huerfana.ruta)
+    assert os.listdir(huerfana.directorio) == []
+
+
+@pytest.mark.parametrize("momento", ["antes", "despues"])
+def test_no_borra_lo_que_se_vuelve_a_subir_mientras_recolecta(huerfana, momento, monkeypatch):
+    apartar = subidas._apartar
+
+    def apartar_con_subida(directorio, nombre, gracia):
+        if momento == "antes":
+            assert _volver_a_subir(huerfana) == huerfana.url
+        lapida = apartar(directorio, nombre, gracia)
+        if momento == "despues":
+            assert _volver_a_subir(huerfana) == huerfana.url
+        return lapida
+
+    monkeypatch.setattr(subidas, "_apartar", apartar_con_subida)
+    _recolectar(huerfana)
+
+    with open(huerfana.ruta, "rb") as archivo:
+        assert archivo.read() == huerfana.contenido
+    assert not [nombre for nombre in os.listdir(huerfana.directorio) if nombre.startswith(".")]
@@ -0,0 +1,76 @@
+"""Índice de sugerencias en memoria: listas precalculadas de prefijos cortos, resultados guardados y lock."""
+import functools
+import heapq
+import random
+
+import sugerencias
+from sugerencias import IndiceSugerencias
+
+NOMBRES = ["Zelda", "Zelda II", "Super Mario", "Mario Kart", "Metroid", "Mega Man", "Kirby", "Kid Icarus",
+           "Sonic", "Star Fox", "Street Fighter", "Zero Mission", "Ma", "M", "Ze Zu"]
+GRUPOS = ["Nintendo", "Sega", "Capcom", "Namco", "Konami", None]
+
+
+def indice() -> IndiceSugerencias:
+    return IndiceSugerencias(obtener_conexion=None, intervalo=0)
+
+
+@functools.lru_cache(maxsize=None)
+def claves(texto: str) -> tuple:
+    return tuple(sugerencias._claves(texto))
+
+
+def a_mano(indice: IndiceSugerencias, prefijo: str, limite: int, tipos=None) -> list:
+    """Lo que debe responder `sugerir`: todos los elementos del prefijo, ordenados por popularidad."""
+    clave = sugerencias.normalizar(prefijo)
+    candidatos = {
+        elemento for elemento, (texto, _, _) in indice._elementos.items()
+        if any(c.startswith(clave) for c in claves(texto)) and (not tipos or elemento[0] in tipos)
+    }
+    return indice._formatear(heapq.nsmallest(limite, candidatos, key=indice._orden))
+
+
+def test_las_listas_precalculadas_coinciden_con_recorrer_el_indice(monkeypatch):
+    # Listas cortas para que se llenen, se vacíen y haya que recalcularlas
+    monkeypatch.setattr(sugerencias, "MAX_LIMITE", 3)
+    azar = random.Random(7)
+    sugeridor = indice()
+    for paso in range(600):
+        tipo = azar.choice(["juegos", "consolas", "accesorios"])
+        id_ = azar.randrange(25)
+        operacion = azar.random()
+        if operacion < 0.6:
+            sugeridor.poner(tipo, id_, azar.choice(NOMBRES), azar.choice(GRUPOS), azar.randrange(4))
+        elif operacion < 0.8:
+            sugeridor.quitar(tipo, id_)
+        else:
+            sugeridor.anotar_resultados({tipo: [{"id": id_}]})
+        if paso % 20 == 0:
+            sugeridor._resultados.clear()
+        for prefijo in ("m", "ma", "z", "ze", "s", "k", "n", "mario", "ze z"):
+            for tipos in (None, ("juegos",), ("desarrolladores",)):
+                limite = azar.randint(1, 3)
+                assert sugeridor.sugerir(prefijo, limite, tipos) == a_mano(sugeridor, prefijo, limite, tipos), paso
+
+
+def test_un_cambio_solo_olvida_los_resultados_de_sus_prefijos():
+    sugeridor = indice()
+    sugeridor.poner("juegos", 1, "Metroid Prime", "Retro Studios", 2)
+    sugeridor.poner("juegos", 2, "Kirby Air Ride", "HAL", 1)
+    sugeridor.sugerir("metro")
+    sugeridor.sugerir("kirby")
+    sugeridor.poner("juegos", 3, "Kirby Super Star", "HAL")
+    assert [consulta[0] for consulta in sugeridor._resultados] == ["metro"]
+    assert [s["texto"] for s in sugeridor.sugerir("kirby")] == ["Kirby Air Ride", "Kirby Super Star"]
+
+
+def test_rapido_no_espera_al_lock_ni_recorre_el_indice():
+    sugeridor = indice()
+    sugeridor.poner("consolas", 1, "Game Boy", "Nintendo", 5)
+    assert [s["texto"] for s in sugeridor.sugerir_rapido("g")] == ["Game Boy"]  # prefijo corto: precalculado
+    assert sugeridor.sugerir_rapido("game") is None                               # habría que recorrer
+    sugeridor.sugerir("game")
+    assert sugeridor.sugerir_rapido("game") == sugeridor.sugerir("game")
+
+    with sugeridor._lock:
+        assert sugeridor.sugerir_rapido("g") is None
@@ -0,0 +1,188 @@
+"""Peticiones condicionales (ETag / Last-Modified) a partir de versiones por tabla.
+
+Cada tabla tiene una fila en `versiones_tablas` (tabla, version, modificada)
+que incrementan unos triggers en cada sentencia que cambia filas, venga de la
+API, de una importación o de otro proceso. Cada worker guarda el mapa de
+versiones en memoria `ttl` segundos (VERSIONES_TTL) y lo descarta en cuanto
+escribe él mismo; con el mapa al día, una revalidación cuya ETag coincide se
+responde con 304 sin consultar la base de datos ni renderizar nada.
+
+- `Versiones.condicional(*tablas)`: dependencia de FastAPI para las rutas de
+  lectura. La ETag (fuerte) resume las versiones de `tablas`, la URL y la
+  huella del despliegue; responde 304 si coincide If-None-Match o, si no se
+  envía, If-Modified-Since (con resolución de segundos).
+- `MiddlewareCondicional`: pone ETag, Last-Modified y Cache-Control: no-cache
+  en las respuestas de esas rutas. TemplateResponse y StreamingResponse no
+  ven las cabeceras de un Response inyectado, por eso no lo hace la dependencia.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import MutableHeaders
+
+from estaticos import etiqueta_coincide
+
+logger = logging.getLogger(__name__)
+
+TABLAS = ("juegos", "consolas", "accesorios", "comparaciones", "compatibilidad", "accesorio_consola", "historial")
+
+
+def incrementar(cursor, *tablas: str):
+    """Incrementa la versión de `tablas` para cambios que no pasan por los triggers (p. ej. DETACH PARTITION)."""
+    cursor.execute(
+        "UPDATE versiones_tablas SET version = version + 1, modificada = CURRENT_TIMESTAMP WHERE tabla = ANY(%s)",
+        (list(tablas),)
+    )
+
+
+def huella_despliegue(directorio: str) -> str:
+    """Hash del código, las plantillas y los estáticos (sin subidas): un despliegue nuevo cambia todas las ETag."""
+    resumen = hashlib.sha1()
+    for raiz, carpetas, archivos in os.walk(directorio):
+        carpetas[:] = sorted(c for c in carpetas if not c.startswith((".", "__")) and c != "uploads")
+        for nombre in sorted(archivos):
+            if raiz == directorio and not nombre.endswith(".py"):
+                continue
+            ruta = os.path.join(raiz, nombre)
+            resumen.update(os.path.relpath(ruta, directorio).encode())
+            with open(ruta, "rb") as archivo:
+                resumen.update(archivo.read())
+    return resumen.hexdigest()[:12]
+
+
+def _utc(fecha):
+    if fecha is None or fecha.tzinfo is not None:
+        return fecha
+    return fecha.replace(tzinfo=timezone.utc)
+
+
+class Versiones:
+    """Mapa {tabla: (version, modificada)} con TTL, compartido por las peticiones del proceso.
+
+    `al_cambiar(tablas)` se llama al recargar con las tablas cuya versión
+    cambió desde la carga anterior, antes de publicar el mapa nuevo: así una
+    petición que ya ve la versión nueva no lee de una caché anterior al cambio.
+    """
+
+    def __init__(self, obtener_conexion, ttl: float = 1.0, huella: str = "", al_cambiar=None):
+        self.obtener_conexion = obtener_conexion
+        self.ttl = ttl
+        self.huella = huella
+        self.al_cambiar = al_cambiar
+        self._mapa = None
+        self._caduca = 0.0
+        self._lock = threading.Lock()
+        self.recargas = 0
+        self.errores = 0
+        self.no_modificadas = 0
+
+    def caducar(self):
+        """La siguiente petición condicional relee las versiones (tras una escritura de este proceso)."""
+        self._caduca = 0.0
+
+    def actuales(self):
+        """El mapa al día, o None si no se puede leer (las peticiones se sirven entonces sin 304)."""
+        with self._lock:
+            if self._mapa is not None and time.monotonic() < self._caduca:
+                return self._mapa
+            try:
+                with self.obtener_conexion() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        cursor.execute("SELECT tabla, version, modificada FROM versiones_tablas")
+                        nuevo = {tabla: (version, _utc(modificada)) for tabla, version, modificada in cursor.fetchall()}
+                    finally:
+                        cursor.close()
+            except Exception:
+                self.errores += 1
+                logger.exception("Error al leer las versiones de las tablas")
+                return None
+            if self._mapa is not None and self.al_cambiar is not None:
+                cambiadas = [tabla for tabla, (version, _) in nuevo.items() if self._mapa.get(tabla, (None,))[0] != version]
+                if cambiadas:
+                    self.al_cambiar(cambiadas)
+            self._mapa = nuevo
+            self._caduca = time.monotonic() + self.ttl
+            self.recargas += 1
+            return nuevo
+
+    def condicional(self, *tablas: str, al_revalidar=None):
+        """Dependencia que responde 304 si el cliente ya tiene la representación de las versiones actuales.
+
+        `al_revalidar(request)` se llama antes de responder 304 (p. ej. para
+        seguir anotando en el historial las búsquedas revalidadas).
+        """
+        def dependencia(request: Request):
+            mapa = self.actuales()
+            if mapa is None:
+                return
+            estado = [mapa.get(tabla, (0, None)) for tabla in tablas]
+            semilla = "|".join(
+                [self.huella, request.url.path, request.url.query]
+                + [f"{tabla}={version}" for tabla, (version, _) in zip(tablas, estado)]
+            )
+            etiqueta = '"' + hashlib.sha1(semilla.encode()).hexdigest()[:24] + '"'
+            fechas = [modificada for _, modificada in estado if modificada is not None]
+            modificada = max(fechas).replace(microsecond=0) if fechas else None
+
+            request.state.etag = etiqueta
+            request.state.last_modified = format_datetime(modificada, usegmt=True) if modificada else None
+            coincidente = None
+            if "if-none-match" in request.headers:
+                coincidente = etiqueta_coincide(request.headers["if-none-match"], etiqueta)
+            elif modificada is not None and "if-modified-since" in request.headers:
+                try:
+                    if modificada <= parsedate_to_datetime(request.headers["if-modified-since"]):
+                        coincidente = etiqueta
+                except (TypeError, ValueError):
+                    pass
+            if coincidente is None:
+                return
+            # El 304 lleva la etiqueta que tiene el cliente (con su sufijo de compresión, si lo tenía)
+            request.state.etag = coincidente
+            self.no_modificadas += 1
+            if al_revalidar is not None:
+                al_revalidar(request)
+            raise HTTPException(status_code=304)
+
+        return dependencia
+
+    def estadisticas(self) -> dict:
+        return {
+            "tablas": {tabla: version for tabla, (version, _) in (self._mapa or {}).items()},
+            "recargas": self.recargas,
+            "errores": self.errores,
+            "no_modificadas": self.no_modificadas,
+        }
+
+
+class MiddlewareCondicional:
+    """Middleware ASGI que añade a las respuestas 200/304 las cabeceras que calculó `condicional`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start" and mensaje["status"] in (200, 304):
+                estado = scope.get("state") or {}
+                if estado.get("etag"):
+                    cabeceras = MutableHeaders(raw=mensaje["headers"])
+                    cabeceras.setdefault("etag", estado["etag"])
+                    if estado.get("last_modified"):
+                        cabeceras.setdefault("last-modified", estado["last_modified"])
+                    # Sin Cache-Control el navegador podría reutilizarla sin revalidar (caché heurística)
+                    cabeceras.setdefault("cache-control", "no-cache")
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)